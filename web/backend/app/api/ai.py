@@ -5,8 +5,9 @@ Tremor Guard - AI API
 使用 Anthropic Claude API 提供智能分析和对话功能
 """
 
+import time
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
 from pydantic import BaseModel
@@ -14,8 +15,10 @@ from datetime import datetime, timedelta
 from typing import Optional, List
 import json
 
+from app.core.data_watermark import check_etag
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.metrics import AI_UPSTREAM_DURATION
 from app.api.auth import get_current_user_from_token
 from app.models.user import User
 from app.models.tremor_data import TremorData, TremorSession
@@ -147,6 +150,8 @@ async def call_claude_api(messages: list, system_prompt: str) -> str:
         "messages": messages
     }
 
+    start = time.perf_counter()
+    outcome = "error"
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -157,15 +162,19 @@ async def call_claude_api(messages: list, system_prompt: str) -> str:
             )
 
             if response.status_code != 200:
+                outcome = f"http_{response.status_code}"
                 raise HTTPException(
                     status_code=status.HTTP_502_BAD_GATEWAY,
                     detail=f"AI 服务响应错误: {response.status_code}"
                 )
 
             result = response.json()
-            return result["content"][0]["text"]
+            text = result["content"][0]["text"]
+            outcome = "ok"
+            return text
 
     except httpx.TimeoutException:
+        outcome = "timeout"
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail="AI 服务响应超时"
@@ -175,6 +184,8 @@ async def call_claude_api(messages: list, system_prompt: str) -> str:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"AI 服务错误: {str(e)}"
         )
+    finally:
+        AI_UPSTREAM_DURATION.labels(outcome).observe(time.perf_counter() - start)
 
 
 # ============================================================
@@ -328,6 +339,8 @@ async def ai_analyze(
 
 @router.get("/insights")
 async def get_ai_insights(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user_from_token),
     db: AsyncSession = Depends(get_db),
     days: int = 7
@@ -337,6 +350,10 @@ async def get_ai_insights(
 
     自动生成近期数据的关键洞察
     """
+    not_modified = await check_etag(request, response, current_user.id)
+    if not_modified:
+        return not_modified
+
     user_data = await get_user_data_summary(db, current_user.id, days)
 
     if not user_data["has_data"]:
@@ -5,18 +5,24 @@ Tremor Guard - Analysis API
 完整实现震颤数据的统计分析功能
 """
 
-from fastapi import APIRouter, Depends, Query
+import base64
+
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, case
 from pydantic import BaseModel
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 
-from app.core.database import get_db
-from app.api.auth import get_current_user_from_token
+import numpy as np
+
+from app.core.data_watermark import check_etag
+from app.core.database import get_reporting_db
+from app.api.auth import get_current_user_reporting
 from app.models.user import User
 from app.models.device import Device
 from app.models.tremor_data import TremorData, TremorSession
+from app.services.spectrogram import BUCKET_SECONDS, session_spectrogram, time_spectrogram
 
 router = APIRouter()
 
@@ -109,8 +115,8 @@ async def get_user_session_ids(
 
 @router.get("/daily")
 async def get_daily_stats(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     target_date: Optional[date] = None
 ):
     """
@@ -182,8 +188,10 @@ async def get_daily_stats(
 
 @router.get("/weekly")
 async def get_weekly_trend(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     week_offset: int = Query(0, ge=0, le=52)
 ):
     """
@@ -191,6 +199,10 @@ async def get_weekly_trend(
 
     week_offset: 0=本周, 1=上周...
     """
+    not_modified = await check_etag(request, response, current_user.id)
+    if not_modified:
+        return not_modified
+
     today = date.today()
     # 计算本周开始（周一）
     week_start = today - timedelta(days=today.weekday() + (week_offset * 7))
@@ -294,8 +306,8 @@ async def get_weekly_trend(
 
 @router.get("/severity-distribution")
 async def get_severity_distribution(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     days: int = Query(7, ge=1, le=90)
@@ -347,8 +359,8 @@ async def get_severity_distribution(
 
 @router.get("/hourly-distribution")
 async def get_hourly_distribution(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     days: int = Query(7, ge=1, le=90)
 ):
     """
@@ -396,8 +408,10 @@ async def get_hourly_distribution(
 
 @router.get("/summary")
 async def get_analysis_summary(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     days: int = Query(7, ge=1, le=90)
 ):
     """
@@ -405,6 +419,10 @@ async def get_analysis_summary(
 
     综合统计指标
     """
+    not_modified = await check_etag(request, response, current_user.id)
+    if not_modified:
+        return not_modified
+
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
 
@@ -522,8 +540,8 @@ async def get_analysis_summary(
 
 @router.get("/trend")
 async def get_trend(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     days: int = Query(30, ge=7, le=365)
 ):
     """
@@ -583,3 +601,71 @@ async def get_trend(
             })
 
     return trend_data
+
+
+@router.get("/spectrogram")
+async def get_spectrogram(
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
+    days: int = Query(30, ge=1, le=90),
+    bucket: str = Query("hour", pattern="^(hour|day|session)$"),
+    format: str = Query("base64", pattern="^(base64|binary)$"),
+    dtype: str = Query("f32", pattern="^(f32|f16)$"),
+    max_freq: Optional[float] = Query(None, gt=0, description="只返回此频率 (Hz) 以下的 bin"),
+    tz_offset_minutes: int = Query(0, ge=-720, le=840, description="按天聚合时的时区偏移 (东八区为 480)")
+):
+    """
+    获取频谱时频图
+
+    按小时/天/会话对存储的幅度谱求平均，返回 (行数, bin 数) 的矩阵，行主序:
+    - format=base64: JSON，power 为 base64 编码的小端 float32/float16 数组
+    - format=binary: application/octet-stream，响应体即矩阵，形状等信息在 X-Spectrogram-* 头中
+    无数据的行为 NaN。按时间聚合时第 i 行对应 start + i × bucket_seconds (UTC)。
+    """
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+
+    if bucket == "session":
+        result = await session_spectrogram(db, current_user.id, start_date, end_date)
+    else:
+        result = await time_spectrogram(
+            db, current_user.id, start_date, end_date, BUCKET_SECONDS[bucket],
+            offset_seconds=-tz_offset_minutes * 60 if bucket == "day" else 0
+        )
+
+    power = result.power
+    if max_freq is not None:
+        power = power[:, :int(max_freq / result.bin_hz) + 1]
+    matrix = power.astype("<f4" if dtype == "f32" else "<f2")
+    rows, bins = matrix.shape
+    start = result.keys[0].isoformat() if bucket != "session" and result.keys else None
+
+    if format == "binary":
+        return Response(
+            content=matrix.tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Spectrogram-Shape": f"{rows},{bins}",
+                "X-Spectrogram-Dtype": dtype,
+                "X-Spectrogram-Bin-Hz": repr(result.bin_hz),
+                "X-Spectrogram-Bucket": bucket,
+                "X-Spectrogram-Start": start or "",
+            }
+        )
+
+    mean_spectrum = result.mean_spectrum()[:bins]
+    return {
+        "bucket": bucket,
+        "bucket_seconds": BUCKET_SECONDS.get(bucket),
+        "start": start,
+        "session_ids": result.keys if bucket == "session" else None,
+        "rows": rows,
+        "bins": bins,
+        "bin_hz": result.bin_hz,
+        "dtype": dtype,
+        "windows": result.windows.tolist(),
+        "rejected_windows": result.rejected_windows,
+        "peak_frequency": result.peak_frequency(),
+        "mean_spectrum": [None if np.isnan(v) else round(float(v), 5) for v in mean_spectrum],
+        "power": base64.b64encode(matrix.tobytes()).decode("ascii"),
+    }
@@ -13,10 +13,13 @@ from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
+import uuid
 from passlib.context import CryptContext
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db, get_reporting_db
 from app.core.config import settings
+from app.core.password_pool import password_pool, PasswordPoolBusyError
+from app.core.token_revocation import revocation_list
 from app.models.user import User
 
 router = APIRouter()
@@ -84,14 +87,26 @@ class PasswordChange(BaseModel):
 # Helper Functions
 # ============================================================
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def _run_in_password_pool(func, *args):
+    """在密码哈希线程池中执行，线程池满时返回 429"""
+    try:
+        return await password_pool.run(func, *args)
+    except PasswordPoolBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="请求过于频繁，请稍后重试",
+            headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER)},
+        )
+
 
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码 (在线程池中执行，不阻塞事件循环)"""
+    return await _run_in_password_pool(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    """获取密码哈希"""
-    return pwd_context.hash(password)
+
+async def get_password_hash(password: str) -> str:
+    """获取密码哈希 (在线程池中执行，不阻塞事件循环)"""
+    return await _run_in_password_pool(pwd_context.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -101,11 +116,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> dict:
+    """解码 JWT Token (签名或过期校验失败时抛出 JWTError)"""
+    return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+
+
 async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """通过邮箱获取用户"""
     result = await db.execute(select(User).where(User.email == email))
@@ -138,23 +158,20 @@ async def authenticate_user(db: AsyncSession, email: str, password: str) -> Opti
         
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
     return user
 
 
-async def get_current_user_from_token(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """从 Token 获取当前用户"""
+async def _resolve_current_user(token: str, db: AsyncSession) -> User:
+    """解析 Token 并加载用户"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = decode_access_token(token)
         user_id_raw = payload.get("sub")
         if user_id_raw is None:
             raise credentials_exception
@@ -162,6 +179,11 @@ async def get_current_user_from_token(
     except (JWTError, ValueError):
         raise credentials_exception
 
+    # 吊销检查 (内存布隆过滤器，常见路径不访问存储)
+    jti = payload.get("jti")
+    if jti and await revocation_list.is_revoked(jti):
+        raise credentials_exception
+
     user = await get_user_by_id(db, user_id)
     if user is None:
         raise credentials_exception
@@ -173,6 +195,68 @@ async def get_current_user_from_token(
     return user
 
 
+async def is_token_active(token: str) -> bool:
+    """
+    Token 是否仍然有效 (签名、过期与吊销检查，不访问数据库)
+
+    用于 WebSocket 等长连接在连接期间定期复查
+    """
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        return False
+    jti = payload.get("jti")
+    return not (jti and await revocation_list.is_revoked(jti))
+
+
+async def get_current_user_from_token(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """从 Token 获取当前用户"""
+    return await _resolve_current_user(token, db)
+
+
+async def get_current_user_readonly(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_read_db)
+) -> User:
+    """
+    从 Token 获取当前用户 (只读会话)
+
+    用于 GET 接口，与 get_read_db 共用同一只读会话，返回的用户对象不应被修改
+    """
+    return await _resolve_current_user(token, db)
+
+
+async def get_current_user_reporting(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_reporting_db)
+) -> User:
+    """
+    从 Token 获取当前用户 (报表只读会话)
+
+    用于分析/报表接口，整个请求只占用 reporting 连接池的一个连接
+    """
+    return await _resolve_current_user(token, db)
+
+
+async def get_current_admin(
+    current_user: User = Depends(get_current_user_from_token)
+) -> User:
+    """
+    要求管理员角色
+
+    用于修改全局检测参数、重新判定历史数据等影响所有用户的操作
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
+
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -207,7 +291,7 @@ async def register(
         )
 
     # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -292,11 +376,14 @@ async def get_current_user(
 
 @router.post("/logout")
 async def logout(
+    token: str = Depends(oauth2_scheme),
     current_user: User = Depends(get_current_user_from_token)
 ):
-    """用户登出"""
-    # Token 是无状态的，客户端需要删除本地存储的 Token
-    # 如需服务端失效，可以实现 Token 黑名单 (使用 Redis)
+    """用户登出 (吊销当前 Token)"""
+    payload = decode_access_token(token)
+    jti = payload.get("jti")
+    if jti:
+        await revocation_list.revoke(jti, float(payload["exp"]))
     return {"message": "登出成功"}
 
 
@@ -329,14 +416,14 @@ async def change_password(
 ):
     """修改密码"""
     # 验证当前密码
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await verify_password(password_data.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="当前密码错误"
         )
 
     # 更新密码
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    current_user.hashed_password = await get_password_hash(password_data.new_password)
     current_user.updated_at = datetime.utcnow()
     await db.flush()
 
@@ -3,15 +3,34 @@ Tremor Guard - Config API
 震颤卫士 - 参数配置接口
 
 用于管理震颤检测参数的云端配置
-- ESP32 通过 POST /api/config/upload 上传当前配置
-- ESP32 通过 GET /api/config/current 拉取最新配置
-- 前端通过 POST /api/config/save 修改配置
+- ESP32 通过 POST /api/config/upload 上报当前配置 (只记录，不修改云端配置；
+  CONFIG_SEED_FROM_DEVICE 开启时，未保存过全局配置则用已签名设备的配置初始化)
+- ESP32 通过 GET /api/config/current 拉取最新配置 (支持 If-None-Match 与长轮询)
+- 前端通过 POST /api/config/save 修改全局配置，/groups、/devices 管理分组和单台设备的覆盖配置
+- 判定参数变化时，后台按新参数重新判定历史数据 (GET /api/config/reclassify 查看进度)；
+  分组/设备配置变化时只重新判定受影响设备的数据
+- 修改全局配置 (save/reset) 与手动重新判定会改写所有用户的历史数据，分组/设备配置决定下发给设备的检测阈值，
+  这些写接口都需要管理员 Token
 """
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import List, Optional
+import json
+
+from app.core.config import settings
+from app.core.data_watermark import etag_matches
+from app.core.device_auth import ensure_device_identity, verify_device_request
+from app.core.shared_state import shared_state
+from app.api.auth import get_current_admin
+from app.models.user import User
+from app.services.device_config import (
+    SCOPE_DEVICE, SCOPE_GLOBAL, SCOPE_GROUP, EffectiveConfig, TremorConfig, device_config_store,
+)
+from app.services.reclassification import create_job, list_jobs, schedule_reclassification, start_background
+from app.services.tremor_detection import DetectionParams
 
 router = APIRouter()
 
@@ -19,28 +38,6 @@ router = APIRouter()
 # 数据模型 (Data Models)
 # ============================================================
 
-class TremorConfig(BaseModel):
-    """震颤检测配置参数"""
-    # RMS 幅度阈值 (g)
-    rms_min: float = Field(default=2.5, ge=0.1, le=10.0, description="RMS 下限阈值 (g)")
-    rms_max: float = Field(default=5.0, ge=0.5, le=20.0, description="RMS 上限阈值 (g)")
-
-    # 功率阈值
-    power_threshold: float = Field(default=0.5, ge=0.01, le=5.0, description="功率阈值")
-
-    # 频率范围 (Hz)
-    freq_min: float = Field(default=4.0, ge=1.0, le=10.0, description="频率下限 (Hz)")
-    freq_max: float = Field(default=6.0, ge=2.0, le=15.0, description="频率上限 (Hz)")
-
-    # 严重度分级阈值 (g) - 4个值对应 1-4 级
-    severity_thresholds: List[float] = Field(
-        default=[2.5, 3.0, 3.5, 4.0],
-        min_length=4,
-        max_length=4,
-        description="严重度分级阈值 [0级, 1级, 2级, 3级]"
-    )
-
-
 class ConfigResponse(BaseModel):
     """配置响应"""
     version: int
@@ -58,6 +55,11 @@ class ConfigSaveRequest(BaseModel):
     severity_thresholds: Optional[List[float]] = None
 
 
+class ScopedConfigSaveRequest(ConfigSaveRequest):
+    """保存分组/设备配置请求"""
+    group: Optional[str] = Field(default=None, description="设备所属分组 (仅设备配置，空字符串表示移出分组)")
+
+
 class DeviceConfigUpload(BaseModel):
     """设备上传配置请求"""
     device_id: str = Field(default="esp32_001", description="设备ID")
@@ -77,18 +79,23 @@ class DeviceConfigUpload(BaseModel):
 # 默认配置
 DEFAULT_CONFIG = TremorConfig()
 
-# 云端配置 (用于下发给设备)
-cloud_config = TremorConfig()
-cloud_config_version = 1
-cloud_config_updated_at = datetime.now().isoformat()
-cloud_config_source = "default"  # 配置来源: default, device, web
+# 云端配置保存在 device_configs 表 (全局/分组/设备三级)，见 app/services/device_config.py
 
-# 设备上报的配置 (设备当前实际使用的配置)
-device_config: Optional[TremorConfig] = None
-device_config_version = 0
-device_last_seen = None
-device_ip = None
-device_id = None
+# 设备上报的配置 (设备当前实际使用的配置)，保存在共享状态中，多 worker 看到同一份
+DEVICE_REPORT_KEY = "config:device_report"
+
+
+async def _load_device_report() -> Optional[dict]:
+    report = await shared_state.get(DEVICE_REPORT_KEY)
+    return json.loads(report) if report else None
+
+
+def _config_body(config: EffectiveConfig) -> dict:
+    return ConfigResponse(
+        version=config.version,
+        updated_at=config.updated_at.isoformat(),
+        params=config.params
+    ).model_dump()
 
 
 # ============================================================
@@ -96,14 +103,17 @@ device_id = None
 # ============================================================
 
 @router.post("/upload")
-async def upload_device_config(request: Request, data: DeviceConfigUpload):
+async def upload_device_config(
+    request: Request,
+    data: DeviceConfigUpload,
+    signed_device_id: Optional[str] = Depends(verify_device_request)
+):
     """
     设备上传当前配置
 
-    ESP32 通过此接口将当前运行的配置上传到云端
+    ESP32 通过此接口将当前运行的配置上传到云端 (供前端显示同步状态)
     """
-    global device_config, device_config_version, device_last_seen, device_ip, device_id
-    global cloud_config, cloud_config_version, cloud_config_updated_at, cloud_config_source
+    ensure_device_identity(signed_device_id, data.device_id)
 
     # 更新设备配置信息
     device_config = TremorConfig(
@@ -115,42 +125,63 @@ async def upload_device_config(request: Request, data: DeviceConfigUpload):
         severity_thresholds=data.severity_thresholds
     )
     device_config_version = data.config_version
-    device_last_seen = datetime.now().isoformat()
-    device_ip = request.client.host if request.client else "unknown"
-    device_id = data.device_id
-
-    # 如果云端配置是默认的，则用设备配置初始化
-    if cloud_config_source == "default":
-        cloud_config = device_config.model_copy()
-        cloud_config_version = device_config_version + 1
-        cloud_config_updated_at = datetime.now().isoformat()
-        cloud_config_source = "device"
-
-    # 检查是否有新配置需要下发
-    need_update = cloud_config_version > device_config_version
+    await shared_state.set(DEVICE_REPORT_KEY, json.dumps({
+        "version": device_config_version,
+        "last_seen": datetime.now().isoformat(),
+        "ip": request.client.host if request.client else "unknown",
+        "device_id": data.device_id,
+        "params": device_config.model_dump()
+    }))
+
+    # 显式开启时，从未保存过全局配置 (重置后不算) 则用已签名设备的配置初始化，与 /save 一样触发重新判定
+    reclassify_job_id = None
+    if (settings.CONFIG_SEED_FROM_DEVICE and signed_device_id is not None
+            and device_config_store.get(SCOPE_GLOBAL) is None):
+        old_config = device_config_store.resolve().params
+        entry = await device_config_store.save(SCOPE_GLOBAL, params=device_config, source="device")
+        reclassify_job_id = await schedule_reclassification(old_config, entry.params, entry.version)
+
+    # 检查是否有新配置需要下发 (以云端版本为准，设备上报的版本号不参与分配)
+    cloud_version = device_config_store.resolve(data.device_id).version
+    need_update = cloud_version != device_config_version
 
     return {
         "status": "ok",
         "message": "配置已接收",
         "device_version": device_config_version,
-        "cloud_version": cloud_config_version,
+        "cloud_version": cloud_version,
         "need_update": need_update,
+        "reclassify_job_id": reclassify_job_id,
         "server_time": datetime.now().isoformat()
     }
 
 
-@router.get("/current", response_model=ConfigResponse)
-async def get_current_config():
+@router.get("/current", response_model=ConfigResponse, responses={304: {"description": "配置未变化"}})
+async def get_current_config(
+    request: Request,
+    device_id: Optional[str] = Query(None, description="设备 ID (也可通过 X-Device-Id 请求头传入)，用于匹配分组/设备配置"),
+    wait: int = Query(0, ge=0, le=settings.CONFIG_LONG_POLL_MAX_SECONDS,
+                      description="长轮询秒数: 配合 If-None-Match，配置未变化时最多等待该时间")
+):
     """
     获取当前云端配置
 
     ESP32 设备通过此接口拉取最新的震颤检测参数
+    - 响应带 ETag (即版本号)，请求携带 If-None-Match 且配置未变化时返回 304 (无响应体)
+    - wait > 0 时，配置未变化的请求挂起，直到保存了新版本 (立即返回 200) 或超时 (304)
+    - 只读内存缓存，不占用数据库连接
     """
-    return ConfigResponse(
-        version=cloud_config_version,
-        updated_at=cloud_config_updated_at,
-        params=cloud_config
-    )
+    device_id = device_id or request.headers.get("X-Device-Id")
+    config = device_config_store.resolve(device_id)
+    if_none_match = request.headers.get("If-None-Match")
+
+    if etag_matches(if_none_match, config.etag):
+        if wait:
+            config = await device_config_store.wait_for_change(device_id, config.version, wait)
+        if etag_matches(if_none_match, config.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": config.etag})
+
+    return JSONResponse(_config_body(config), headers={"ETag": config.etag, "Cache-Control": "no-cache"})
 
 
 # ============================================================
@@ -164,74 +195,233 @@ async def get_config_status():
 
     前端用于显示设备和云端配置状态
     """
+    cloud = device_config_store.resolve()
+    report = await _load_device_report()
     return {
         "cloud": {
-            "version": cloud_config_version,
-            "updated_at": cloud_config_updated_at,
-            "source": cloud_config_source,
-            "params": cloud_config.model_dump()
+            "version": cloud.version,
+            "updated_at": cloud.updated_at.isoformat(),
+            "source": cloud.source,
+            "params": cloud.params.model_dump(),
+            "groups": sum(e.params is not None for e in device_config_store.entries(SCOPE_GROUP).values()),
+            "device_overrides": sum(e.params is not None for e in device_config_store.entries(SCOPE_DEVICE).values())
         },
         "device": {
-            "connected": device_last_seen is not None,
-            "version": device_config_version,
-            "last_seen": device_last_seen,
-            "ip": device_ip,
-            "device_id": device_id,
-            "params": device_config.model_dump() if device_config else None,
-            "synced": device_config_version >= cloud_config_version if device_config else False
+            "connected": report is not None,
+            "version": report["version"] if report else 0,
+            "last_seen": report["last_seen"] if report else None,
+            "ip": report["ip"] if report else None,
+            "device_id": report["device_id"] if report else None,
+            "params": report["params"] if report else None,
+            "synced": (
+                report["version"] >= device_config_store.resolve(report["device_id"]).version if report else False
+            )
         }
     }
 
 
 @router.post("/save")
-async def save_config(request: ConfigSaveRequest):
+async def save_config(request: ConfigSaveRequest, admin: User = Depends(get_current_admin)):
     """
     保存配置参数 (前端调用)
 
     前端调用此接口保存修改后的参数
     只更新提供的字段，未提供的保持原值
     """
-    global cloud_config, cloud_config_version, cloud_config_updated_at, cloud_config_source
-
     # 更新配置 (只更新提供的字段)
     update_data = request.model_dump(exclude_none=True)
+    cloud = device_config_store.resolve()
 
+    reclassify_job_id = None
     if update_data:
         # 创建新配置
-        current_data = cloud_config.model_dump()
+        current_data = cloud.params.model_dump()
         current_data.update(update_data)
-        cloud_config = TremorConfig(**current_data)
+        entry = await device_config_store.save(SCOPE_GLOBAL, params=TremorConfig(**current_data))
 
-        # 更新版本和时间
-        cloud_config_version += 1
-        cloud_config_updated_at = datetime.now().isoformat()
-        cloud_config_source = "web"
+        # 判定参数变化时重新判定历史数据
+        reclassify_job_id = await schedule_reclassification(cloud.params, entry.params, entry.version)
+        cloud = device_config_store.resolve()
 
     return {
         "status": "ok",
         "message": "配置已保存，设备需执行 update 命令同步",
-        "version": cloud_config_version,
-        "updated_at": cloud_config_updated_at
+        "version": cloud.version,
+        "updated_at": cloud.updated_at.isoformat(),
+        "reclassify_job_id": reclassify_job_id
     }
 
 
 @router.post("/reset")
-async def reset_config():
+async def reset_config(admin: User = Depends(get_current_admin)):
     """
     重置为默认配置
     """
-    global cloud_config, cloud_config_version, cloud_config_updated_at, cloud_config_source
+    old_config = device_config_store.resolve().params
+    entry = await device_config_store.save(SCOPE_GLOBAL, params=TremorConfig(), source="default")
 
-    cloud_config = TremorConfig()
-    cloud_config_version += 1
-    cloud_config_updated_at = datetime.now().isoformat()
-    cloud_config_source = "default"
+    reclassify_job_id = await schedule_reclassification(old_config, entry.params, entry.version)
 
     return {
         "status": "ok",
         "message": "配置已重置为默认值",
-        "version": cloud_config_version,
-        "updated_at": cloud_config_updated_at
+        "version": entry.version,
+        "updated_at": entry.updated_at.isoformat(),
+        "reclassify_job_id": reclassify_job_id
+    }
+
+
+@router.get("/reclassify")
+async def get_reclassify_jobs(limit: int = 10):
+    """
+    历史数据重新判定任务列表
+
+    包含进度百分比、处理速度和预计剩余时间
+    """
+    return {"jobs": await list_jobs(limit)}
+
+
+@router.post("/reclassify")
+async def start_reclassify(admin: User = Depends(get_current_admin)):
+    """
+    手动重新判定全部历史数据 (每台设备按其当前生效配置)
+
+    未完成的旧任务会被取代
+    """
+    cloud = device_config_store.resolve()
+    job_id = await create_job(DetectionParams.from_config(cloud.params), cloud.version)
+    start_background(job_id)
+    return {
+        "status": "ok",
+        "message": "重新判定任务已启动",
+        "job_id": job_id,
+        "version": cloud.version
+    }
+
+
+# ============================================================
+# 分组/设备配置 (Scoped Config)
+# ============================================================
+
+def _group_params(group: str) -> TremorConfig:
+    """分组内 (无设备覆盖的) 设备的生效参数"""
+    entry = device_config_store.get(SCOPE_GROUP, group)
+    return entry.params if entry and entry.params else device_config_store.resolve().params
+
+
+def _scoped_body(scope: str, key: str) -> dict:
+    entry = device_config_store.get(scope, key)
+    return {
+        "scope": scope,
+        "key": key,
+        "version": entry.version if entry else None,
+        "updated_at": entry.updated_at.isoformat() if entry else None,
+        "group": entry.group_name if entry else None,
+        "params": entry.params.model_dump() if entry and entry.params else None
+    }
+
+
+@router.get("/groups")
+async def list_group_configs():
+    """分组配置列表"""
+    groups = device_config_store.entries(SCOPE_GROUP)
+    return {"groups": [_scoped_body(SCOPE_GROUP, name) for name in sorted(groups)]}
+
+
+@router.put("/groups/{group}")
+async def save_group_config(group: str, request: ConfigSaveRequest, admin: User = Depends(get_current_admin)):
+    """
+    保存分组配置
+
+    只更新提供的字段，未提供的字段取分组当前配置 (无分组配置时取全局配置)
+    判定参数变化时重新判定分组内设备的历史数据
+    """
+    base = _group_params(group)
+    current_data = base.model_dump()
+    current_data.update(request.model_dump(exclude_none=True))
+    entry = await device_config_store.save(SCOPE_GROUP, group, params=TremorConfig(**current_data))
+    reclassify_job_id = await schedule_reclassification(base, entry.params, entry.version, SCOPE_GROUP, group)
+    return {
+        "status": "ok", "message": "分组配置已保存", **_scoped_body(SCOPE_GROUP, group),
+        "reclassify_job_id": reclassify_job_id
+    }
+
+
+@router.delete("/groups/{group}")
+async def delete_group_config(group: str, admin: User = Depends(get_current_admin)):
+    """删除分组配置 (分组内设备改用全局配置，分组成员关系保留)"""
+    entry = device_config_store.get(SCOPE_GROUP, group)
+    if entry is None or entry.params is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="分组配置不存在")
+    saved = await device_config_store.save(SCOPE_GROUP, group, params=None)
+    reclassify_job_id = await schedule_reclassification(
+        entry.params, _group_params(group), saved.version, SCOPE_GROUP, group
+    )
+    return {
+        "status": "ok", "message": "分组配置已删除", **_scoped_body(SCOPE_GROUP, group),
+        "reclassify_job_id": reclassify_job_id
+    }
+
+
+async def _reclassify_device(device_id: str, old_config: EffectiveConfig) -> Optional[int]:
+    """设备生效配置变化后重新判定该设备的历史数据"""
+    config = device_config_store.resolve(device_id)
+    return await schedule_reclassification(old_config.params, config.params, config.version, SCOPE_DEVICE, device_id)
+
+
+@router.get("/devices/{device_id}")
+async def get_device_config(device_id: str):
+    """设备的生效配置及设备级覆盖"""
+    config = device_config_store.resolve(device_id)
+    return {
+        "effective": {**_config_body(config), "scope": config.scope, "group": config.group_name},
+        "override": _scoped_body(SCOPE_DEVICE, device_id)
+    }
+
+
+@router.put("/devices/{device_id}")
+async def save_device_config(device_id: str, request: ScopedConfigSaveRequest,
+                             admin: User = Depends(get_current_admin)):
+    """
+    保存设备配置或所属分组
+
+    - 提供参数字段时保存设备级覆盖 (未提供的字段取设备当前生效配置)
+    - group 调整设备所属分组 ("" 表示移出分组)
+    - 生效的判定参数变化时重新判定该设备的历史数据
+    """
+    update_data = request.model_dump(exclude_none=True, exclude={"group"})
+    if not update_data and request.group is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未提供任何配置")
+
+    entry = device_config_store.get(SCOPE_DEVICE, device_id)
+    params = entry.params if entry else None
+    old_config = device_config_store.resolve(device_id)
+    if update_data:
+        current_data = old_config.params.model_dump()
+        current_data.update(update_data)
+        params = TremorConfig(**current_data)
+
+    if request.group is not None:
+        await device_config_store.save(SCOPE_DEVICE, device_id, params=params, group_name=request.group)
+    else:
+        await device_config_store.save(SCOPE_DEVICE, device_id, params=params)
+    return {
+        "status": "ok", "message": "设备配置已保存", **(await get_device_config(device_id)),
+        "reclassify_job_id": await _reclassify_device(device_id, old_config)
+    }
+
+
+@router.delete("/devices/{device_id}")
+async def delete_device_config(device_id: str, admin: User = Depends(get_current_admin)):
+    """删除设备级覆盖 (改用分组/全局配置，所属分组保留)"""
+    entry = device_config_store.get(SCOPE_DEVICE, device_id)
+    if entry is None or entry.params is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="设备配置不存在")
+    old_config = device_config_store.resolve(device_id)
+    await device_config_store.save(SCOPE_DEVICE, device_id, params=None)
+    return {
+        "status": "ok", "message": "设备配置已删除", **(await get_device_config(device_id)),
+        "reclassify_job_id": await _reclassify_device(device_id, old_config)
     }
 
 
@@ -5,21 +5,57 @@ Tremor Guard - Data API
 完整实现震颤数据的上传、存储和查询
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import time
+
+from fastapi import (
+    APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, tuple_
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
-from app.core.database import get_db
-from app.api.auth import oauth2_scheme, get_current_user_from_token
+from app.core.config import settings
+from app.core.database import ReadOnlySessionLocal, get_db, get_read_db, get_ingest_db, get_reporting_db
+from app.core.live_stream import device_topic, live_broker, user_topic
+from app.core.device_auth import device_keys, verify_device_request, ensure_device_identity
+from app.core.data_watermark import data_watermark
+from app.core.device_presence import device_presence
+from app.core.fast_json import rows_response
+from app.core.metrics import INGEST_ROWS, INGEST_BATCH_SIZE
+from app.core.raw_storage import HEADER_DTYPE, WIRE_RECORD_DTYPE, RawFormatError, parse_upload, raw_store
+from app.api.auth import (
+    oauth2_scheme, get_current_user_from_token, get_current_user_readonly, get_current_user_reporting, is_token_active
+)
 from app.models.user import User
 from app.models.device import Device
 from app.models.tremor_data import TremorData, TremorSession
+from app.services.spectrogram import note_ingest
+from app.services.spectrum_storage import spectrum_model
+from app.services.timeseries import METRICS, load_series
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+# 上传行数计数器 (预绑定标签)
+_ingest_rows_single = INGEST_ROWS.labels("upload")
+_ingest_rows_batch = INGEST_ROWS.labels("upload_batch")
+_ingest_raw_windows = INGEST_ROWS.labels("raw")
+
+# 游标分页: 下一页游标通过响应头返回 (响应体保持列表格式)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# 原始窗口时间戳有效范围: 2020-01-01 之后，且不超前服务器 1 天
+_RAW_MIN_TIMESTAMP_MS = 1_577_836_800_000
+_RAW_MAX_AHEAD_MS = 86_400_000
+
 
 # ============================================================
 # Pydantic Schemas
@@ -131,12 +167,11 @@ async def get_or_create_device(db: AsyncSession, device_id: str, user_id: Option
         db.add(device)
         await db.flush()
         await db.refresh(device)
-    else:
-        # 更新设备状态
-        device.is_online = True
-        device.last_seen = datetime.utcnow()
-        if user_id and not device.owner_id:
-            device.owner_id = user_id
+    elif user_id and not device.owner_id:
+        device.owner_id = user_id
+
+    # 在线状态只记录在内存，定时批量写回
+    device_presence.touch(device_id)
 
     return device
 
@@ -156,8 +191,11 @@ async def get_or_create_active_session(
                 TremorSession.is_active == True
             )
         )
+        # 并发上传可能各自创建了活跃会话，取最新的一个
+        .order_by(TremorSession.start_time.desc())
+        .limit(1)
     )
-    session = result.scalar_one_or_none()
+    session = result.scalars().first()
 
     if not session:
         # 创建新会话
@@ -200,6 +238,101 @@ async def update_session_stats(db: AsyncSession, session: TremorSession):
     session.avg_severity = float(stats.avg_sev) if stats.avg_sev else None
 
 
+def _attach_spectrum(tremor_data: TremorData, spectrum_data: Optional[dict]):
+    """频谱以二进制写入 tremor_spectra；无法识别的格式按原样保留在 JSON 列"""
+    if spectrum_data is None:
+        return
+    spectrum = spectrum_model(spectrum_data)
+    if spectrum is not None:
+        tremor_data.spectrum = spectrum
+    else:
+        tremor_data.spectrum_data = spectrum_data
+
+
+_LIVE_FIELDS = (
+    "detected", "valid", "out_of_range", "frequency", "peak_power", "band_power",
+    "amplitude", "rms_amplitude", "severity", "severity_label",
+)
+
+
+def _live_event(device: Device, tremor_data: TremorData) -> tuple:
+    """实时推送事件 ((主题...), 内容)"""
+    event = {
+        "type": "tremor",
+        "device_id": device.device_id,
+        "user_id": device.owner_id,
+        "session_id": tremor_data.session_id,
+        "data_id": tremor_data.id,
+        "timestamp": tremor_data.timestamp.isoformat(),
+    }
+    for field in _LIVE_FIELDS:
+        event[field] = getattr(tremor_data, field)
+    return (user_topic(device.owner_id), device_topic(device.device_id)), event
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """带时区的时间 (例如前端 toISOString() 的 ...Z) 转为数据库使用的无时区 UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """(时间, id) → 不透明游标"""
+    raw = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    """游标 → (时间, id)，格式错误返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def _set_next_cursor(response: Response, rows: list, limit: int, time_field: str):
+    """本页已满时返回下一页游标 (最后一行的 (时间, id))，不满表示已到末尾"""
+    if len(rows) == limit and getattr(rows[-1], time_field) is not None:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(getattr(last, time_field), last.id)
+
+
+# 列表接口快速路径: 只选择响应字段对应的列 (见 app.core.fast_json)
+_DATA_FIELDS = tuple(TremorDataResponse.model_fields)
+_DATA_COLUMNS = [getattr(TremorData, field) for field in _DATA_FIELDS]
+_SESSION_FIELDS = tuple(SessionResponse.model_fields)
+_SESSION_COLUMNS = [getattr(TremorSession, field) for field in _SESSION_FIELDS]
+
+
+def _list_select(fast: bool, model, columns):
+    return select(*columns) if fast else select(model)
+
+
+def _list_response(fast: bool, result, schema, fields, response: Response,
+                   limit: Optional[int] = None, time_field: Optional[str] = None):
+    """
+    列表查询结果 → 响应
+
+    快速路径直接返回 JSON 响应 (跳过 response_model 校验)，默认路径返回模型列表；
+    传入 time_field 时设置下一页游标
+    """
+    if fast:
+        rows = result.all()
+        content = response = rows_response(fields, rows)
+    else:
+        rows = result.scalars().all()
+        content = [schema.model_validate(row) for row in rows]
+    if time_field:
+        _set_next_cursor(response, rows, limit, time_field)
+    return content
+
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -207,6 +340,7 @@ async def update_session_stats(db: AsyncSession, session: TremorSession):
 @router.post("/session/start", response_model=SessionResponse, status_code=status.HTTP_201_CREATED)
 async def start_session(
     session_data: SessionCreate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user_from_token),
     db: AsyncSession = Depends(get_db)
 ):
@@ -250,6 +384,7 @@ async def start_session(
     db.add(new_session)
     await db.flush()
     await db.refresh(new_session)
+    background_tasks.add_task(data_watermark.bump, current_user.id)
 
     return SessionResponse.model_validate(new_session)
 
@@ -257,6 +392,7 @@ async def start_session(
 @router.post("/session/{session_id}/end", response_model=SessionResponse)
 async def end_session(
     session_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user_from_token),
     db: AsyncSession = Depends(get_db)
 ):
@@ -312,6 +448,7 @@ async def end_session(
 
     await db.flush()
     await db.refresh(session)
+    background_tasks.add_task(data_watermark.bump, current_user.id)
 
     return SessionResponse.model_validate(session)
 
@@ -319,14 +456,18 @@ async def end_session(
 @router.post("/upload", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
 async def upload_tremor_data(
     data: TremorDataUpload,
-    db: AsyncSession = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_ingest_db),
+    signed_device_id: Optional[str] = Depends(verify_device_request)
 ):
     """
     上传单条震颤数据
 
     设备每次分析后调用此接口上传数据
-    无需认证，设备通过 device_id 识别
+    设备通过 HMAC 请求签名认证 (见 app/core/device_auth.py)
     """
+    ensure_device_identity(signed_device_id, data.device_id)
+
     # 获取或创建设备
     device = await get_or_create_device(db, data.device_id)
 
@@ -349,9 +490,9 @@ async def upload_tremor_data(
             amplitude=data.amplitude,
             rms_amplitude=data.rms_amplitude,
             severity=data.severity,
-            severity_label=data.severity_label,
-            spectrum_data=data.spectrum_data
+            severity_label=data.severity_label
         )
+        _attach_spectrum(tremor_data, data.spectrum_data)
         db.add(tremor_data)
 
         # 更新会话统计
@@ -362,6 +503,13 @@ async def upload_tremor_data(
             session.max_severity = data.severity
 
         await db.flush()
+        _ingest_rows_single.inc()
+
+        # 提交后推送给实时订阅者，并更新用户数据水位
+        background_tasks.add_task(live_broker.publish, [_live_event(device, tremor_data)])
+        background_tasks.add_task(data_watermark.bump, device.owner_id)
+        if data.spectrum_data is not None:
+            background_tasks.add_task(note_ingest, device.owner_id, tremor_data.timestamp, session.is_active)
 
         return UploadResponse(
             status="ok",
@@ -381,13 +529,17 @@ async def upload_tremor_data(
 @router.post("/upload/batch", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
 async def upload_batch_data(
     batch: BatchUpload,
-    db: AsyncSession = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_ingest_db),
+    signed_device_id: Optional[str] = Depends(verify_device_request)
 ):
     """
     批量上传震颤数据
 
     设备离线时本地缓存数据，联网后批量上传
     """
+    ensure_device_identity(signed_device_id, batch.device_id)
+
     if not batch.data:
         return UploadResponse(status="ok", message="无数据", session_id=None)
 
@@ -415,6 +567,7 @@ async def upload_batch_data(
     # 批量插入数据
     tremor_count = 0
     max_severity = session.max_severity
+    records = []
 
     for item in batch.data:
         tremor_data = TremorData(
@@ -429,10 +582,11 @@ async def upload_batch_data(
             amplitude=item.amplitude,
             rms_amplitude=item.rms_amplitude,
             severity=item.severity,
-            severity_label=item.severity_label,
-            spectrum_data=item.spectrum_data
+            severity_label=item.severity_label
         )
+        _attach_spectrum(tremor_data, item.spectrum_data)
         db.add(tremor_data)
+        records.append(tremor_data)
 
         if item.detected:
             tremor_count += 1
@@ -445,6 +599,16 @@ async def upload_batch_data(
     session.max_severity = max_severity
 
     await db.flush()
+    _ingest_rows_batch.inc(len(batch.data))
+    INGEST_BATCH_SIZE.observe(len(batch.data))
+    background_tasks.add_task(live_broker.publish, [_live_event(device, r) for r in records])
+    background_tasks.add_task(data_watermark.bump, device.owner_id)
+    # 离线补传的频谱可能落入已缓存的频谱图桶
+    spectrum_times = [
+        _naive_utc(r.timestamp) for r, item in zip(records, batch.data) if item.spectrum_data is not None
+    ]
+    if spectrum_times:
+        background_tasks.add_task(note_ingest, device.owner_id, min(spectrum_times), session.is_active)
 
     return UploadResponse(
         status="ok",
@@ -453,11 +617,92 @@ async def upload_batch_data(
     )
 
 
+async def _raw_upload_body(request: Request) -> bytes:
+    """
+    读取原始窗口请求体 (依赖注入，需在签名校验之前声明)
+
+    逐块读取并在超过上限时立即返回 413，分块传输 (无 Content-Length) 同样受限；
+    读取结果缓存在 request 上，签名校验的 request.body() 直接复用
+    """
+    max_windows = settings.RAW_MAX_WINDOWS_PER_UPLOAD
+    max_bytes = HEADER_DTYPE.itemsize + max_windows * WIRE_RECORD_DTYPE.itemsize
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"单次最多上传 {max_windows} 个窗口"
+    )
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    request._body = b"".join(chunks)
+    return request._body
+
+
+@router.post("/raw", status_code=status.HTTP_201_CREATED)
+async def upload_raw_windows(
+    request: Request,
+    device_id: Optional[str] = Query(None, description="设备 ID (未签名时使用)"),
+    body: bytes = Depends(_raw_upload_body),
+    signed_device_id: Optional[str] = Depends(verify_device_request),
+    db: AsyncSession = Depends(get_ingest_db)
+):
+    """
+    上传原始加速度窗口 (二进制，格式见 app/core/raw_storage.py)
+
+    数据按设备、按天追加到分块文件，不写数据库，供服务端重新分析
+    签名请求的设备 ID 取自 X-Device-Id；只接受已注册或已配置密钥的设备
+    """
+    device_id = device_id or request.headers.get("X-Device-Id")
+    if not device_id or not raw_store.valid_device_id(device_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="缺少或无效的设备 ID"
+        )
+    ensure_device_identity(signed_device_id, device_id)
+
+    if device_id not in device_keys and await db.scalar(
+        select(Device.id).where(Device.device_id == device_id)
+    ) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备未注册"
+        )
+
+    try:
+        records = parse_upload(body, settings.RAW_MAX_WINDOWS_PER_UPLOAD)
+    except RawFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"原始数据格式错误: {e}"
+        )
+
+    # 设备时钟未同步 (0 或明显错误) 的窗口使用服务器接收时间
+    now_ms = int(time.time() * 1000)
+    timestamps = records["timestamp_ms"].copy()
+    invalid = (timestamps < _RAW_MIN_TIMESTAMP_MS) | (timestamps > now_ms + _RAW_MAX_AHEAD_MS)
+    timestamps[invalid] = now_ms
+
+    loop = asyncio.get_running_loop()
+    count = await loop.run_in_executor(None, raw_store.append, device_id, timestamps, records["samples"])
+    _ingest_raw_windows.inc(count)
+
+    return {
+        "status": "ok",
+        "message": f"成功保存 {count} 个窗口",
+        "device_id": device_id,
+        "windows": count
+    }
+
+
 @router.get("/session/{session_id}", response_model=SessionResponse)
 async def get_session(
     session_id: int,
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取会话详情"""
     result = await db.execute(
@@ -482,12 +727,19 @@ async def get_session(
 @router.get("/session/{session_id}/data", response_model=List[TremorDataResponse])
 async def get_session_data(
     session_id: int,
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db),
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值，传入时忽略 offset")
 ):
-    """获取会话中的震颤数据"""
+    """
+    获取会话中的震颤数据 (按时间倒序)
+
+    深分页请使用游标: 响应头 X-Next-Cursor 为下一页游标，没有该响应头表示已到末尾。
+    游标按 (timestamp, id) 定位，耗时与页码无关，翻页期间新写入的数据不会造成重复或遗漏。
+    """
     # 验证会话所有权
     session_result = await db.execute(
         select(TremorSession).where(
@@ -505,35 +757,39 @@ async def get_session_data(
             detail="会话不存在"
         )
 
-    # 查询数据
+    # 查询数据 (游标或偏移量分页)
+    fast = settings.FAST_LIST_RESPONSES
+    query = _list_select(fast, TremorData, _DATA_COLUMNS).where(TremorData.session_id == session_id)
+    if cursor:
+        query = query.where(tuple_(TremorData.timestamp, TremorData.id) < _decode_cursor(cursor))
+    else:
+        query = query.offset(offset)
     result = await db.execute(
-        select(TremorData)
-        .where(TremorData.session_id == session_id)
-        .order_by(TremorData.timestamp.desc())
-        .offset(offset)
-        .limit(limit)
+        query.order_by(TremorData.timestamp.desc(), TremorData.id.desc()).limit(limit)
     )
-    data_list = result.scalars().all()
 
-    return [TremorDataResponse.model_validate(d) for d in data_list]
+    return _list_response(fast, result, TremorDataResponse, _DATA_FIELDS, response, limit, "timestamp")
 
 
 @router.get("/history", response_model=List[SessionResponse])
 async def get_history(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值，传入时忽略 offset")
 ):
     """
     获取历史检测会话
 
-    支持按时间范围和设备筛选
+    支持按时间范围和设备筛选；游标分页同 /session/{id}/data，按 (start_time, id) 定位
     """
-    query = select(TremorSession).where(TremorSession.user_id == current_user.id)
+    fast = settings.FAST_LIST_RESPONSES
+    query = _list_select(fast, TremorSession, _SESSION_COLUMNS).where(TremorSession.user_id == current_user.id)
 
     # 时间筛选
     if start_date:
@@ -551,18 +807,22 @@ async def get_history(
             query = query.where(TremorSession.device_id == device.id)
 
     # 排序和分页
-    query = query.order_by(TremorSession.start_time.desc()).offset(offset).limit(limit)
+    if cursor:
+        query = query.where(tuple_(TremorSession.start_time, TremorSession.id) < _decode_cursor(cursor))
+    else:
+        query = query.offset(offset)
+    query = query.order_by(TremorSession.start_time.desc(), TremorSession.id.desc()).limit(limit)
 
     result = await db.execute(query)
-    sessions = result.scalars().all()
 
-    return [SessionResponse.model_validate(s) for s in sessions]
+    return _list_response(fast, result, SessionResponse, _SESSION_FIELDS, response, limit, "start_time")
 
 
 @router.get("/recent", response_model=List[TremorDataResponse])
 async def get_recent_data(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db),
     limit: int = Query(50, ge=1, le=200)
 ):
     """
@@ -574,27 +834,175 @@ async def get_recent_data(
     sessions_result = await db.execute(
         select(TremorSession.id).where(TremorSession.user_id == current_user.id)
     )
-    session_ids = [s.id for s in sessions_result.scalars().all()]
+    session_ids = list(sessions_result.scalars().all())
 
     if not session_ids:
         return []
 
     # 查询最近数据
+    fast = settings.FAST_LIST_RESPONSES
     result = await db.execute(
-        select(TremorData)
+        _list_select(fast, TremorData, _DATA_COLUMNS)
         .where(TremorData.session_id.in_(session_ids))
         .order_by(TremorData.timestamp.desc())
         .limit(limit)
     )
-    data_list = result.scalars().all()
 
-    return [TremorDataResponse.model_validate(d) for d in data_list]
+    return _list_response(fast, result, TremorDataResponse, _DATA_FIELDS, response)
+
+
+@router.get("/series")
+async def get_series(
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
+    metric: str = Query("rms_amplitude", pattern=f"^({'|'.join(METRICS)})$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    points: int = Query(1000, ge=10, description="目标点数，上限 SERIES_MAX_POINTS"),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$"),
+    session_id: Optional[int] = None,
+    device_id: Optional[str] = None
+):
+    """
+    获取降采样后的指标时间序列 (用于图表)
+
+    默认最近 7 天，返回点数不超过 points，与时间范围长短无关:
+    - method=lttb: 保留曲线形状 (数据量过大时自动改为 minmax)
+    - method=minmax: 每个时间桶保留最小值和最大值，不会漏掉尖峰
+    t 为 Unix 毫秒时间戳 (UTC)，v 为对应的指标值，两个数组等长。
+    start_date/end_date 可带时区，不带时区按 UTC 处理。
+    """
+    end_date = _naive_utc(end_date) or datetime.utcnow()
+    start_date = _naive_utc(start_date) or end_date - timedelta(days=7)
+    if start_date >= end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="开始时间必须早于结束时间"
+        )
+    points = min(points, settings.SERIES_MAX_POINTS)
+
+    device_pk = None
+    if device_id:
+        device_pk = await db.scalar(select(Device.id).where(Device.device_id == device_id))
+        if device_pk is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="设备不存在"
+            )
+
+    series = await load_series(
+        db, current_user.id, metric, start_date, end_date, points,
+        method=method, session_id=session_id, device_pk=device_pk
+    )
+
+    return {
+        "metric": metric,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "method": series.method,
+        "raw_points": series.raw_points,
+        "points": len(series.t),
+        "t": (series.t * 1000).round().astype("int64").tolist(),
+        "v": [round(float(x), 4) for x in series.v],
+    }
+
+
+async def _authorize_live_topic(token: str, user_id: Optional[int], device_id: Optional[str]) -> str:
+    """
+    校验订阅权限，返回主题
+
+    患者只能订阅自己及自己设备的数据，医生/管理员可订阅任意患者或设备
+    """
+    async with ReadOnlySessionLocal() as db:
+        current_user = await get_current_user_readonly(token, db)
+        privileged = current_user.role in ("doctor", "admin")
+
+        if device_id:
+            result = await db.execute(select(Device).where(Device.device_id == device_id))
+            device = result.scalar_one_or_none()
+            if device is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="设备不存在")
+            if device.owner_id != current_user.id and not privileged:
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权订阅该设备")
+            return device_topic(device_id)
+
+        target = user_id or current_user.id
+        if target != current_user.id and not privileged:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权订阅该用户")
+        return user_topic(target)
+
+
+async def _wait_disconnect(websocket: WebSocket, subscription):
+    """读取客户端消息直到断开 (客户端无需发送消息)，断开后关闭订阅"""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+    finally:
+        subscription.close()
+
+
+@router.websocket("/live")
+async def live_stream(
+    websocket: WebSocket,
+    token: str = Query(..., description="访问 Token (浏览器 WebSocket 无法设置请求头)"),
+    user_id: Optional[int] = Query(None, description="订阅的患者 ID，默认为当前用户"),
+    device_id: Optional[str] = Query(None, description="订阅的设备 ID")
+):
+    """
+    实时数据推送 (WebSocket)
+
+    替代轮询 /recent: 每条上传的检测记录在提交后推送给订阅者
+    - {"type": "tremor", ...}     检测记录 (字段同上传数据，另含 device_id/user_id/session_id/data_id)
+    - {"type": "dropped", "count": n}  连接过慢，已丢弃 n 条最旧的消息
+    - {"type": "ping"}            空闲心跳
+    鉴权失败时关闭码为 4000 + HTTP 状态码 (4401/4403/4404)；
+    连接期间每个心跳间隔复查一次 Token，过期或已吊销 (登出) 时以 4401 关闭
+    """
+    await websocket.accept()
+    try:
+        topic = await _authorize_live_topic(token, user_id, device_id)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        return
+
+    subscription = live_broker.subscribe([topic])
+    receiver = asyncio.create_task(_wait_disconnect(websocket, subscription))
+    try:
+        await websocket.send_text(json.dumps({"type": "subscribed", "topic": topic}))
+        checked_at = time.monotonic()
+        while True:
+            messages = await subscription.get(settings.LIVE_STREAM_PING_SECONDS)
+            if messages is None:
+                break
+            if time.monotonic() - checked_at >= settings.LIVE_STREAM_PING_SECONDS:
+                if not await is_token_active(token):
+                    await websocket.close(code=4401, reason="Token 已过期或已吊销")
+                    break
+                checked_at = time.monotonic()
+            dropped = subscription.take_dropped()
+            if dropped:
+                await websocket.send_text(json.dumps({"type": "dropped", "count": dropped}))
+            if not messages:
+                await websocket.send_text('{"type":"ping"}')
+            for message in messages:
+                await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass    # 连接已断开
+    except Exception:
+        # 客户端已断开时发送失败属于正常情况，其余为服务端错误
+        if not receiver.done():
+            logger.exception("实时推送失败: %s", topic)
+    finally:
+        receiver.cancel()
+        live_broker.unsubscribe(subscription)
 
 
 @router.get("/stats/today")
 async def get_today_stats(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取今日统计"""
     today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
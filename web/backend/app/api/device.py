@@ -11,11 +11,14 @@ from sqlalchemy import select, and_
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List
+import secrets
 
-from app.core.database import get_db
-from app.api.auth import get_current_user_from_token
+from app.core.database import get_db, get_read_db, get_ingest_db
+from app.core.device_auth import verify_device_request, ensure_device_identity, device_keys
+from app.core.device_presence import device_presence
+from app.api.auth import get_current_user_from_token, get_current_user_readonly
 from app.models.user import User
-from app.models.device import Device
+from app.models.device import Device, DeviceCredential
 
 router = APIRouter()
 
@@ -55,6 +58,14 @@ class DeviceResponse(BaseModel):
         from_attributes = True
 
 
+class DeviceCredentialResponse(BaseModel):
+    """设备签名密钥 (仅在生成时返回一次)"""
+    device_id: str
+    secret: str
+    algorithm: str = "HMAC-SHA256"
+    created_at: datetime
+
+
 class DeviceHeartbeat(BaseModel):
     """设备心跳"""
     device_id: str
@@ -62,6 +73,16 @@ class DeviceHeartbeat(BaseModel):
     firmware_version: Optional[str] = None
 
 
+# ============================================================
+# Helper Functions
+# ============================================================
+
+def _device_response(device: Device) -> DeviceResponse:
+    """设备响应 (在线状态以内存记录为准)"""
+    response = DeviceResponse.model_validate(device)
+    return response.model_copy(update=device_presence.status(device))
+
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -125,8 +146,8 @@ async def register_device(
 
 @router.get("/list", response_model=List[DeviceResponse])
 async def list_devices(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取当前用户的所有设备"""
     result = await db.execute(
@@ -134,16 +155,17 @@ async def list_devices(
         .where(Device.owner_id == current_user.id)
         .order_by(Device.last_seen.desc())
     )
-    devices = result.scalars().all()
+    devices = [_device_response(d) for d in result.scalars().all()]
+    devices.sort(key=lambda d: d.last_seen or datetime.min, reverse=True)
 
-    return [DeviceResponse.model_validate(d) for d in devices]
+    return devices
 
 
 @router.get("/{device_id}", response_model=DeviceResponse)
 async def get_device(
     device_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_readonly),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取设备详情"""
     result = await db.execute(
@@ -162,7 +184,7 @@ async def get_device(
             detail="设备不存在或未绑定"
         )
 
-    return DeviceResponse.model_validate(device)
+    return _device_response(device)
 
 
 @router.put("/{device_id}", response_model=DeviceResponse)
@@ -229,29 +251,85 @@ async def delete_device(
     return None
 
 
+@router.post("/{device_id}/credentials", response_model=DeviceCredentialResponse)
+async def rotate_device_credentials(
+    device_id: str,
+    current_user: User = Depends(get_current_user_from_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    生成/轮换设备签名密钥
+
+    新密钥只在本次响应中返回，需写入设备固件配置
+    其他 worker 在下次密钥表增量刷新时生效
+    """
+    result = await db.execute(
+        select(Device).where(
+            and_(
+                Device.device_id == device_id,
+                Device.owner_id == current_user.id
+            )
+        )
+    )
+    if not result.scalar_one_or_none():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备不存在或未绑定"
+        )
+
+    secret = secrets.token_hex(32)
+    result = await db.execute(
+        select(DeviceCredential).where(DeviceCredential.device_id == device_id)
+    )
+    credential = result.scalar_one_or_none()
+    if credential:
+        credential.secret = secret
+        credential.is_active = True
+        credential.updated_at = datetime.utcnow()
+    else:
+        credential = DeviceCredential(device_id=device_id, secret=secret, is_active=True)
+        db.add(credential)
+    await db.flush()
+    await db.refresh(credential)
+
+    # 本 worker 立即生效
+    device_keys.set(device_id, secret)
+
+    return DeviceCredentialResponse(
+        device_id=device_id,
+        secret=secret,
+        created_at=credential.updated_at
+    )
+
+
 @router.post("/heartbeat")
 async def device_heartbeat(
     heartbeat: DeviceHeartbeat,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_ingest_db),
+    signed_device_id: Optional[str] = Depends(verify_device_request)
 ):
     """
     设备心跳
 
     设备定期调用此接口报告在线状态
+    只更新内存中的在线状态，由后台任务定时批量写回 devices 表
     """
-    result = await db.execute(
-        select(Device).where(Device.device_id == heartbeat.device_id)
-    )
-    device = result.scalar_one_or_none()
+    ensure_device_identity(signed_device_id, heartbeat.device_id)
 
-    if device:
-        device.is_online = True
-        device.last_seen = datetime.utcnow()
-        if heartbeat.battery_level is not None:
-            device.battery_level = heartbeat.battery_level
-        if heartbeat.firmware_version:
-            device.firmware_version = heartbeat.firmware_version
-        await db.flush()
+    # 本 worker 未见过的设备先确认存在 (之后的心跳不访问数据库)
+    known = heartbeat.device_id in device_presence
+    if not known:
+        result = await db.execute(
+            select(Device.id).where(Device.device_id == heartbeat.device_id)
+        )
+        known = result.scalar_one_or_none() is not None
+
+    if known:
+        device_presence.touch(
+            heartbeat.device_id,
+            battery_level=heartbeat.battery_level,
+            firmware_version=heartbeat.firmware_version
+        )
 
     return {
         "status": "ok",
@@ -263,7 +341,7 @@ async def device_heartbeat(
 @router.get("/status/{device_id}")
 async def get_device_status(
     device_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取设备状态（无需认证，用于设备检查）"""
     result = await db.execute(
@@ -277,10 +355,11 @@ async def get_device_status(
             "device_id": device_id
         }
 
+    presence = device_presence.status(device)
     return {
         "exists": True,
         "device_id": device_id,
         "is_bound": device.owner_id is not None,
-        "is_online": device.is_online,
-        "last_seen": device.last_seen
+        "is_online": presence["is_online"],
+        "last_seen": presence["last_seen"]
     }
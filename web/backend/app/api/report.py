@@ -5,7 +5,7 @@ Tremor Guard - Report API
 完整实现报告生成、导出功能
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func
@@ -18,9 +18,11 @@ import csv
 import json
 import uuid
 
-from app.core.database import get_db
-from app.api.auth import get_current_user_from_token
+from app.core.data_watermark import check_etag
+from app.core.database import get_reporting_db
+from app.api.auth import get_current_user_reporting
 from app.models.user import User
+from app.models.device import Device
 from app.models.tremor import TremorData, TremorSession
 
 router = APIRouter()
@@ -108,6 +110,33 @@ def get_date_range(report_type: ReportType, start_date: Optional[datetime], end_
     return start, end
 
 
+def user_data_query(user_id: int, start: datetime, end: datetime,
+                    device_id: Optional[str] = None, with_device: bool = False):
+    """
+    用户在时间范围内的震颤数据查询 (TremorData 通过会话关联用户和设备)
+
+    with_device=True 时每行附带设备硬件 ID: (TremorData, device_id)
+    """
+    query = (
+        select(TremorData)
+        .join(TremorSession, TremorData.session_id == TremorSession.id)
+        .where(
+            and_(
+                TremorSession.user_id == user_id,
+                TremorData.timestamp >= start,
+                TremorData.timestamp <= end
+            )
+        )
+    )
+    if device_id or with_device:
+        query = query.join(Device, TremorSession.device_id == Device.id)
+    if device_id:
+        query = query.where(Device.device_id == device_id)
+    if with_device:
+        query = query.add_columns(Device.device_id)
+    return query
+
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -115,8 +144,8 @@ def get_date_range(report_type: ReportType, start_date: Optional[datetime], end_
 @router.post("/generate", response_model=ReportData)
 async def generate_report(
     request: ReportRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db)
 ):
     """
     生成报告
@@ -148,13 +177,7 @@ async def generate_report(
     sessions = result.scalars().all()
 
     # 查询震颤数据
-    data_query = select(TremorData).where(
-        and_(
-            TremorData.user_id == current_user.id,
-            TremorData.timestamp >= start_date,
-            TremorData.timestamp <= end_date
-        )
-    )
+    data_query = user_data_query(current_user.id, start_date, end_date, request.device_id)
 
     result = await db.execute(data_query)
     tremor_data = result.scalars().all()
@@ -251,8 +274,8 @@ async def generate_report(
 
 @router.get("/export/csv")
 async def export_csv(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     start_date: datetime = Query(..., description="开始日期"),
     end_date: datetime = Query(..., description="结束日期"),
     device_id: Optional[str] = None
@@ -262,19 +285,12 @@ async def export_csv(
 
     导出指定时间范围内的原始震颤数据
     """
-    # 构建查询
-    conditions = [
-        TremorData.user_id == current_user.id,
-        TremorData.timestamp >= start_date,
-        TremorData.timestamp <= end_date
-    ]
-
-    if device_id:
-        conditions.append(TremorData.device_id == device_id)
-
-    query = select(TremorData).where(and_(*conditions)).order_by(TremorData.timestamp)
+    # 构建查询 (附带设备硬件 ID)
+    query = user_data_query(
+        current_user.id, start_date, end_date, device_id, with_device=True
+    ).order_by(TremorData.timestamp)
     result = await db.execute(query)
-    data = result.scalars().all()
+    data = result.all()
 
     # 生成 CSV
     output = io.StringIO()
@@ -283,23 +299,20 @@ async def export_csv(
     # 写入表头
     writer.writerow([
         'timestamp', 'device_id', 'detected', 'frequency',
-        'rms_amplitude', 'peak_amplitude', 'severity',
-        'accel_x', 'accel_y', 'accel_z'
+        'rms_amplitude', 'peak_power', 'band_power', 'severity'
     ])
 
     # 写入数据
-    for d in data:
+    for d, hw_device_id in data:
         writer.writerow([
             d.timestamp.isoformat(),
-            d.device_id,
+            hw_device_id,
             d.detected,
             d.frequency,
             d.rms_amplitude,
-            d.peak_amplitude,
-            d.severity,
-            d.accel_x,
-            d.accel_y,
-            d.accel_z
+            d.peak_power,
+            d.band_power,
+            d.severity
         ])
 
     output.seek(0)
@@ -316,8 +329,8 @@ async def export_csv(
 
 @router.get("/export/json")
 async def export_json(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     start_date: datetime = Query(..., description="开始日期"),
     end_date: datetime = Query(..., description="结束日期"),
     device_id: Optional[str] = None
@@ -327,19 +340,12 @@ async def export_json(
 
     导出指定时间范围内的原始震颤数据（JSON 格式）
     """
-    # 构建查询
-    conditions = [
-        TremorData.user_id == current_user.id,
-        TremorData.timestamp >= start_date,
-        TremorData.timestamp <= end_date
-    ]
-
-    if device_id:
-        conditions.append(TremorData.device_id == device_id)
-
-    query = select(TremorData).where(and_(*conditions)).order_by(TremorData.timestamp)
+    # 构建查询 (附带设备硬件 ID)
+    query = user_data_query(
+        current_user.id, start_date, end_date, device_id, with_device=True
+    ).order_by(TremorData.timestamp)
     result = await db.execute(query)
-    data = result.scalars().all()
+    data = result.all()
 
     # 构建 JSON 数据
     json_data = {
@@ -352,20 +358,16 @@ async def export_json(
         "data": []
     }
 
-    for d in data:
+    for d, hw_device_id in data:
         json_data["data"].append({
             "timestamp": d.timestamp.isoformat(),
-            "device_id": d.device_id,
+            "device_id": hw_device_id,
             "detected": d.detected,
             "frequency": d.frequency,
             "rms_amplitude": d.rms_amplitude,
-            "peak_amplitude": d.peak_amplitude,
-            "severity": d.severity,
-            "accelerometer": {
-                "x": d.accel_x,
-                "y": d.accel_y,
-                "z": d.accel_z
-            }
+            "peak_power": d.peak_power,
+            "band_power": d.band_power,
+            "severity": d.severity
         })
 
     # 生成文件名
@@ -380,8 +382,8 @@ async def export_json(
 
 @router.get("/summary/doctor")
 async def get_doctor_summary(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db),
     days: int = Query(7, ge=1, le=90, description="统计天数")
 ):
     """
@@ -397,24 +399,12 @@ async def get_doctor_summary(
     prev_start_date = prev_end_date - timedelta(days=days)
 
     # 当前周期数据
-    query = select(TremorData).where(
-        and_(
-            TremorData.user_id == current_user.id,
-            TremorData.timestamp >= start_date,
-            TremorData.timestamp <= end_date
-        )
-    )
+    query = user_data_query(current_user.id, start_date, end_date)
     result = await db.execute(query)
     current_data = result.scalars().all()
 
     # 前一周期数据
-    query = select(TremorData).where(
-        and_(
-            TremorData.user_id == current_user.id,
-            TremorData.timestamp >= prev_start_date,
-            TremorData.timestamp <= prev_end_date
-        )
-    )
+    query = user_data_query(current_user.id, prev_start_date, prev_end_date)
     result = await db.execute(query)
     prev_data = result.scalars().all()
 
@@ -501,14 +491,20 @@ async def get_doctor_summary(
 
 @router.get("/quick-stats")
 async def get_quick_stats(
-    current_user: User = Depends(get_current_user_from_token),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user_reporting),
+    db: AsyncSession = Depends(get_reporting_db)
 ):
     """
     快速统计
 
     返回关键统计数据，用于报告页面概览
     """
+    not_modified = await check_etag(request, response, current_user.id)
+    if not_modified:
+        return not_modified
+
     now = datetime.utcnow()
 
     # 今日
@@ -521,13 +517,7 @@ async def get_quick_stats(
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
     async def get_period_stats(start: datetime, end: datetime):
-        query = select(TremorData).where(
-            and_(
-                TremorData.user_id == current_user.id,
-                TremorData.timestamp >= start,
-                TremorData.timestamp <= end
-            )
-        )
+        query = user_data_query(current_user.id, start, end)
         result = await db.execute(query)
         data = result.scalars().all()
 
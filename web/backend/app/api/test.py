@@ -9,13 +9,26 @@ from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List, Any
+from itertools import islice
 import json
 
+from app.core.packet_capture import packet_capture
+
 router = APIRouter()
 
-# 内存存储，用于测试（生产环境应使用数据库）
-received_packets: List[dict] = []
-MAX_PACKETS = 500  # 最多保存 500 条
+# 数据包保存在环形缓冲区中 (多 worker 通过共享状态同步)，用于测试（生产环境应使用数据库）
+MAX_PACKETS = packet_capture.ring.capacity  # 最多保存条数 (TEST_CAPTURE_PACKETS)
+
+
+def _packet_fields(request: Request, body: Any) -> dict:
+    """数据包公共字段"""
+    device_id = body.get("device_id") if isinstance(body, dict) else None
+    return {
+        "received_at": datetime.now().isoformat(),
+        "path": request.url.path,
+        "client_ip": request.client.host if request.client else "unknown",
+        "device_id": device_id or request.headers.get("X-Device-Id"),
+    }
 
 
 class GenericPacket(BaseModel):
@@ -35,8 +48,6 @@ async def receive_packet(request: Request):
 
     ESP32 可以发送任何格式的 JSON 数据到这个接口
     """
-    global received_packets
-
     try:
         # 尝试解析 JSON
         body = await request.json()
@@ -45,21 +56,12 @@ async def receive_packet(request: Request):
         raw_body = await request.body()
         body = {"raw": raw_body.decode('utf-8', errors='ignore')}
 
-    # 构建数据包记录
-    packet = {
-        "id": len(received_packets) + 1,
-        "received_at": datetime.now().isoformat(),
-        "client_ip": request.client.host if request.client else "unknown",
+    # 构建数据包记录并保存 (满时覆盖最旧的)
+    packet = await packet_capture.record({
+        **_packet_fields(request, body),
         "headers": dict(request.headers),
         "data": body
-    }
-
-    # 添加到列表
-    received_packets.append(packet)
-
-    # 限制数量，删除最旧的
-    if len(received_packets) > MAX_PACKETS:
-        received_packets = received_packets[-MAX_PACKETS:]
+    })
 
     return {
         "status": "ok",
@@ -74,25 +76,16 @@ async def receive_heartbeat(request: Request):
     """
     接收设备心跳
     """
-    global received_packets
-
     try:
         body = await request.json()
     except:
         body = {}
 
-    packet = {
-        "id": len(received_packets) + 1,
-        "received_at": datetime.now().isoformat(),
+    await packet_capture.record({
+        **_packet_fields(request, body),
         "type": "heartbeat",
-        "client_ip": request.client.host if request.client else "unknown",
         "data": body
-    }
-
-    received_packets.append(packet)
-
-    if len(received_packets) > MAX_PACKETS:
-        received_packets = received_packets[-MAX_PACKETS:]
+    })
 
     return {
         "status": "ok",
@@ -106,8 +99,6 @@ async def receive_batch(request: Request):
     """
     接收批量数据
     """
-    global received_packets
-
     try:
         body = await request.json()
     except:
@@ -115,19 +106,12 @@ async def receive_batch(request: Request):
         body = {"raw": raw_body.decode('utf-8', errors='ignore')}
 
     # 记录批量数据
-    packet = {
-        "id": len(received_packets) + 1,
-        "received_at": datetime.now().isoformat(),
+    packet = await packet_capture.record({
+        **_packet_fields(request, body),
         "type": "batch",
-        "client_ip": request.client.host if request.client else "unknown",
         "data": body,
         "item_count": len(body.get("data", [])) if isinstance(body, dict) else 0
-    }
-
-    received_packets.append(packet)
-
-    if len(received_packets) > MAX_PACKETS:
-        received_packets = received_packets[-MAX_PACKETS:]
+    })
 
     return {
         "status": "ok",
@@ -142,23 +126,16 @@ async def receive_batch(request: Request):
 async def get_packets(
     limit: int = 50,
     offset: int = 0,
-    type_filter: Optional[str] = None
+    type_filter: Optional[str] = None,
+    device_id: Optional[str] = None
 ):
     """
     获取接收到的数据包列表
 
-    用于前端测试页面显示
+    用于前端测试页面显示 (最新的在前面，可按类型/设备过滤)
     """
-    packets = received_packets.copy()
-    packets.reverse()  # 最新的在前面
-
-    # 类型过滤
-    if type_filter:
-        packets = [p for p in packets if p.get("type") == type_filter]
-
-    # 分页
-    total = len(packets)
-    packets = packets[offset:offset + limit]
+    await packet_capture.sync()
+    total, packets = packet_capture.ring.query(limit, offset, type_filter, device_id)
 
     return {
         "total": total,
@@ -173,9 +150,10 @@ async def get_packet_detail(packet_id: int):
     """
     获取单个数据包详情
     """
-    for packet in received_packets:
-        if packet["id"] == packet_id:
-            return packet
+    await packet_capture.sync()
+    packet = packet_capture.ring.get(packet_id)
+    if packet is not None:
+        return packet
 
     return {"error": "Packet not found", "packet_id": packet_id}
 
@@ -185,9 +163,7 @@ async def clear_packets():
     """
     清空所有数据包
     """
-    global received_packets
-    count = len(received_packets)
-    received_packets = []
+    count = await packet_capture.clear()
 
     return {
         "status": "ok",
@@ -200,24 +176,23 @@ async def get_stats():
     """
     获取统计信息
     """
-    total = len(received_packets)
-
-    # 按类型统计
-    type_counts = {}
-    for p in received_packets:
-        t = p.get("type", "unknown")
-        type_counts[t] = type_counts.get(t, 0) + 1
+    await packet_capture.sync()
+    ring = packet_capture.ring
+    oldest = ring.oldest()
+    newest = next(ring.newest(), None)
 
     # 最近的设备 IP
     recent_ips = set()
-    for p in received_packets[-20:]:
+    for p in islice(ring.newest(), 20):
         recent_ips.add(p.get("client_ip", "unknown"))
 
     return {
-        "total_packets": total,
+        "total_packets": len(ring),
         "max_packets": MAX_PACKETS,
-        "type_counts": type_counts,
+        "type_counts": ring.type_counts(),
+        "device_counts": ring.device_counts(),
         "recent_client_ips": list(recent_ips),
-        "oldest_packet": received_packets[0]["received_at"] if received_packets else None,
-        "newest_packet": received_packets[-1]["received_at"] if received_packets else None
+        "oldest_packet": oldest["received_at"] if oldest else None,
+        "newest_packet": newest["received_at"] if newest else None,
+        "spill_log": packet_capture.spill.path if packet_capture.spill else None
     }
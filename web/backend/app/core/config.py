@@ -58,6 +58,54 @@ class Settings(BaseSettings):
             return f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}"
         return v
 
+    # 只读副本 (可选)，GET 接口的查询路由到副本
+    READ_REPLICA_URL: Optional[str] = None
+
+    # 分负载连接池: 大小 / 溢出 / 获取连接超时 (秒) / 语句超时 (毫秒)
+    # ingest: 设备上传与心跳
+    DB_INGEST_POOL_SIZE: int = 10
+    DB_INGEST_MAX_OVERFLOW: int = 10
+    DB_INGEST_POOL_TIMEOUT: float = 5
+    DB_INGEST_STATEMENT_TIMEOUT_MS: int = 5000
+    # interactive: 前端普通接口
+    DB_INTERACTIVE_POOL_SIZE: int = 8
+    DB_INTERACTIVE_MAX_OVERFLOW: int = 8
+    DB_INTERACTIVE_POOL_TIMEOUT: float = 10
+    DB_INTERACTIVE_STATEMENT_TIMEOUT_MS: int = 15000
+    # reporting: 分析与报表
+    DB_REPORTING_POOL_SIZE: int = 4
+    DB_REPORTING_MAX_OVERFLOW: int = 4
+    DB_REPORTING_POOL_TIMEOUT: float = 30
+    DB_REPORTING_STATEMENT_TIMEOUT_MS: int = 120000
+
+    # 列表接口 (/data/recent、/data/session/{id}/data、/data/history) 只查询所需列并用 orjson 直接序列化
+    FAST_LIST_RESPONSES: bool = True
+
+    # SQL 查询预算 (每个请求，0 表示不限制)
+    SQL_QUERY_BUDGET: int = 50            # 单个请求最多执行的语句数
+    SQL_REPEAT_BUDGET: int = 10           # 同一语句形状最多重复次数 (N+1 检测)
+    SQL_BUDGET_MODE: str = "log"          # off / log / raise
+
+    # ============================================================
+    # 监控指标 (Prometheus /metrics)
+    # ============================================================
+    METRICS_ENABLED: bool = True
+    METRICS_COLLECT_SECONDS: float = 1.0            # 连接池状态采样间隔
+    PROMETHEUS_MULTIPROC_DIR: Optional[str] = None  # 多 worker 部署时的指标目录
+
+    # 事件循环延迟监控
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 50.0          # 心跳间隔
+    LOOP_SLOW_CALLBACK_MS: float = 100.0            # 阻塞超过该值时抓取调用栈
+    LOOP_SLOW_CALLBACK_KEEP: int = 50               # 保留的阻塞报告数
+
+    # 请求采样分析 (两项都为空时不启用)
+    PROFILER_TOKEN: Optional[str] = None            # 按需分析令牌 (X-Profile-Token 请求头)
+    PROFILER_SAMPLE_EVERY: int = 0                  # 每个路由每 N 个请求分析一次，0 表示关闭
+    PROFILER_INTERVAL_MS: float = 5.0               # 采样间隔
+    PROFILER_OUTPUT_DIR: str = "/tmp/tremor_profiles"
+    PROFILER_MAX_FILES: int = 20                    # 抽样模式每个路由保留的文件数
+
     # ============================================================
     # Redis 配置 (Zeabur Redis)
     # ============================================================
@@ -82,6 +130,9 @@ class Settings(BaseSettings):
             return f"redis://{host}:{port}/0"
         return v
 
+    # 多 worker 共享的小型状态 (设备上报的配置、测试抓包)
+    SHARED_STATE_BACKEND: str = "memory"              # memory (单 worker) / redis (多 worker 共享)
+
     # ============================================================
     # JWT 认证配置
     # ============================================================
@@ -90,6 +141,12 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
+    # Token 吊销 (登出后 Token 立即失效)
+    TOKEN_REVOCATION_BACKEND: str = "memory"          # memory (单 worker) / redis (多 worker 共享)
+    TOKEN_REVOCATION_BLOOM_CAPACITY: int = 100000     # 布隆过滤器容量
+    TOKEN_REVOCATION_RECENT_SECONDS: int = 600        # 近期精确集合保留时间
+    TOKEN_REVOCATION_SYNC_SECONDS: int = 5            # 与共享存储同步间隔
+
     # ============================================================
     # Claude API 配置
     # ============================================================
@@ -120,7 +177,81 @@ class Settings(BaseSettings):
     # ============================================================
     # 设备认证
     # ============================================================
-    DEVICE_API_KEY: str = ""
+    DEVICE_API_KEY: str = ""                # 主密钥，未单独配置密钥的设备使用 HMAC(主密钥, device_id) 派生
+    DEVICE_AUTH_REQUIRED: bool = False      # 是否强制设备请求携带签名
+    DEVICE_AUTH_MAX_SKEW_SECONDS: int = 300 # 签名时间戳允许的最大偏差
+    DEVICE_KEY_REFRESH_SECONDS: int = 30    # 设备密钥表增量刷新间隔
+    DEVICE_KEY_REFRESH_OVERLAP_SECONDS: int = 120  # 每次刷新重新读取水位之前该时间内的密钥 (晚提交的轮换)
+
+    # ============================================================
+    # 设备在线状态 (内存记录，定时批量写回)
+    # ============================================================
+    DEVICE_PRESENCE_FLUSH_SECONDS: int = 5  # 写回 devices 表的间隔
+    DEVICE_OFFLINE_SECONDS: int = 900       # 超过该时间无心跳/上传视为离线 (设备心跳间隔 300s)
+    DEVICE_OFFLINE_SWEEP_SECONDS: int = 60  # 离线清理间隔
+
+    # ============================================================
+    # 设备检测参数配置 (全局/分组/设备)
+    # ============================================================
+    CONFIG_REFRESH_SECONDS: int = 2         # 配置缓存增量刷新间隔 (其他 worker 保存的配置在此时间内生效)
+    CONFIG_LONG_POLL_MAX_SECONDS: int = 60  # /config/current 长轮询最长等待时间
+    # 从未保存过全局配置时，用第一台已签名设备上传的配置初始化 (默认关闭，全局配置只由管理员修改)
+    CONFIG_SEED_FROM_DEVICE: bool = False
+
+    # ============================================================
+    # 密码哈希线程池 (bcrypt 不阻塞事件循环)
+    # ============================================================
+    PASSWORD_HASH_WORKERS: int = 2         # 哈希线程数
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32    # 排队上限，超出返回 429
+    PASSWORD_HASH_RETRY_AFTER: int = 1     # 429 响应的 Retry-After (秒)
+
+    # ============================================================
+    # 原始加速度窗口存储 (按设备、按天的分块文件)
+    # ============================================================
+    RAW_STORAGE_DIR: str = "./data/raw"
+    RAW_MAX_WINDOWS_PER_UPLOAD: int = 120  # 单次上传最多窗口数 (约 5 分钟连续采集)
+    RAW_RETENTION_DAYS: int = 30           # 保留天数，0 表示不清理
+    RAW_RETENTION_SWEEP_SECONDS: int = 3600
+
+    # ============================================================
+    # 测试抓包 (/api/test)
+    # ============================================================
+    TEST_CAPTURE_PACKETS: int = 500            # 内存环形缓冲区容量
+    TEST_CAPTURE_SPILL_DIR: str = ""           # 滚动日志目录 (JSON Lines)，空表示不写日志
+    TEST_CAPTURE_SPILL_MAX_MB: int = 50        # 单个日志文件大小上限
+    TEST_CAPTURE_SPILL_BACKUPS: int = 5        # 保留的历史日志文件数
+
+    # ============================================================
+    # 实时推送 (WebSocket)
+    # ============================================================
+    LIVE_STREAM_BACKEND: str = "memory"        # memory (单 worker) / redis (多 worker 共享)
+    LIVE_STREAM_QUEUE_SIZE: int = 100          # 每个连接的待发送队列长度，满时丢弃最旧的消息
+    LIVE_STREAM_PING_SECONDS: int = 25         # 空闲连接的心跳间隔，也是连接期间复查 Token 的间隔
+
+    # ============================================================
+    # 频谱存储
+    # ============================================================
+    SPECTRUM_ENCODING: str = "f16"             # f16 / f32 / u8 (量化)
+    SPECTROGRAM_CACHE_BUCKETS: int = 20000     # 时频图已结束桶的缓存条数 (每 worker)
+    SPECTROGRAM_CLOSE_GRACE_SECONDS: int = 3600  # 桶结束后多久视为不再变化 (覆盖离线补传)
+
+    # ============================================================
+    # 分析接口 ETag (用户数据水位，见 app/core/data_watermark.py)
+    # ============================================================
+    DATA_ETAG_WINDOW_SECONDS: int = 300        # 数据未变化时 ETag 的最长有效时间 (统计窗口随时间滑动)
+
+    # ============================================================
+    # 图表时间序列 (/api/data/series)
+    # ============================================================
+    SERIES_MAX_POINTS: int = 5000              # 单次返回的点数上限
+    SERIES_LTTB_MAX_ROWS: int = 500000         # LTTB 在内存中处理的最大行数，超出改为流式 min/max
+
+    # ============================================================
+    # 检测参数变更后的历史数据重新判定
+    # ============================================================
+    RECLASSIFY_ON_CONFIG_CHANGE: bool = True   # 云端配置的判定参数变化时自动创建任务
+    RECLASSIFY_CHUNK_ROWS: int = 50000         # 每块 (一个事务) 处理的行数
+    RECLASSIFY_STALE_SECONDS: int = 300        # running 任务超过此时间未更新视为已中断，可被继续
 
     class Config:
         env_file = ".env"
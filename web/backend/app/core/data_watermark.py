@@ -0,0 +1,97 @@
+"""
+Tremor Guard - Data Watermark
+震颤卫士 - 用户数据水位
+
+每个用户一个计数器，该用户的检测数据/会话发生变化时递增 (上传、批量上传、会话开始/结束，
+均在提交后执行)；历史数据重新判定会影响所有用户，改为更新全局代数。
+计数器保存在共享状态中 (多 worker 部署使用 Redis)。
+
+用途:
+- 分析类 GET 接口的 ETag: 请求携带 If-None-Match 且水位未变化时直接返回 304，不执行任何聚合查询
+- 服务端缓存的键: await data_watermark.get(user_id) 作为键的一部分，数据变化后自然失效
+
+统计窗口随时间滑动 (最近 N 天、今天、本周)，ETag 同时包含 DATA_ETAG_WINDOW_SECONDS 时间片，
+即使没有新数据，结果最多在一个时间片后重新计算。
+"""
+
+import hashlib
+import time
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+from app.core.config import settings
+from app.core.shared_state import SharedStateStore, shared_state
+
+USER_KEY = "watermark:user:{}"
+EPOCH_KEY = "watermark:epoch"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含当前 ETag (忽略弱校验前缀)"""
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class DataWatermark:
+    """用户数据水位 (全局代数.用户计数器)"""
+
+    def __init__(self, store: SharedStateStore, window_seconds: int):
+        self.store = store
+        self.window_seconds = max(1, window_seconds)
+
+    async def _epoch(self) -> str:
+        # 共享存储清空 (或进程内存储重启) 后计数器从 0 开始，代数随之更新，旧 ETag 不会误命中
+        epoch = await self.store.get(EPOCH_KEY)
+        if epoch is None:
+            epoch = str(time.time_ns())
+            await self.store.set(EPOCH_KEY, epoch)
+        return epoch
+
+    async def get(self, user_id: int) -> str:
+        """当前水位，可作为缓存键的一部分"""
+        counter = await self.store.get(USER_KEY.format(user_id))
+        return f"{await self._epoch()}.{counter or 0}"
+
+    async def bump(self, user_id: Optional[int]):
+        """用户数据已变化 (在事务提交后调用)"""
+        if user_id is not None:
+            await self.store.incr(USER_KEY.format(user_id))
+
+    async def bump_all(self):
+        """所有用户的数据都可能变化 (历史数据重新判定)"""
+        await self.store.set(EPOCH_KEY, str(time.time_ns()))
+
+    async def etag(self, user_id: int, request: Request) -> str:
+        """水位 + 时间片 + 用户 + 路径与查询参数 → 弱 ETag"""
+        window = int(time.time() // self.window_seconds)
+        query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+        key = f"{await self.get(user_id)}|{window}|{user_id}|{request.url.path}?{query}"
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+# 全局数据水位
+data_watermark = DataWatermark(shared_state, settings.DATA_ETAG_WINDOW_SECONDS)
+
+
+async def check_etag(request: Request, response: Response, user_id: int) -> Optional[Response]:
+    """
+    条件请求检查 (在执行任何聚合查询之前调用)
+
+    If-None-Match 与当前 ETag 一致时返回 304 响应；否则把 ETag 写入 response 并返回 None
+
+    Usage:
+        not_modified = await check_etag(request, response, current_user.id)
+        if not_modified:
+            return not_modified
+    """
+    etag = await data_watermark.etag(user_id, request)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    # 浏览器每次都带 If-None-Match 重新验证
+    response.headers["Cache-Control"] = "private, no-cache"
+    return None
@@ -3,21 +3,97 @@ Tremor Guard - Database Configuration
 震颤卫士 - 数据库配置
 
 SQLAlchemy 异步数据库连接
+
+按负载类型划分独立的引擎/连接池，避免报表查询占满连接池导致设备上传超时:
+- ingest:      设备上传、心跳 (短事务，高频)
+- interactive: 前端普通接口 (默认)
+- reporting:   分析/报表等重查询 (只读)
+每类连接池有独立的大小、获取连接超时和语句超时 (PostgreSQL statement_timeout)
 """
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
 from app.core.config import settings
+from app.core.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+# ============================================================
+# 负载类型配置 (Workload Classes)
+# ============================================================
+
+WORKLOAD_INGEST = "ingest"
+WORKLOAD_INTERACTIVE = "interactive"
+WORKLOAD_REPORTING = "reporting"
+
+WORKLOAD_POOLS = {
+    WORKLOAD_INGEST: {
+        "pool_size": settings.DB_INGEST_POOL_SIZE,
+        "max_overflow": settings.DB_INGEST_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_INGEST_POOL_TIMEOUT,
+        "statement_timeout_ms": settings.DB_INGEST_STATEMENT_TIMEOUT_MS,
+    },
+    WORKLOAD_INTERACTIVE: {
+        "pool_size": settings.DB_INTERACTIVE_POOL_SIZE,
+        "max_overflow": settings.DB_INTERACTIVE_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_INTERACTIVE_POOL_TIMEOUT,
+        "statement_timeout_ms": settings.DB_INTERACTIVE_STATEMENT_TIMEOUT_MS,
+    },
+    WORKLOAD_REPORTING: {
+        "pool_size": settings.DB_REPORTING_POOL_SIZE,
+        "max_overflow": settings.DB_REPORTING_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_REPORTING_POOL_TIMEOUT,
+        "statement_timeout_ms": settings.DB_REPORTING_STATEMENT_TIMEOUT_MS,
+    },
+}
+
+
+def _create_engine(url: str, pool_size: int, max_overflow: int,
+                   pool_timeout: float, statement_timeout_ms: int) -> AsyncEngine:
+    """创建引擎 (SQLite 不支持连接池参数和语句超时，仅用于本地开发/基准测试)"""
+    kwargs = {
+        "echo": settings.DEBUG,   # 开发模式下打印 SQL
+        "pool_pre_ping": True,    # 连接池预检查
+    }
+    if url.startswith("postgresql"):
+        kwargs.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            connect_args={"server_settings": {"statement_timeout": str(statement_timeout_ms)}},
+        )
+    return create_async_engine(url, **kwargs)
+
+
+# 主库引擎 (每类负载一个连接池)
+engines: Dict[str, AsyncEngine] = {
+    workload: _create_engine(settings.DATABASE_URL, **options)
+    for workload, options in WORKLOAD_POOLS.items()
+}
+
+# 只读副本引擎 (可选): interactive/reporting 的只读查询路由到副本
+replica_engines: Dict[str, AsyncEngine] = {}
+if settings.READ_REPLICA_URL:
+    replica_engines = {
+        workload: _create_engine(settings.READ_REPLICA_URL, **WORKLOAD_POOLS[workload])
+        for workload in (WORKLOAD_INTERACTIVE, WORKLOAD_REPORTING)
+    }
+
+# 默认引擎 (建表、脚本等)
+engine = engines[WORKLOAD_INTERACTIVE]
+
+
+def _read_engine(workload: str) -> AsyncEngine:
+    """只读引擎: 有副本时连接副本，否则复用主库连接池；AUTOCOMMIT 不产生 BEGIN/COMMIT 往返"""
+    base = replica_engines.get(workload) or engines[workload]
+    return base.execution_options(isolation_level="AUTOCOMMIT")
 
-# 创建异步引擎
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,  # 开发模式下打印 SQL
-    pool_pre_ping=True,   # 连接池预检查
-    pool_size=10,
-    max_overflow=20
-)
 
 # 创建异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
@@ -28,23 +104,123 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+# 设备上传会话工厂
+IngestSessionLocal = async_sessionmaker(
+    bind=engines[WORKLOAD_INGEST],
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
+# 只读会话工厂
+ReadOnlySessionLocal = async_sessionmaker(
+    bind=_read_engine(WORKLOAD_INTERACTIVE),
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
+# 报表只读会话工厂
+ReportingSessionLocal = async_sessionmaker(
+    bind=_read_engine(WORKLOAD_REPORTING),
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
 # 声明基类
 Base = declarative_base()
 
 
-async def get_db() -> AsyncSession:
+# ============================================================
+# 会话统计 (主库/副本查询数、跳过的 commit 数)
+# ============================================================
+
+db_stats = {
+    "commits": 0,
+    "commits_avoided": 0,
+    "primary_queries": 0,
+    "replica_queries": 0,
+}
+
+# 各连接池获取连接的等待时间
+pool_wait_stats: Dict[str, dict] = {
+    workload: {"acquisitions": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "timeouts": 0}
+    for workload in WORKLOAD_POOLS
+}
+
+
+def _count_primary_query(conn, cursor, statement, parameters, context, executemany):
+    db_stats["primary_queries"] += 1
+
+
+def _count_replica_query(conn, cursor, statement, parameters, context, executemany):
+    db_stats["replica_queries"] += 1
+
+
+for _engine in engines.values():
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_primary_query)
+for _engine in replica_engines.values():
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_replica_query)
+
+
+def get_db_stats() -> dict:
+    """获取会话统计"""
+    return {**db_stats, "replica_configured": bool(replica_engines)}
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    """获取各负载连接池状态 (占用/溢出/等待时间)"""
+    result = {}
+    for workload, eng in engines.items():
+        pool = eng.sync_engine.pool
+        waits = pool_wait_stats[workload]
+        result[workload] = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "acquisitions": waits["acquisitions"],
+            "timeouts": waits["timeouts"],
+            "wait_seconds_total": round(waits["wait_seconds_total"], 6),
+            "wait_seconds_max": round(waits["wait_seconds_max"], 6),
+        }
+    return result
+
+
+async def _acquire_connection(session: AsyncSession, workload: str):
     """
-    获取数据库会话 (依赖注入)
+    预先获取连接并记录等待时间
 
-    Usage:
-        @app.get("/users")
-        async def get_users(db: AsyncSession = Depends(get_db)):
-            ...
+    连接池耗尽超时时返回 503，客户端 (设备) 稍后重试
     """
-    async with AsyncSessionLocal() as session:
+    waits = pool_wait_stats[workload]
+    start = time.perf_counter()
+    try:
+        await session.connection()
+    except PoolTimeoutError:
+        waits["timeouts"] += 1
+        DB_POOL_TIMEOUTS.labels(workload).inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="数据库繁忙，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    elapsed = time.perf_counter() - start
+    waits["acquisitions"] += 1
+    DB_POOL_WAIT.labels(workload).observe(elapsed)
+    waits["wait_seconds_total"] += elapsed
+    if elapsed > waits["wait_seconds_max"]:
+        waits["wait_seconds_max"] = elapsed
+
+
+@asynccontextmanager
+async def _write_session(factory: async_sessionmaker, workload: str):
+    async with factory() as session:
         try:
+            await _acquire_connection(session, workload)
             yield session
             await session.commit()
+            db_stats["commits"] += 1
         except Exception:
             await session.rollback()
             raise
@@ -52,14 +228,83 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+@asynccontextmanager
+async def _read_session(factory: async_sessionmaker, workload: str):
+    async with factory() as session:
+        try:
+            await _acquire_connection(session, workload)
+            yield session
+            db_stats["commits_avoided"] += 1
+        finally:
+            await session.close()
+
+
+async def get_db() -> AsyncSession:
+    """
+    获取数据库会话 (依赖注入)
+
+    Usage:
+        @app.get("/users")
+        async def get_users(db: AsyncSession = Depends(get_db)):
+            ...
+    """
+    async with _write_session(AsyncSessionLocal, WORKLOAD_INTERACTIVE) as session:
+        yield session
+
+
+async def get_ingest_db() -> AsyncSession:
+    """
+    获取设备上传会话 (依赖注入，ingest 连接池)
+
+    用于 /data/upload、/data/upload/batch、/device/heartbeat
+    """
+    async with _write_session(IngestSessionLocal, WORKLOAD_INGEST) as session:
+        yield session
+
+
+async def get_read_db() -> AsyncSession:
+    """
+    获取只读数据库会话 (依赖注入，用于 GET 接口)
+
+    - AUTOCOMMIT 模式，不开启事务，结束时不 commit
+    - 配置 READ_REPLICA_URL 时查询路由到只读副本 (副本可能有少量复制延迟)
+
+    Usage:
+        @router.get("/summary")
+        async def get_summary(db: AsyncSession = Depends(get_read_db)):
+            ...
+    """
+    async with _read_session(ReadOnlySessionLocal, WORKLOAD_INTERACTIVE) as session:
+        yield session
+
+
+async def get_reporting_db() -> AsyncSession:
+    """
+    获取报表只读会话 (依赖注入，reporting 连接池)
+
+    用于分析/报表等重查询，与设备上传的连接池隔离
+    """
+    async with _read_session(ReportingSessionLocal, WORKLOAD_REPORTING) as session:
+        yield session
+
+
 async def init_db():
     """初始化数据库 (创建所有表)"""
     # 导入所有模型以注册到 Base
     from app.models import user, device, tremor_data, medication, rehabilitation
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all 不会给已存在的表补建索引，逐个检查创建
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
 async def close_db():
     """关闭数据库连接"""
-    await engine.dispose()
+    for eng in list(engines.values()) + list(replica_engines.values()):
+        await eng.dispose()
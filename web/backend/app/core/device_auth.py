@@ -0,0 +1,276 @@
+"""
+Tremor Guard - Device Request Signing
+震颤卫士 - 设备请求签名校验
+
+设备上传/心跳使用 HMAC-SHA256 签名，服务端仅依赖内存中的密钥表校验，
+每次请求不访问数据库、不解析 JWT。
+
+签名请求头:
+    X-Device-Id:  设备 ID
+    X-Timestamp:  Unix 时间戳 (秒)
+    X-Nonce:      随机串 (每次请求不同)
+    X-Signature:  hex(HMAC-SHA256(key, 规范字符串))
+
+规范字符串 (以换行分隔):
+    METHOD \\n PATH \\n device_id \\n timestamp \\n nonce \\n hex(SHA256(body))
+
+设备密钥:
+    - device_credentials 表中配置了密钥的设备使用该密钥
+    - 其余设备使用 HMAC-SHA256(DEVICE_API_KEY, device_id) 派生密钥
+"""
+
+import asyncio
+import hashlib
+import hmac
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import select
+
+from app.core.config import settings
+
+
+class DeviceAuthError(Exception):
+    """设备签名校验失败"""
+
+
+# ============================================================
+# 签名计算
+# ============================================================
+
+def canonical_string(method: str, path: str, device_id: str, timestamp: str, nonce: str, body: bytes) -> bytes:
+    """构造待签名的规范字符串"""
+    body_digest = hashlib.sha256(body).hexdigest()
+    return "\n".join([method.upper(), path, device_id, timestamp, nonce, body_digest]).encode()
+
+
+def compute_signature(key: bytes, method: str, path: str, device_id: str,
+                      timestamp: str, nonce: str, body: bytes) -> str:
+    """计算请求签名 (设备端与模拟器使用相同算法)"""
+    message = canonical_string(method, path, device_id, timestamp, nonce, body)
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def derive_device_key(master_key: str, device_id: str) -> bytes:
+    """由主密钥派生设备密钥"""
+    return hmac.new(master_key.encode(), device_id.encode(), hashlib.sha256).digest()
+
+
+# ============================================================
+# 内存密钥表
+# ============================================================
+
+class DeviceKeyTable:
+    """
+    设备密钥表
+
+    启动时从数据库全量加载，之后按 updated_at 增量刷新。
+    updated_at 在写入时由应用赋值，晚提交的事务可能带着更早的时间，
+    因此每次刷新都重新读取水位之前 overlap_seconds 内的行 (重复读取的行按原值覆盖，无副作用)。
+
+    派生密钥每次校验时现算 (一次 HMAC)，不缓存，未签名或伪造的 device_id 不会占用内存
+    """
+
+    def __init__(self, overlap_seconds: float = 0):
+        self._keys: Dict[str, bytes] = {}
+        self._watermark: Optional[datetime] = None
+        self._overlap = timedelta(seconds=overlap_seconds)
+
+    def get(self, device_id: str) -> Optional[bytes]:
+        """获取设备密钥，未单独配置时使用派生密钥"""
+        key = self._keys.get(device_id)
+        if key is not None:
+            return key
+        if not settings.DEVICE_API_KEY:
+            return None
+        return derive_device_key(settings.DEVICE_API_KEY, device_id)
+
+    def set(self, device_id: str, secret: Optional[str]) -> bool:
+        """更新单个设备密钥 (secret 为 None 表示移除)，返回密钥是否变化"""
+        if secret:
+            key = bytes.fromhex(secret)
+            if self._keys.get(device_id) == key:
+                return False
+            self._keys[device_id] = key
+            return True
+        return self._keys.pop(device_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, device_id: str) -> bool:
+        """设备是否单独配置了密钥"""
+        return device_id in self._keys
+
+    async def refresh(self) -> int:
+        """从数据库增量加载变更的密钥，返回变更条数"""
+        from app.core.database import AsyncSessionLocal
+        from app.models.device import DeviceCredential
+
+        query = select(
+            DeviceCredential.device_id,
+            DeviceCredential.secret,
+            DeviceCredential.is_active,
+            DeviceCredential.updated_at
+        )
+        if self._watermark is not None:
+            query = query.where(DeviceCredential.updated_at > self._watermark - self._overlap)
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(query)).all()
+
+        changed = 0
+        for row in rows:
+            changed += self.set(row.device_id, row.secret if row.is_active else None)
+            if row.updated_at and (self._watermark is None or row.updated_at > self._watermark):
+                self._watermark = row.updated_at
+        return changed
+
+    async def run_refresher(self, interval: float):
+        """后台定时增量刷新 (在 lifespan 中启动)"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 设备密钥表刷新失败: {e}")
+            await asyncio.sleep(interval)
+
+
+# ============================================================
+# 防重放 Nonce 集合
+# ============================================================
+
+class NonceCache:
+    """
+    时间窗口内的 nonce 集合
+
+    只需覆盖时间戳允许的偏差窗口，窗口外的请求已被时间戳校验拒绝
+    """
+
+    def __init__(self, window_seconds: float, max_entries: int = 200_000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: Dict[Tuple[str, str], float] = {}
+        self._order: Deque[Tuple[float, Tuple[str, str]]] = deque()
+
+    def _evict(self, now: float):
+        while self._order and (self._order[0][0] <= now or len(self._order) > self.max_entries):
+            _, key = self._order.popleft()
+            self._seen.pop(key, None)
+
+    def add(self, device_id: str, nonce: str, now: Optional[float] = None) -> bool:
+        """记录 nonce，已存在 (重放) 时返回 False"""
+        now = time.time() if now is None else now
+        self._evict(now)
+        key = (device_id, nonce)
+        if key in self._seen:
+            return False
+        expires_at = now + self.window_seconds
+        self._seen[key] = expires_at
+        self._order.append((expires_at, key))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+# ============================================================
+# 校验器
+# ============================================================
+
+class DeviceAuthenticator:
+    """设备请求签名校验器"""
+
+    def __init__(self, keys: DeviceKeyTable, max_skew_seconds: int):
+        self.keys = keys
+        self.max_skew_seconds = max_skew_seconds
+        self.nonces = NonceCache(window_seconds=max_skew_seconds * 2)
+
+    def verify(self, method: str, path: str, device_id: str, timestamp: str,
+               nonce: str, signature: str, body: bytes, now: Optional[float] = None) -> str:
+        """
+        校验签名，成功返回设备 ID
+
+        Raises:
+            DeviceAuthError: 签名缺失、过期、重放或不匹配
+        """
+        if not (device_id and timestamp and nonce and signature):
+            raise DeviceAuthError("签名请求头不完整")
+
+        now = time.time() if now is None else now
+        try:
+            ts = int(timestamp)
+        except ValueError:
+            raise DeviceAuthError("时间戳格式错误")
+        if abs(now - ts) > self.max_skew_seconds:
+            raise DeviceAuthError("时间戳超出允许范围")
+
+        key = self.keys.get(device_id)
+        if key is None:
+            raise DeviceAuthError("设备未配置密钥")
+
+        expected = compute_signature(key, method, path, device_id, timestamp, nonce, body)
+        if not hmac.compare_digest(expected, signature.lower()):
+            raise DeviceAuthError("签名不匹配")
+
+        # 签名通过后才记录 nonce，避免伪造请求占用集合
+        if not self.nonces.add(device_id, nonce, now):
+            raise DeviceAuthError("重复的请求 (nonce 已使用)")
+
+        return device_id
+
+
+# 全局实例
+device_keys = DeviceKeyTable(settings.DEVICE_KEY_REFRESH_OVERLAP_SECONDS)
+device_authenticator = DeviceAuthenticator(device_keys, settings.DEVICE_AUTH_MAX_SKEW_SECONDS)
+
+
+# ============================================================
+# FastAPI 依赖
+# ============================================================
+
+async def verify_device_request(request: Request) -> Optional[str]:
+    """
+    校验设备请求签名 (依赖注入)
+
+    返回已认证的设备 ID；未携带签名且未强制要求时返回 None
+    """
+    signature = request.headers.get("X-Signature")
+    if not signature:
+        if settings.DEVICE_AUTH_REQUIRED:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="缺少设备签名"
+            )
+        return None
+
+    body = await request.body()
+    try:
+        return device_authenticator.verify(
+            method=request.method,
+            path=request.url.path,
+            device_id=request.headers.get("X-Device-Id", ""),
+            timestamp=request.headers.get("X-Timestamp", ""),
+            nonce=request.headers.get("X-Nonce", ""),
+            signature=signature,
+            body=body
+        )
+    except DeviceAuthError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"设备签名无效: {e}"
+        )
+
+
+def ensure_device_identity(authenticated_id: Optional[str], device_id: str):
+    """已签名请求中的 device_id 必须与签名设备一致"""
+    if authenticated_id is not None and authenticated_id != device_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="设备 ID 与签名不一致"
+        )
@@ -0,0 +1,191 @@
+"""
+Tremor Guard - Device Presence
+震颤卫士 - 设备在线状态
+
+心跳与上传只更新内存中的在线状态表，后台任务每隔 DEVICE_PRESENCE_FLUSH_SECONDS
+把有变化的设备用一条批量 UPDATE 写回 devices 表，避免每次心跳都锁同一行。
+
+- 在线判定: 最近一次心跳/上传在 DEVICE_OFFLINE_SECONDS 之内
+- 后台清理: 超时的设备标记为离线并写回 (包括其他 worker 或重启前留下的在线记录)
+- 读取: /device/status、/device/list 以内存状态为准；多 worker 部署时本 worker
+  未见过的设备使用数据库中的值 (最多滞后一个写回周期)，两者取较新的一方
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import and_, bindparam, func, update
+
+from app.core.config import settings
+
+
+def _greatest(dialect: str, a, b):
+    """两个值中较大的一个 (SQLite 使用多参数 max())"""
+    if dialect == "sqlite":
+        return func.max(a, b)
+    return func.greatest(a, b)
+
+
+class PresenceEntry:
+    """一台设备的在线状态"""
+
+    __slots__ = ("last_seen", "battery_level", "firmware_version", "dirty")
+
+    def __init__(self, last_seen: datetime):
+        self.last_seen = last_seen
+        self.battery_level: Optional[float] = None
+        self.firmware_version: Optional[str] = None
+        self.dirty = True
+
+
+class DevicePresence:
+    """内存在线状态表，定时批量写回数据库"""
+
+    def __init__(self, offline_seconds: float):
+        self.offline_seconds = offline_seconds
+        self._entries: Dict[str, PresenceEntry] = {}
+        self.flushed = 0
+
+    def touch(self, device_id: str, battery_level: Optional[float] = None,
+              firmware_version: Optional[str] = None, now: Optional[datetime] = None):
+        """记录一次心跳/上传"""
+        now = now or datetime.utcnow()
+        entry = self._entries.get(device_id)
+        if entry is None:
+            entry = self._entries[device_id] = PresenceEntry(now)
+        else:
+            entry.last_seen = max(entry.last_seen, now)
+            entry.dirty = True
+        if battery_level is not None:
+            entry.battery_level = battery_level
+        if firmware_version:
+            entry.firmware_version = firmware_version
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_online(self, last_seen: Optional[datetime], now: Optional[datetime] = None) -> bool:
+        if last_seen is None:
+            return False
+        return last_seen >= (now or datetime.utcnow()) - timedelta(seconds=self.offline_seconds)
+
+    def status(self, device) -> dict:
+        """
+        合并数据库中的设备行与内存状态
+
+        Returns:
+            {"is_online", "last_seen", "battery_level"}
+        """
+        entry = self._entries.get(device.device_id)
+        if entry is None:
+            return {
+                "is_online": bool(device.is_online) and self.is_online(device.last_seen),
+                "last_seen": device.last_seen,
+                "battery_level": device.battery_level,
+            }
+        last_seen = max(entry.last_seen, device.last_seen or entry.last_seen)
+        battery_level = device.battery_level
+        if entry.battery_level is not None and entry.last_seen >= last_seen:
+            battery_level = entry.battery_level
+        return {"is_online": self.is_online(last_seen), "last_seen": last_seen, "battery_level": battery_level}
+
+    async def flush(self) -> int:
+        """把有变化的设备写回数据库 (一条 executemany UPDATE)，返回写回的设备数"""
+        from app.core.database import WORKLOAD_INGEST, engines
+        from app.models.device import Device
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.offline_seconds)
+        dirty = sorted(
+            (device_id, entry) for device_id, entry in self._entries.items() if entry.dirty
+        )
+        if not dirty:
+            return 0
+        params = [{
+            "b_device_id": device_id,
+            "b_last_seen": entry.last_seen,
+            "b_battery_level": entry.battery_level,
+            "b_firmware_version": entry.firmware_version,
+            "b_cutoff": cutoff,
+        } for device_id, entry in dirty]
+        for _, entry in dirty:
+            entry.dirty = False
+
+        table = Device.__table__
+        # 多 worker 同时写回时保留较新的 last_seen
+        last_seen = _greatest(
+            engines[WORKLOAD_INGEST].dialect.name,
+            bindparam("b_last_seen"),
+            func.coalesce(table.c.last_seen, bindparam("b_last_seen")),
+        )
+        statement = (
+            update(table)
+            .where(table.c.device_id == bindparam("b_device_id"))
+            .values(
+                # 在线判定基于合并后的 last_seen，而不是本 worker 可能过时的值
+                is_online=last_seen >= bindparam("b_cutoff"),
+                last_seen=last_seen,
+                battery_level=func.coalesce(bindparam("b_battery_level"), table.c.battery_level),
+                firmware_version=func.coalesce(bindparam("b_firmware_version"), table.c.firmware_version),
+            )
+        )
+        try:
+            async with engines[WORKLOAD_INGEST].begin() as conn:
+                await conn.execute(statement, params)
+        except Exception:
+            # 写回失败时保留脏标记，下个周期重试
+            for _, entry in dirty:
+                entry.dirty = True
+            raise
+        self.flushed += len(params)
+        return len(params)
+
+    async def sweep(self) -> int:
+        """标记超时设备为离线，返回数据库中被标记的设备数"""
+        from app.core.database import WORKLOAD_INGEST, engines
+        from app.models.device import Device
+
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.offline_seconds)
+        # 内存中已超时的设备: 写回一次离线状态后从表中移除
+        expired = [device_id for device_id, entry in self._entries.items() if entry.last_seen < cutoff]
+        for device_id in expired:
+            self._entries[device_id].dirty = True
+        await self.flush()
+        for device_id in expired:
+            entry = self._entries.get(device_id)
+            if entry is not None and entry.last_seen < cutoff and not entry.dirty:
+                del self._entries[device_id]
+
+        table = Device.__table__
+        async with engines[WORKLOAD_INGEST].begin() as conn:
+            result = await conn.execute(
+                update(table)
+                .where(and_(table.c.is_online.is_(True), table.c.last_seen < cutoff))
+                .values(is_online=False)
+            )
+        return result.rowcount or 0
+
+    async def run(self, flush_interval: float, sweep_interval: float):
+        """后台定时写回与离线清理 (在 lifespan 中启动)"""
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time()
+        while True:
+            try:
+                if loop.time() >= next_sweep:
+                    await self.sweep()
+                    next_sweep = loop.time() + sweep_interval
+                else:
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 设备在线状态写回失败: {e}")
+            await asyncio.sleep(flush_interval)
+
+
+# 全局在线状态表
+device_presence = DevicePresence(settings.DEVICE_OFFLINE_SECONDS)
@@ -0,0 +1,53 @@
+"""
+Tremor Guard - Fast JSON Responses
+震颤卫士 - 列表接口快速序列化
+
+大列表接口的默认路径: ORM 对象 → 每行 model_validate → FastAPI 按 response_model
+再校验一次 → jsonable_encoder → json.dumps，1000 行的页面大部分时间花在序列化上。
+
+快速路径 (按路由选择使用，见 app/api/data.py):
+- 查询只选择响应需要的列，得到普通元组，不创建 ORM 对象
+- 元组按字段名组装为 dict，由 orjson 直接序列化 (未安装时退回标准库 json)
+- 直接返回 Response，FastAPI 不再按 response_model 校验
+输出与默认路径一致 (datetime 为 ISO 8601，无时区)。
+
+FAST_LIST_RESPONSES=false 时各路由退回默认路径 (对比或排查问题时使用)。
+"""
+
+import json
+from datetime import date, datetime
+from typing import Iterable, Mapping, Optional, Sequence
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """序列化为 UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """orjson 序列化的 JSON 响应"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_response(fields: Sequence[str], rows: Iterable[tuple],
+                  headers: Optional[Mapping[str, str]] = None) -> FastJSONResponse:
+    """列元组 → [{字段: 值}] JSON 响应 (字段顺序与 select 的列一致)"""
+    return FastJSONResponse([dict(zip(fields, row)) for row in rows], headers=headers)
@@ -0,0 +1,264 @@
+"""
+Tremor Guard - Live Stream Broker
+震颤卫士 - 实时数据推送
+
+上传接口在数据提交后把每条记录发布到 broker，broker 按主题分发给 WebSocket 订阅者:
+    user:{user_id}       某患者的全部设备
+    device:{device_id}   某台设备
+
+- 每条消息只序列化一次 (JSON 文本)，所有订阅者共享同一个字符串
+- 每个连接一个有界队列，消费慢的连接队列满时丢弃最旧的消息 (实时数据只关心最新值)，
+  不会阻塞发布方或其他订阅者
+- 多 worker 部署时通过共享后端 (Redis pub/sub) 交换消息：发布方写入后端，
+  每个 worker 从后端接收后分发给本进程的订阅者；单进程/测试使用进程内后端
+"""
+
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.metrics import LIVE_MESSAGES, LIVE_SUBSCRIBERS
+
+Deliver = Callable[[str, str], None]
+
+_delivered = LIVE_MESSAGES.labels("delivered")
+_dropped = LIVE_MESSAGES.labels("dropped")
+
+
+# ============================================================
+# 订阅
+# ============================================================
+
+class LiveSubscription:
+    """一个连接的订阅 (有界队列，满时丢弃最旧的消息)"""
+
+    def __init__(self, topics: Tuple[str, ...], queue_size: int):
+        self.topics = topics
+        self._queue: deque = deque(maxlen=queue_size)
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+
+    def offer(self, message: str):
+        """放入消息 (同步，不等待)"""
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+            _dropped.inc()
+        self._queue.append(message)
+        self.delivered += 1
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[List[str]]:
+        """
+        取出全部待发送消息
+
+        超时返回空列表，订阅已关闭返回 None
+        (用定时器唤醒而不是 wait_for，每次等待不创建额外的 Task)
+        """
+        if not self._queue and not self.closed:
+            self._ready.clear()
+            timer = None
+            if timeout is not None:
+                timer = asyncio.get_running_loop().call_later(timeout, self._ready.set)
+            try:
+                await self._ready.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        if self.closed:
+            return None
+        messages = list(self._queue)
+        self._queue.clear()
+        return messages
+
+    def close(self):
+        """关闭订阅，唤醒等待中的 get()"""
+        self.closed = True
+        self._ready.set()
+
+    def take_dropped(self) -> int:
+        """上次调用以来丢弃的消息数"""
+        count = self.dropped - self._reported_dropped
+        self._reported_dropped = self.dropped
+        return count
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+
+# ============================================================
+# 共享后端
+# ============================================================
+
+class LiveBackend(ABC):
+    """跨 worker 的消息交换接口"""
+
+    # 只投递给本进程时，没有订阅者的主题可以直接跳过
+    local_only = False
+
+    @abstractmethod
+    async def start(self, deliver: Deliver):
+        """开始接收消息，收到的每条 (topic, message) 调用 deliver"""
+
+    @abstractmethod
+    async def publish(self, items: List[Tuple[str, str]]):
+        """发布 [(topic, message)]"""
+
+    async def close(self):
+        pass
+
+
+class InMemoryLiveBackend(LiveBackend):
+    """进程内后端 (单 worker 部署或测试使用)，发布即投递"""
+
+    local_only = True
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, items: List[Tuple[str, str]]):
+        if self._deliver is None:
+            return
+        for topic, message in items:
+            self._deliver(topic, message)
+
+
+class RedisLiveBackend(LiveBackend):
+    """
+    Redis pub/sub 后端
+
+    所有主题共用频道 tremor:live，消息格式为 "{topic}\\n{message}"，
+    每个 worker 订阅该频道后自行按主题分发 (主题数量不影响 Redis 订阅数)
+    """
+
+    CHANNEL = "tremor:live"
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.CHANNEL)
+
+        async def listen():
+            while True:
+                try:
+                    async for item in pubsub.listen():
+                        topic, _, message = item["data"].partition("\n")
+                        deliver(topic, message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ 实时推送订阅中断，重新连接: {e}")
+                    await asyncio.sleep(1)
+                    await pubsub.subscribe(self.CHANNEL)
+
+        self._listener = asyncio.create_task(listen())
+
+    async def publish(self, items: List[Tuple[str, str]]):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for topic, message in items:
+                pipe.publish(self.CHANNEL, f"{topic}\n{message}")
+            await pipe.execute()
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        await self._redis.close()
+
+
+# ============================================================
+# Broker
+# ============================================================
+
+class LiveBroker:
+    """按主题分发实时消息"""
+
+    def __init__(self, backend: LiveBackend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._topics: Dict[str, Set[LiveSubscription]] = {}
+        self.published = 0
+
+    async def start(self):
+        await self.backend.start(self._deliver)
+
+    async def close(self):
+        await self.backend.close()
+
+    def subscribe(self, topics: Iterable[str]) -> LiveSubscription:
+        subscription = LiveSubscription(tuple(topics), self.queue_size)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        LIVE_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: LiveSubscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+        LIVE_SUBSCRIBERS.dec()
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        if topic is not None:
+            return len(self._topics.get(topic, ()))
+        return len({s for subscribers in self._topics.values() for s in subscribers})
+
+    def _deliver(self, topic: str, message: str):
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+        for subscription in subscribers:
+            subscription.offer(message)
+        _delivered.inc(len(subscribers))
+
+    async def publish(self, events: List[Tuple[Iterable[str], dict]]):
+        """
+        发布事件
+
+        Args:
+            events: [(topics, event)]，每个事件序列化一次后发布到各主题
+        """
+        items = []
+        for topics, event in events:
+            if self.backend.local_only:
+                topics = [t for t in topics if t in self._topics]
+                if not topics:
+                    continue
+            message = json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str)
+            items.extend((topic, message) for topic in topics)
+        if items:
+            self.published += len(events)
+            await self.backend.publish(items)
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def device_topic(device_id: str) -> str:
+    return f"device:{device_id}"
+
+
+def create_live_backend() -> LiveBackend:
+    """根据配置创建共享后端"""
+    if settings.LIVE_STREAM_BACKEND == "redis":
+        return RedisLiveBackend(settings.REDIS_URL)
+    return InMemoryLiveBackend()
+
+
+# 全局 broker
+live_broker = LiveBroker(create_live_backend(), settings.LIVE_STREAM_QUEUE_SIZE)
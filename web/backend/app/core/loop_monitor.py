@@ -0,0 +1,151 @@
+"""
+Tremor Guard - Event Loop Monitor
+震颤卫士 - 事件循环延迟监控
+
+async 接口中的同步重计算 (bcrypt、遍历大结果集、大 JSON 序列化) 会阻塞事件循环，
+导致所有设备上传一起变慢。本模块:
+- 心跳协程以固定间隔唤醒，唤醒滞后即事件循环延迟，导出到 /metrics
+- 看门狗线程发现心跳超过阈值未更新时，抓取事件循环线程当前的调用栈
+  (即正在阻塞的回调)，并归属到当时正在执行的请求路由
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import EVENT_LOOP_LAG, SLOW_CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(self, interval: float, threshold: float, keep: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.reports: Deque[dict] = deque(maxlen=keep)
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        # 正在处理的请求: Task -> ASGI scope (路由匹配后 scope 中有 route)
+        self.active: Dict[asyncio.Task, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._pending: Optional[dict] = None
+        self._stopped = threading.Event()
+
+    # ------------------------------------------------------------
+    # 心跳 (事件循环中)
+    # ------------------------------------------------------------
+
+    async def run(self):
+        """心跳协程 (在 lifespan 中启动)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                self._last_beat = now
+                lag = max(0.0, now - start - self.interval)
+                self.last_lag = lag
+                if lag > self.max_lag:
+                    self.max_lag = lag
+                EVENT_LOOP_LAG.observe(lag)
+
+                report = self._pending
+                if report is not None:
+                    self._pending = None
+                    report["lag_ms"] = round(lag * 1000, 1)
+                    SLOW_CALLBACKS.labels(report["route"]).inc()
+                    logger.warning(
+                        "事件循环阻塞 %.0fms (路由: %s)\n%s",
+                        lag * 1000, report["route"], report["stack"]
+                    )
+        finally:
+            self._stopped.set()
+
+    # ------------------------------------------------------------
+    # 看门狗 (独立线程)
+    # ------------------------------------------------------------
+
+    def _watch(self):
+        captured_beat = None
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._last_beat
+            if beat == captured_beat or time.perf_counter() - beat < self.threshold + self.interval:
+                continue
+            captured_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            report = {
+                "detected_at": datetime.utcnow().isoformat(),
+                "route": self._active_route(),
+                "stack": "".join(traceback.format_stack(frame, limit=30)),
+                "lag_ms": None,
+            }
+            self.reports.append(report)
+            self._pending = report
+
+    def _active_route(self) -> str:
+        """阻塞发生时正在执行的请求路由"""
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        scope = self.active.get(task) if task is not None else None
+        if scope is None:
+            return "background"
+        route = scope.get("route")
+        return f"{scope['method']} {route.path if route is not None else scope['path']}"
+
+    def stats(self) -> dict:
+        """监控摘要 (用于 /health/details)"""
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "slow_callbacks": [
+                {key: report[key] for key in ("detected_at", "route", "lag_ms")}
+                for report in list(self.reports)[-10:]
+            ],
+        }
+
+
+class LoopMonitorMiddleware:
+    """登记正在处理的请求，用于把阻塞归属到路由 (纯 ASGI)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        loop_monitor.active[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            loop_monitor.active.pop(task, None)
+
+
+# 全局监控器
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000.0,
+    threshold=settings.LOOP_SLOW_CALLBACK_MS / 1000.0,
+    keep=settings.LOOP_SLOW_CALLBACK_KEEP,
+)
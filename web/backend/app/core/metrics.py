@@ -0,0 +1,206 @@
+"""
+Tremor Guard - Metrics
+震颤卫士 - Prometheus 指标
+
+/metrics 以 Prometheus 文本格式导出:
+- HTTP 请求延迟 (按路由模板)
+- 数据上传行数、批量大小
+- 数据库连接池占用/溢出/获取连接等待时间
+- 事件循环延迟
+- AI 上游请求延迟
+- 缓存命中率 (cache_requests_total{result="hit|miss"})
+- 实时推送订阅数、消息投递/丢弃数
+
+多 worker 部署时设置 PROMETHEUS_MULTIPROC_DIR，各进程将指标写入该目录下的
+mmap 文件，/metrics 汇总所有进程。该目录需在服务启动前清空。
+"""
+
+import asyncio
+import os
+import time
+
+from app.core.config import settings
+
+# multiprocess 模式必须在导入 prometheus_client 之前设置环境变量
+if settings.PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(settings.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.PROMETHEUS_MULTIPROC_DIR)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+# ============================================================
+# 指标定义
+# ============================================================
+
+HTTP_REQUEST_DURATION = Histogram(
+    "tremor_http_request_duration_seconds",
+    "HTTP 请求耗时",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+INGEST_ROWS = Counter(
+    "tremor_ingest_rows_total",
+    "设备上传的数据行数",
+    ["endpoint"],
+)
+
+INGEST_BATCH_SIZE = Histogram(
+    "tremor_ingest_batch_size",
+    "批量上传的每批行数",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "tremor_db_pool_checked_out",
+    "连接池已借出的连接数",
+    ["workload"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_OVERFLOW = Gauge(
+    "tremor_db_pool_overflow",
+    "连接池溢出连接数",
+    ["workload"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_WAIT = Histogram(
+    "tremor_db_pool_wait_seconds",
+    "获取数据库连接的等待时间",
+    ["workload"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    "tremor_db_pool_timeouts_total",
+    "获取数据库连接超时次数",
+    ["workload"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "tremor_event_loop_lag_seconds",
+    "事件循环延迟 (定时唤醒的滞后时间)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+SLOW_CALLBACKS = Counter(
+    "tremor_event_loop_slow_callbacks_total",
+    "阻塞事件循环超过阈值的次数 (按路由)",
+    ["route"],
+)
+
+AI_UPSTREAM_DURATION = Histogram(
+    "tremor_ai_upstream_duration_seconds",
+    "AI 上游 API 请求耗时",
+    ["outcome"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+
+CACHE_REQUESTS = Counter(
+    "tremor_cache_requests_total",
+    "缓存查询次数 (命中率 = hit / (hit + miss))",
+    ["cache", "result"],
+)
+
+
+LIVE_SUBSCRIBERS = Gauge(
+    "tremor_live_subscribers",
+    "实时推送 WebSocket 订阅数",
+    multiprocess_mode="livesum",
+)
+
+LIVE_MESSAGES = Counter(
+    "tremor_live_messages_total",
+    "实时推送消息数 (delivered: 放入订阅队列，dropped: 队列满时丢弃的最旧消息)",
+    ["result"],
+)
+
+
+def cache_counters(cache: str):
+    """返回预绑定标签的 (hit, miss) 计数器，热路径上避免每次查找标签"""
+    return CACHE_REQUESTS.labels(cache, "hit"), CACHE_REQUESTS.labels(cache, "miss")
+
+
+# ============================================================
+# 请求中间件
+# ============================================================
+
+class MetricsMiddleware:
+    """请求耗时统计 (纯 ASGI)，按路由模板聚合，未匹配的路径归为 unmatched 避免标签膨胀"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+# ============================================================
+# 周期采集 (连接池状态)
+# 事件循环延迟由 app/core/loop_monitor.py 记录
+# ============================================================
+
+async def run_collector(interval: float):
+    """后台采集任务 (在 lifespan 中启动，每个 worker 一个)"""
+    from app.core.database import get_pool_stats
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for workload, stats in get_pool_stats().items():
+                if stats["checked_out"] is not None:
+                    DB_POOL_CHECKED_OUT.labels(workload).set(stats["checked_out"])
+                if stats["overflow"] is not None:
+                    DB_POOL_OVERFLOW.labels(workload).set(max(0, stats["overflow"]))
+        except Exception as e:
+            print(f"⚠️ 指标采集失败: {e}")
+
+
+def render_metrics() -> bytes:
+    """生成 Prometheus 文本格式"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """worker 退出时清理其 gauge 文件 (multiprocess 模式)"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
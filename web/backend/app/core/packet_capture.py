@@ -0,0 +1,254 @@
+"""
+Tremor Guard - Packet Capture
+震颤卫士 - 测试抓包缓冲区
+
+/api/test 接收的调试数据包保存在固定容量的环形缓冲区中:
+- 写入 O(1)，满时覆盖最旧的槽位 (不复制列表)
+- id → 槽位索引，按编号查询 O(1)
+- 按类型、按设备的二级索引 (每个键一个按写入顺序排列的编号队列，淘汰时从队首移除)
+
+多 worker 部署 (共享状态为 Redis) 时，每个数据包同时追加到共享有界列表，
+读取前把其他 worker 写入的数据包同步到本地缓冲区: 本地记录已同步的最大编号 (高水位)，
+全局编号未超过高水位时不读取列表，否则只读取列表末尾的新增部分，编号不超过高水位的
+数据包 (包括已被本地淘汰的) 不再加入；清空操作递增共享的代数计数，
+各 worker 发现代数变化后清空本地缓冲区。
+
+可选写入滚动日志 (TEST_CAPTURE_SPILL_DIR，JSON Lines，每个 worker 一组文件)，
+用于超出内存容量的长时间抓包；benchmarks/replay_packets.py 可把日志或线上抓包
+重新发送到任意接口做压测。
+"""
+
+import json
+import os
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.shared_state import SharedStateStore, shared_state
+
+PACKETS_KEY = "test:packets"
+PACKET_ID_KEY = "test:packet_id"
+GENERATION_KEY = "test:packets_generation"
+
+
+def _packet_id(text: str) -> int:
+    """从序列化文本中读取编号 (record() 写入时 id 总是第一个字段)，不解析整个 JSON"""
+    end = text.find(",")
+    return int(text[7:end if end > 0 else text.index("}")])
+
+
+# ============================================================
+# 环形缓冲区
+# ============================================================
+
+class PacketRing:
+    """固定容量环形缓冲区 + 编号/类型/设备索引"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._slots: List[Optional[dict]] = [None] * self.capacity
+        self._head = 0          # 下一个写入的槽位
+        self._count = 0
+        self._by_id: Dict[int, int] = {}
+        self._by_type: Dict[str, Deque[int]] = {}
+        self._by_device: Dict[str, Deque[int]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, packet_id: int) -> bool:
+        return packet_id in self._by_id
+
+    @staticmethod
+    def _keys(packet: dict) -> Tuple[str, Optional[str]]:
+        return packet.get("type", "unknown"), packet.get("device_id")
+
+    def append(self, packet: dict):
+        slot = self._head
+        evicted = self._slots[slot]
+        if evicted is not None:
+            self._evict(evicted)
+        self._slots[slot] = packet
+        self._by_id[packet["id"]] = slot
+        packet_type, device_id = self._keys(packet)
+        self._by_type.setdefault(packet_type, deque()).append(packet["id"])
+        if device_id:
+            self._by_device.setdefault(device_id, deque()).append(packet["id"])
+        self._head = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _evict(self, packet: dict):
+        # 各索引与槽位按同一写入顺序排列，被淘汰的编号一定在队首
+        del self._by_id[packet["id"]]
+        packet_type, device_id = self._keys(packet)
+        for index, key in ((self._by_type, packet_type), (self._by_device, device_id)):
+            ids = index.get(key)
+            if ids:
+                ids.popleft()
+                if not ids:
+                    del index[key]
+
+    def get(self, packet_id: int) -> Optional[dict]:
+        slot = self._by_id.get(packet_id)
+        return self._slots[slot] if slot is not None else None
+
+    def newest(self) -> Iterator[dict]:
+        """从新到旧遍历"""
+        for i in range(1, self._count + 1):
+            yield self._slots[(self._head - i) % self.capacity]
+
+    def oldest(self) -> Optional[dict]:
+        return self._slots[(self._head - self._count) % self.capacity] if self._count else None
+
+    def query(self, limit: int, offset: int = 0, packet_type: Optional[str] = None,
+              device_id: Optional[str] = None) -> Tuple[int, List[dict]]:
+        """按类型/设备过滤并分页 (从新到旧)，返回 (总数, 当前页)"""
+        if packet_type is None and device_id is None:
+            return self._count, list(islice(self.newest(), offset, offset + limit))
+
+        by_type = self._by_type.get(packet_type, ()) if packet_type is not None else None
+        by_device = self._by_device.get(device_id, ()) if device_id is not None else None
+        if by_type is not None and by_device is not None:
+            # 遍历较短的索引，再检查另一个条件
+            if len(by_type) <= len(by_device):
+                ids = [i for i in by_type if self.get(i).get("device_id") == device_id]
+            else:
+                ids = [i for i in by_device if self.get(i).get("type", "unknown") == packet_type]
+        else:
+            ids = by_type if by_type is not None else by_device
+        page = islice(reversed(ids), offset, offset + limit)
+        return len(ids), [self.get(i) for i in page]
+
+    def type_counts(self) -> Dict[str, int]:
+        return {packet_type: len(ids) for packet_type, ids in self._by_type.items()}
+
+    def device_counts(self) -> Dict[str, int]:
+        return {device_id: len(ids) for device_id, ids in self._by_device.items()}
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+        self._head = self._count = 0
+        self._by_id.clear()
+        self._by_type.clear()
+        self._by_device.clear()
+
+
+# ============================================================
+# 滚动日志
+# ============================================================
+
+class SpillLog:
+    """
+    JSON Lines 滚动日志
+
+    packets-{pid}.jsonl 超过 max_bytes 后重命名为 .1 (原 .1 → .2 ...)，最多保留 backups 个
+    """
+
+    def __init__(self, directory: str, max_bytes: int, backups: int):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"packets-{os.getpid()}.jsonl")
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, line: str):
+        self._file.write(line + "\n")
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+
+# ============================================================
+# 抓包
+# ============================================================
+
+class PacketCapture:
+    """本地环形缓冲区 + 共享存储同步 + 可选滚动日志"""
+
+    def __init__(self, store: SharedStateStore, capacity: int, spill: Optional[SpillLog] = None):
+        self.store = store
+        self.ring = PacketRing(capacity)
+        self.spill = spill
+        self._generation = 0
+        self._synced_id = 0     # 已同步的最大编号
+
+    async def record(self, fields: dict) -> dict:
+        """分配编号 (原子自增) 并保存数据包"""
+        packet = {"id": await self.store.incr(PACKET_ID_KEY), **fields}
+        self.ring.append(packet)
+        text = None
+        if self.spill is not None or not self.store.local_only:
+            text = json.dumps(packet, ensure_ascii=False, default=str)
+        if self.spill is not None:
+            self.spill.write(text)
+        if not self.store.local_only:
+            await self.store.push(PACKETS_KEY, text, self.ring.capacity)
+        return packet
+
+    async def sync(self):
+        """同步其他 worker 写入的数据包 (进程内共享存储无需同步)"""
+        if self.store.local_only:
+            return
+        generation = int(await self.store.get(GENERATION_KEY) or 0)
+        if generation != self._generation:
+            self.ring.clear()
+            self._generation = generation
+        latest = int(await self.store.get(PACKET_ID_KEY) or 0)
+        if latest <= self._synced_id:
+            return
+        # 列表按追加顺序排列，新增部分最多 latest - 高水位 条 (且不超过容量)
+        texts = await self.store.items(PACKETS_KEY, min(latest - self._synced_id, self.ring.capacity))
+        missing = []
+        synced_id = self._synced_id
+        for text in texts:
+            packet_id = _packet_id(text)
+            if packet_id <= self._synced_id:
+                continue
+            synced_id = max(synced_id, packet_id)
+            if packet_id not in self.ring:
+                missing.append((packet_id, text))
+        self._synced_id = synced_id
+        # 按编号顺序合并
+        for _, text in sorted(missing):
+            self.ring.append(json.loads(text))
+
+    async def clear(self) -> int:
+        """清空所有 worker 的数据包，返回本地清空的条数"""
+        count = len(self.ring)
+        self.ring.clear()
+        if not self.store.local_only:
+            self._generation = await self.store.incr(GENERATION_KEY)
+            await self.store.delete(PACKETS_KEY)
+        return count
+
+
+def create_packet_capture() -> PacketCapture:
+    """根据配置创建抓包缓冲区"""
+    spill = None
+    if settings.TEST_CAPTURE_SPILL_DIR:
+        spill = SpillLog(
+            settings.TEST_CAPTURE_SPILL_DIR,
+            settings.TEST_CAPTURE_SPILL_MAX_MB * 1024 * 1024,
+            settings.TEST_CAPTURE_SPILL_BACKUPS,
+        )
+    return PacketCapture(shared_state, settings.TEST_CAPTURE_PACKETS, spill)
+
+
+# 全局抓包缓冲区
+packet_capture = create_packet_capture()
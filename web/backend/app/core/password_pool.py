@@ -0,0 +1,73 @@
+"""
+Tremor Guard - Password Hashing Pool
+震颤卫士 - 密码哈希线程池
+
+bcrypt 哈希/校验耗时约 100-300ms，直接在 async 处理函数中调用会阻塞事件循环，
+导致同一 worker 上的设备上传全部停顿。这里将其放到独立的有界线程池中执行：
+- bcrypt 在计算期间释放 GIL，线程池即可获得真正的并行
+- 正在执行 + 排队的任务数超过上限时立即拒绝 (由调用方转换为 429)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.core.config import settings
+
+
+class PasswordPoolBusyError(Exception):
+    """线程池已满 (正在执行和排队的任务均已达到上限)"""
+
+
+class PasswordHashPool:
+    """有界密码哈希线程池"""
+
+    def __init__(self, max_workers: int, queue_limit: int):
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._capacity = max_workers + queue_limit
+        self._pending = 0
+        self._rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="password-hash"
+        )
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        在线程池中执行 func(*args)
+
+        计数器只在事件循环线程中修改，无需加锁
+        Raises:
+            PasswordPoolBusyError: 执行中 + 排队中的任务已达上限
+        """
+        if self._pending >= self._capacity:
+            self._rejected += 1
+            raise PasswordPoolBusyError()
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        """线程池状态"""
+        return {
+            "max_workers": self.max_workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局密码哈希线程池
+password_pool = PasswordHashPool(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT
+)
@@ -0,0 +1,264 @@
+"""
+Tremor Guard - Request Profiler
+震颤卫士 - 请求采样分析器
+
+按需对单个请求做采样分析，输出火焰图可用的 collapsed stack 文件
+(flamegraph.pl / speedscope / inferno 均可直接读取)。
+
+两种触发方式:
+- 按需: 请求头 X-Profile-Token 等于 PROFILER_TOKEN (或查询参数 __profile=<token>)，
+  结果写入 {PROFILER_OUTPUT_DIR}/ondemand/，文件名通过响应头 X-Profile-File 返回
+- 抽样: PROFILER_SAMPLE_EVERY=N 时每个路由每 N 个请求分析一次，
+  写入 {PROFILER_OUTPUT_DIR}/sampled/{路由}/，每个路由最多保留 PROFILER_MAX_FILES 个文件
+
+实现: 独立采样线程定时采样被分析请求的 Task (墙钟时间):
+- Task 正在执行时读取事件循环线程的栈 (sys._current_frames)
+- Task 挂起等待 (数据库、上游 API 等) 时沿 cr_await 链读取协程栈
+两项配置都为空时不注册中间件，无任何开销。
+"""
+
+import asyncio
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from starlette.routing import Match
+
+from app.core.config import settings
+
+
+# ============================================================
+# 采样线程
+# ============================================================
+
+class ProfileSession:
+    """单个请求的采样结果"""
+
+    __slots__ = ("task", "stacks", "samples", "started_at")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.perf_counter()
+
+    def collapsed(self) -> str:
+        """collapsed stack 格式: 'frame1;frame2;frame3 count'"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # co_qualname 自 Python 3.11 起才有 (部署镜像为 3.10)
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """正在执行的线程栈"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _collapse_suspended(task: asyncio.Task) -> str:
+    """挂起 Task 的协程等待链，末尾标注正在等待的对象"""
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            labels.append(f"<await {type(awaitable).__name__}>")
+            break
+        labels.append(_frame_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return ";".join(labels)
+
+
+class SamplingProfiler:
+    """
+    事件循环采样器
+
+    只有存在进行中的分析会话时采样线程才运行
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sessions: Dict[asyncio.Task, ProfileSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> ProfileSession:
+        """开始分析当前 Task (在事件循环线程中调用)"""
+        task = asyncio.current_task()
+        session = ProfileSession(task)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._sessions[task] = session
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession):
+        with self._lock:
+            self._sessions.pop(session.task, None)
+
+    def _run(self):
+        try:
+            self._sample_until_idle()
+        finally:
+            # 采样异常退出时也清除引用，下一个会话可以重新启动采样线程
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _sample_until_idle(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                running = asyncio.current_task(self._loop)
+                frame = None
+                for task, session in self._sessions.items():
+                    if task is running:
+                        frame = frame or sys._current_frames().get(self._loop_thread_id)
+                        if frame is None:
+                            continue
+                        stack = _collapse(frame)
+                    else:
+                        stack = _collapse_suspended(task)
+                    session.stacks[stack] += 1
+                    session.samples += 1
+
+
+# ============================================================
+# 结果存储
+# ============================================================
+
+_SLUG = re.compile(r"[^A-Za-z0-9]+")
+
+
+def _route_slug(method: str, route: str) -> str:
+    return f"{method}_{_SLUG.sub('_', route).strip('_') or 'root'}"
+
+
+def _write_profile(directory: str, filename: str, content: str, keep: int = 0):
+    """写入结果文件；keep > 0 时只保留最新的 keep 个文件"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+        f.write(content)
+    if keep > 0:
+        files = sorted(name for name in os.listdir(directory) if name.endswith(".folded"))
+        for name in files[:-keep]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+# ============================================================
+# 中间件
+# ============================================================
+
+class ProfilerMiddleware:
+    """请求采样分析中间件 (纯 ASGI)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.profiler = SamplingProfiler(settings.PROFILER_INTERVAL_MS / 1000.0)
+        self.token = settings.PROFILER_TOKEN.encode() if settings.PROFILER_TOKEN else None
+        self.sample_every = settings.PROFILER_SAMPLE_EVERY
+        self._route_counters: Counter = Counter()
+
+    def _requested(self, scope) -> bool:
+        """按需分析: 校验请求头或查询参数中的令牌"""
+        if self.token is None:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                return hmac.compare_digest(value, self.token)
+        if b"__profile=" in scope.get("query_string", b""):
+            values = parse_qs(scope["query_string"].decode()).get("__profile", [])
+            return bool(values) and hmac.compare_digest(values[0].encode(), self.token)
+        return False
+
+    def _route_for(self, scope) -> Optional[str]:
+        """预先匹配路由模板 (路由执行前 scope 中还没有 route)"""
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", None)
+        return None
+
+    def _sampled(self, scope) -> Optional[str]:
+        """抽样分析: 每个路由每 N 个请求一次，返回路由模板"""
+        if self.sample_every <= 0:
+            return None
+        route = self._route_for(scope)
+        if route is None:
+            return None
+        key = (scope["method"], route)
+        self._route_counters[key] += 1
+        return route if self._route_counters[key] % self.sample_every == 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        on_demand = self._requested(scope)
+        sampled_route = None if on_demand else self._sampled(scope)
+        if not on_demand and sampled_route is None:
+            await self.app(scope, receive, send)
+            return
+
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        filename = None
+        if on_demand:
+            filename = f"{stamp}_{_route_slug(scope['method'], scope['path'])}.folded"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and filename:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", filename.encode()))
+                message["headers"] = headers
+            await send(message)
+
+        session = self.profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.stop(session)
+            loop = asyncio.get_running_loop()
+            if on_demand:
+                directory = os.path.join(settings.PROFILER_OUTPUT_DIR, "ondemand")
+                loop.run_in_executor(None, _write_profile, directory, filename, session.collapsed())
+            elif session.samples:
+                directory = os.path.join(
+                    settings.PROFILER_OUTPUT_DIR, "sampled", _route_slug(scope["method"], sampled_route)
+                )
+                loop.run_in_executor(
+                    None, _write_profile, directory, f"{stamp}.folded",
+                    session.collapsed(), settings.PROFILER_MAX_FILES
+                )
+
+
+def profiler_enabled() -> bool:
+    """是否需要注册分析中间件"""
+    return bool(settings.PROFILER_TOKEN) or settings.PROFILER_SAMPLE_EVERY > 0
@@ -0,0 +1,309 @@
+"""
+Tremor Guard - Raw IMU Window Storage
+震颤卫士 - 原始加速度窗口存储
+
+设备上传的原始窗口 (256 样本 × 3 轴 int16) 不写数据库，按设备、按天追加到分块文件:
+
+    {RAW_STORAGE_DIR}/{device_id}/{YYYY-MM-DD}.bin   定长记录，每条 256×3 int16 (1536 字节)
+    {RAW_STORAGE_DIR}/{device_id}/{YYYY-MM-DD}.idx   索引，每条 int64 采集时间戳 (UTC 毫秒)
+
+日期按窗口采集时间划分，离线补传的数据会落到正确的日期文件。
+写入顺序为先 .bin 后 .idx，索引条数即有效记录数；写入中断留下的 .bin 尾部
+会在下次追加时被覆盖。读取使用 numpy.memmap，分析时不复制数据。
+
+写入与清理在进程内使用分段线程锁，跨进程 (多 worker) 使用 .idx 文件上的 flock。
+
+上传格式 (application/octet-stream，小端):
+    头部 16 字节: magic "TGRW" | version u8 | axes u8 | samples u16 | count u16 | reserved u8[6]
+    记录 count 条: timestamp_ms i64 | samples i16[256][3]
+    timestamp_ms 为 0 或明显错误 (设备时钟未同步) 时服务端使用接收时间
+"""
+
+import asyncio
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:     # Windows 本地开发: 仅进程内加锁
+    fcntl = None
+
+
+# ============================================================
+# 格式定义
+# ============================================================
+
+RAW_MAGIC = b"TGRW"
+RAW_VERSION = 1
+WINDOW_SAMPLES = 256
+AXES = 3
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"), ("version", "u1"), ("axes", "u1"),
+    ("samples", "<u2"), ("count", "<u2"), ("reserved", "V6"),
+])
+WIRE_RECORD_DTYPE = np.dtype([("timestamp_ms", "<i8"), ("samples", "<i2", (WINDOW_SAMPLES, AXES))])
+SAMPLES_DTYPE = np.dtype("<i2")
+INDEX_DTYPE = np.dtype("<i8")
+RECORD_BYTES = WINDOW_SAMPLES * AXES * SAMPLES_DTYPE.itemsize
+
+_DEVICE_ID = re.compile(r"^[A-Za-z0-9_\-:.]{1,64}$")
+
+# 写入锁分段数
+LOCK_STRIPES = 64
+
+
+class RawFormatError(ValueError):
+    """上传数据格式错误"""
+    pass
+
+
+def parse_upload(body: bytes, max_windows: int) -> np.ndarray:
+    """解析上传数据，返回 WIRE_RECORD_DTYPE 结构化数组 (引用 body，不复制)"""
+    if len(body) < HEADER_DTYPE.itemsize:
+        raise RawFormatError("数据过短")
+    header = np.frombuffer(body, dtype=HEADER_DTYPE, count=1)[0]
+    if header["magic"] != RAW_MAGIC or header["version"] != RAW_VERSION:
+        raise RawFormatError("不支持的数据格式或版本")
+    if header["axes"] != AXES or header["samples"] != WINDOW_SAMPLES:
+        raise RawFormatError(f"窗口必须为 {WINDOW_SAMPLES} 样本 × {AXES} 轴")
+    count = int(header["count"])
+    if count == 0 or count > max_windows:
+        raise RawFormatError(f"窗口数必须在 1-{max_windows} 之间")
+    expected = HEADER_DTYPE.itemsize + count * WIRE_RECORD_DTYPE.itemsize
+    if len(body) != expected:
+        raise RawFormatError(f"数据长度应为 {expected} 字节，实际为 {len(body)}")
+    return np.frombuffer(body, dtype=WIRE_RECORD_DTYPE, count=count, offset=HEADER_DTYPE.itemsize)
+
+
+def encode_upload(timestamps_ms: np.ndarray, samples: np.ndarray) -> bytes:
+    """编码上传数据 (供模拟器、基准测试与固件对照使用)"""
+    count = len(timestamps_ms)
+    header = np.array([(RAW_MAGIC, RAW_VERSION, AXES, WINDOW_SAMPLES, count, b"")], dtype=HEADER_DTYPE)
+    records = np.empty(count, dtype=WIRE_RECORD_DTYPE)
+    records["timestamp_ms"] = timestamps_ms
+    records["samples"] = samples
+    return header.tobytes() + records.tobytes()
+
+
+# ============================================================
+# 分块存储
+# ============================================================
+
+class RawDay(NamedTuple):
+    """某设备某天的全部窗口 (memmap，只读)"""
+    timestamps_ms: np.ndarray       # (N,) int64
+    samples: np.ndarray             # (N, 256, 3) int16
+
+    def __len__(self) -> int:
+        return len(self.timestamps_ms)
+
+
+_EMPTY_DAY = RawDay(np.empty(0, INDEX_DTYPE), np.empty((0, WINDOW_SAMPLES, AXES), SAMPLES_DTYPE))
+
+
+class RawWindowStore:
+    """按设备、按天的原始窗口分块文件存储 (文件 I/O 为同步操作，异步接口中放到线程池执行)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        # 固定数量的分段锁 (按设备、日期哈希)，不随设备数和天数增长
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    # ------------------------------------------------------------
+    # 路径
+    # ------------------------------------------------------------
+
+    @staticmethod
+    def valid_device_id(device_id: str) -> bool:
+        return bool(_DEVICE_ID.match(device_id)) and device_id not in (".", "..")
+
+    def _paths(self, device_id: str, day: date) -> Tuple[str, str]:
+        base = os.path.join(self.root, device_id, day.isoformat())
+        return base + ".bin", base + ".idx"
+
+    def _lock(self, device_id: str, day: date) -> threading.Lock:
+        return self._locks[hash((device_id, day)) % LOCK_STRIPES]
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(idx_path: str):
+        """
+        打开 (必要时创建) 索引文件并加排他 flock，返回文件描述符
+
+        其他进程可能在等待期间删除了该文件 (purge)，加锁后确认仍是当前路径上的文件，
+        否则重新打开，避免写入已删除的 inode。
+        """
+        while True:
+            fd = os.open(idx_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        current = os.stat(idx_path)
+                    except FileNotFoundError:
+                        current = None
+                    if current is None or current.st_ino != os.fstat(fd).st_ino:
+                        continue
+                yield fd
+                return
+            finally:
+                # 关闭文件描述符同时释放 flock
+                os.close(fd)
+
+    # ------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------
+
+    def append(self, device_id: str, timestamps_ms: np.ndarray, samples: np.ndarray) -> int:
+        """追加窗口，按采集日期分组写入对应的分块文件，返回写入条数"""
+        if not self.valid_device_id(device_id):
+            raise ValueError(f"无效的设备 ID: {device_id!r}")
+        timestamps_ms = np.asarray(timestamps_ms, dtype=INDEX_DTYPE)
+        samples = np.ascontiguousarray(samples, dtype=SAMPLES_DTYPE)
+
+        days = timestamps_ms // 86_400_000
+        for day_number in np.unique(days):
+            mask = days == day_number
+            day = date(1970, 1, 1) + timedelta(days=int(day_number))
+            self._append_day(device_id, day, timestamps_ms[mask], samples[mask])
+        return len(timestamps_ms)
+
+    def _append_day(self, device_id: str, day: date, timestamps_ms: np.ndarray, samples: np.ndarray):
+        bin_path, idx_path = self._paths(device_id, day)
+        with self._lock(device_id, day):
+            os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+            with self._file_lock(idx_path) as idx_fd:
+                count = os.fstat(idx_fd).st_size // INDEX_DTYPE.itemsize
+                # 从最后一条有效记录之后写入，覆盖上次中断留下的尾部
+                with open(bin_path, "r+b" if os.path.exists(bin_path) else "wb") as f:
+                    f.seek(count * RECORD_BYTES)
+                    f.write(samples.tobytes())
+                    f.truncate()
+                with os.fdopen(os.dup(idx_fd), "r+b") as f:
+                    f.seek(count * INDEX_DTYPE.itemsize)
+                    f.write(timestamps_ms.tobytes())
+                    f.truncate()
+
+    # ------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------
+
+    def read_day(self, device_id: str, day: date) -> RawDay:
+        """以 memmap 打开某天的窗口 (无数据时返回空数组)"""
+        if not self.valid_device_id(device_id):
+            return _EMPTY_DAY
+        bin_path, idx_path = self._paths(device_id, day)
+        try:
+            count = min(
+                os.path.getsize(idx_path) // INDEX_DTYPE.itemsize,
+                os.path.getsize(bin_path) // RECORD_BYTES,
+            )
+        except OSError:
+            return _EMPTY_DAY
+        if count == 0:
+            return _EMPTY_DAY
+        return RawDay(
+            np.memmap(idx_path, dtype=INDEX_DTYPE, mode="r", shape=(count,)),
+            np.memmap(bin_path, dtype=SAMPLES_DTYPE, mode="r", shape=(count, WINDOW_SAMPLES, AXES)),
+        )
+
+    def read_range(self, device_id: str, start: datetime, end: datetime) -> Iterator[RawDay]:
+        """按天遍历 [start, end) 内的窗口 (每天一个 memmap 切片，按上传顺序排列)"""
+        start_ms = int((start - datetime(1970, 1, 1)).total_seconds() * 1000)
+        end_ms = int((end - datetime(1970, 1, 1)).total_seconds() * 1000)
+        day = start.date()
+        while day <= end.date():
+            data = self.read_day(device_id, day)
+            if len(data):
+                mask = (data.timestamps_ms >= start_ms) & (data.timestamps_ms < end_ms)
+                if mask.all():
+                    yield data
+                elif mask.any():
+                    selected = np.flatnonzero(mask)
+                    yield RawDay(data.timestamps_ms[selected], data.samples[selected])
+            day += timedelta(days=1)
+
+    def devices(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.root) if self.valid_device_id(name))
+        except FileNotFoundError:
+            return []
+
+    def days(self, device_id: str) -> List[date]:
+        try:
+            names = os.listdir(os.path.join(self.root, device_id))
+        except FileNotFoundError:
+            return []
+        result = []
+        for name in names:
+            if name.endswith(".idx"):
+                try:
+                    result.append(date.fromisoformat(name[:-4]))
+                except ValueError:
+                    continue
+        return sorted(result)
+
+    # ------------------------------------------------------------
+    # 保留策略
+    # ------------------------------------------------------------
+
+    def purge(self, retention_days: int, today: Optional[date] = None) -> int:
+        """删除超过保留天数的分块文件 (保留含今天在内的 retention_days 天)，返回删除的天数"""
+        cutoff = (today or datetime.utcnow().date()) - timedelta(days=retention_days - 1)
+        removed = 0
+        for device_id in self.devices():
+            for day in self.days(device_id):
+                if day >= cutoff:
+                    break
+                bin_path, idx_path = self._paths(device_id, day)
+                with self._lock(device_id, day), self._file_lock(idx_path):
+                    for path in (bin_path, idx_path):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                removed += 1
+            try:
+                os.rmdir(os.path.join(self.root, device_id))
+            except OSError:
+                pass    # 目录非空
+        return removed
+
+    def disk_usage(self) -> Dict[str, int]:
+        """存储占用 (字节数、窗口数)"""
+        total_bytes = windows = 0
+        for device_id in self.devices():
+            for day in self.days(device_id):
+                bin_path, idx_path = self._paths(device_id, day)
+                try:
+                    total_bytes += os.path.getsize(bin_path) + os.path.getsize(idx_path)
+                    windows += os.path.getsize(idx_path) // INDEX_DTYPE.itemsize
+                except OSError:
+                    continue
+        return {"bytes": total_bytes, "windows": windows}
+
+
+async def run_retention(store: RawWindowStore, retention_days: int, interval: float):
+    """定时清理过期分块文件 (在 lifespan 中启动)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            removed = await loop.run_in_executor(None, store.purge, retention_days)
+            if removed:
+                print(f"🧹 已清理 {removed} 个过期原始数据分块")
+        except Exception as e:
+            print(f"⚠️ 原始数据清理失败: {e}")
+        await asyncio.sleep(interval)
+
+
+# 全局存储实例
+raw_store = RawWindowStore(settings.RAW_STORAGE_DIR)
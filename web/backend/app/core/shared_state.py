@@ -0,0 +1,146 @@
+"""
+Tremor Guard - Shared State
+震颤卫士 - 多 worker 共享状态
+
+原先保存在模块全局变量中的小型状态 (设备上报的配置、测试抓包) 改为通过本接口读写，
+多 worker 部署时使用 Redis，所有 worker 看到同一份数据；单进程/测试使用进程内存储。
+
+接口只包含这些模块需要的操作:
+    get / set / delete   字符串值
+    incr                 原子自增 (编号、版本号)
+    push / items         有界列表 (追加并只保留最新 max_len 条；items 可只读取最新 N 条)
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+
+class SharedStateStore(ABC):
+    """共享状态存储接口"""
+
+    # 进程内存储: 只有本 worker 读写，调用方可以跳过同步
+    local_only = False
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """读取字符串值，不存在返回 None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str):
+        """写入字符串值"""
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        """删除键 (字符串、计数器或列表)"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """原子自增，返回自增后的值 (不存在时从 0 开始)"""
+
+    @abstractmethod
+    async def push(self, key: str, value: str, max_len: int) -> int:
+        """追加到列表末尾并只保留最新 max_len 条，返回追加后的长度"""
+
+    @abstractmethod
+    async def items(self, key: str, last: Optional[int] = None) -> List[str]:
+        """列表元素 (从旧到新)，last 不为空时只返回最新 last 条"""
+
+
+class InMemorySharedState(SharedStateStore):
+    """进程内存储 (单 worker 部署或测试使用)"""
+
+    local_only = True
+
+    def __init__(self):
+        self._values: Dict[str, str] = {}
+        self._counters: Dict[str, int] = {}
+        self._lists: Dict[str, Deque[str]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        # 与 Redis 一致: 计数器也可以按字符串读取
+        if key in self._counters:
+            return str(self._counters[key])
+        return self._values.get(key)
+
+    async def set(self, key: str, value: str):
+        self._counters.pop(key, None)
+        self._values[key] = value
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._values.pop(key, None)
+            self._counters.pop(key, None)
+            self._lists.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        value = self._counters.get(key, 0) + amount
+        self._counters[key] = value
+        return value
+
+    async def push(self, key: str, value: str, max_len: int) -> int:
+        items = self._lists.get(key)
+        if items is None or items.maxlen != max_len:
+            items = self._lists[key] = deque(items or (), maxlen=max_len)
+        items.append(value)
+        return len(items)
+
+    async def items(self, key: str, last: Optional[int] = None) -> List[str]:
+        items = self._lists.get(key, ())
+        if last is None:
+            return list(items)
+        if last <= 0:
+            return []
+        return list(items)[-last:]
+
+
+class RedisSharedState(SharedStateStore):
+    """
+    Redis 存储
+
+    键统一加 tremor:state: 前缀；push 在一个 MULTI 事务中执行 RPUSH + LTRIM
+    """
+
+    PREFIX = "tremor:state:"
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self.PREFIX + key)
+
+    async def set(self, key: str, value: str):
+        await self._redis.set(self.PREFIX + key, value)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*(self.PREFIX + key for key in keys))
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self._redis.incrby(self.PREFIX + key, amount)
+
+    async def push(self, key: str, value: str, max_len: int) -> int:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self.PREFIX + key, value)
+            pipe.ltrim(self.PREFIX + key, -max_len, -1)
+            length, _ = await pipe.execute()
+        return min(length, max_len)
+
+    async def items(self, key: str, last: Optional[int] = None) -> List[str]:
+        if last is not None and last <= 0:
+            return []
+        return await self._redis.lrange(self.PREFIX + key, -last if last else 0, -1)
+
+
+def create_shared_state() -> SharedStateStore:
+    """根据配置创建共享状态存储"""
+    if settings.SHARED_STATE_BACKEND == "redis":
+        return RedisSharedState(settings.REDIS_URL)
+    return InMemorySharedState()
+
+
+# 全局共享状态
+shared_state = create_shared_state()
@@ -0,0 +1,238 @@
+"""
+Tremor Guard - SQL Instrumentation
+震颤卫士 - SQL 查询统计
+
+通过 SQLAlchemy 引擎事件 + ASGI 中间件，按路由记录:
+- 语句数量、数据库总耗时、最慢语句
+- 同一语句形状 (参数化 SQL) 在一次请求中的重复次数 —— 用于发现 N+1 循环查询
+
+预算 (SQL_QUERY_BUDGET / SQL_REPEAT_BUDGET) 超出时按 SQL_BUDGET_MODE 记录日志或抛出异常。
+基准测试中可使用 count_queries() / assert_max_queries() 断言查询数量。
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 将 IN (?, ?, ?) / IN ($1, $2, ...) 等展开参数折叠为同一形状
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%s|%\(\w+\)s)\s*,)+\s*(?:\?|\$\d+|%s|%\(\w+\)s)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """语句形状: 折叠展开的参数列表和空白"""
+    return _WHITESPACE.sub(" ", _PLACEHOLDER_LIST.sub("(?...)", statement)).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    """单个请求的查询数量或重复语句超出预算"""
+
+
+# ============================================================
+# 单次请求的查询记录
+# ============================================================
+
+class QueryProfile:
+    """一次请求 (或一个代码块) 内的查询记录"""
+
+    __slots__ = ("route", "count", "total_time", "slowest_time", "slowest_statement", "shapes")
+
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+        self.shapes[statement_shape(statement)] += 1
+
+    def max_repeat(self):
+        """重复次数最多的语句形状 (shape, count)"""
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+    def check_budget(self, max_queries: int, max_repeats: int) -> Optional[str]:
+        """检查预算，超出时返回描述，否则返回 None (预算为 0 表示不限制)"""
+        if max_queries and self.count > max_queries:
+            return f"{self.route or '代码块'} 执行了 {self.count} 条 SQL (预算 {max_queries})"
+        shape, repeats = self.max_repeat()
+        if max_repeats and repeats > max_repeats:
+            return f"{self.route or '代码块'} 重复执行同一语句 {repeats} 次 (预算 {max_repeats}，疑似 N+1): {shape[:200]}"
+        return None
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("sql_query_profile", default=None)
+
+# count_queries() 使用的全局捕获列表 (跨线程/跨任务，仅用于测试与基准)
+_captures: List[QueryProfile] = []
+
+# 按路由聚合的统计
+route_sql_stats: Dict[str, dict] = {}
+
+
+# ============================================================
+# 引擎事件
+# ============================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._tg_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_tg_query_start", None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, duration)
+        if settings.SQL_BUDGET_MODE == "raise":
+            problem = profile.check_budget(settings.SQL_QUERY_BUDGET, settings.SQL_REPEAT_BUDGET)
+            if problem:
+                raise QueryBudgetExceeded(problem)
+
+    for capture in _captures:
+        capture.record(statement, duration)
+
+
+def instrument_engines(engines: Iterable[AsyncEngine]):
+    """为引擎注册查询计时事件"""
+    for eng in engines:
+        sync_engine = eng.sync_engine
+        if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ============================================================
+# 路由统计
+# ============================================================
+
+def _record_route(profile: QueryProfile):
+    stats = route_sql_stats.get(profile.route)
+    if stats is None:
+        stats = route_sql_stats[profile.route] = {
+            "requests": 0,
+            "statements_total": 0,
+            "statements_max": 0,
+            "db_time_total_ms": 0.0,
+            "slowest_statement_ms": 0.0,
+            "slowest_statement": None,
+            "budget_violations": 0,
+        }
+    stats["requests"] += 1
+    stats["statements_total"] += profile.count
+    stats["statements_max"] = max(stats["statements_max"], profile.count)
+    stats["db_time_total_ms"] += profile.total_time * 1000
+    if profile.slowest_time * 1000 > stats["slowest_statement_ms"]:
+        stats["slowest_statement_ms"] = profile.slowest_time * 1000
+        stats["slowest_statement"] = statement_shape(profile.slowest_statement or "")[:500]
+
+
+def get_route_sql_stats() -> Dict[str, dict]:
+    """按路由的 SQL 统计"""
+    return {
+        route: {
+            **stats,
+            "statements_avg": round(stats["statements_total"] / stats["requests"], 2) if stats["requests"] else 0,
+            "db_time_total_ms": round(stats["db_time_total_ms"], 3),
+            "slowest_statement_ms": round(stats["slowest_statement_ms"], 3),
+        }
+        for route, stats in route_sql_stats.items()
+    }
+
+
+class SQLInstrumentationMiddleware:
+    """
+    SQL 统计中间件 (纯 ASGI，开销仅为一次 ContextVar 设置)
+
+    响应附带 Server-Timing 头，浏览器开发者工具可直接查看数据库耗时
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and profile.count:
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={profile.total_time * 1000:.2f};desc="{profile.count} queries"'.encode()
+                ))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            route = scope.get("route")
+            if route is not None and profile.count:
+                profile.route = f"{scope['method']} {route.path}"
+                problem = profile.check_budget(settings.SQL_QUERY_BUDGET, settings.SQL_REPEAT_BUDGET)
+                _record_route(profile)
+                if problem:
+                    route_sql_stats[profile.route]["budget_violations"] += 1
+                    if settings.SQL_BUDGET_MODE in ("log", "raise"):
+                        logger.warning("SQL 预算超出: %s", problem)
+
+
+# ============================================================
+# 测试/基准辅助
+# ============================================================
+
+@contextmanager
+def count_queries():
+    """
+    统计代码块内执行的全部 SQL (包括 TestClient 在其他线程中执行的请求)
+
+    Usage:
+        with count_queries() as q:
+            client.get("/api/analysis/weekly", headers=headers)
+        print(q.count, q.max_repeat())
+    """
+    profile = QueryProfile()
+    _captures.append(profile)
+    try:
+        yield profile
+    finally:
+        _captures.remove(profile)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int = 0, max_repeats: int = 0):
+    """断言代码块内的查询数量/重复次数不超过预算"""
+    with count_queries() as profile:
+        yield profile
+    problem = profile.check_budget(max_queries, max_repeats)
+    if problem:
+        raise AssertionError(problem)
@@ -0,0 +1,262 @@
+"""
+Tremor Guard - Token Revocation
+震颤卫士 - Token 吊销
+
+登出/吊销的 Token 以 jti 记录，直到 Token 自然过期。
+每个请求的吊销检查在内存中完成:
+    1. 布隆过滤器 (全部已吊销 jti)  —— 未命中即确定未吊销，常见路径 < 1µs
+    2. 近期精确集合 (最近吊销的 jti) —— 命中即确定已吊销
+    3. 以上都无法确定 (布隆误判) 时才查询共享存储
+
+多 worker 之间通过共享存储 (Redis) 同步，测试/单进程时使用进程内存储。
+"""
+
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import cache_counters
+
+
+# ============================================================
+# 布隆过滤器
+# ============================================================
+
+class BloomFilter:
+    """
+    简单布隆过滤器
+
+    使用 Python 内置 hash 做双重哈希，仅在本进程内有效 (每个 worker 各自构建)
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, item: str):
+        h = hash(item)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        bits, size = self._bits, self.size
+        for i in range(self.hash_count):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        # 热路径: 遇到第一个未置位的 bit 即返回，过滤器较空时通常只需一次探测
+        if not self.count:
+            return False
+        h = hash(item)
+        pos = h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        bits, size = self._bits, self.size
+        for _ in range(self.hash_count):
+            pos %= size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+            pos += h2
+        return True
+
+
+# ============================================================
+# 共享存储
+# ============================================================
+
+class RevocationStore(ABC):
+    """吊销记录共享存储接口"""
+
+    @abstractmethod
+    async def add(self, jti: str, expires_at: float, revoked_at: float):
+        """记录吊销的 jti"""
+
+    @abstractmethod
+    async def contains(self, jti: str) -> bool:
+        """jti 是否已吊销 (仅在本地无法确定时调用)"""
+
+    @abstractmethod
+    async def changes_since(self, since: float) -> List[Tuple[str, float, float]]:
+        """返回 revoked_at > since 且未过期的记录 [(jti, expires_at, revoked_at)]"""
+
+
+class InMemoryRevocationStore(RevocationStore):
+    """进程内存储 (单 worker 部署或测试使用)"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, float]] = {}
+
+    async def add(self, jti: str, expires_at: float, revoked_at: float):
+        self._entries[jti] = (expires_at, revoked_at)
+
+    async def contains(self, jti: str) -> bool:
+        entry = self._entries.get(jti)
+        return entry is not None and entry[0] > time.time()
+
+    async def changes_since(self, since: float) -> List[Tuple[str, float, float]]:
+        now = time.time()
+        expired = [jti for jti, (exp, _) in self._entries.items() if exp <= now]
+        for jti in expired:
+            del self._entries[jti]
+        return [
+            (jti, exp, revoked_at)
+            for jti, (exp, revoked_at) in self._entries.items()
+            if revoked_at > since
+        ]
+
+
+class RedisRevocationStore(RevocationStore):
+    """
+    Redis 存储
+
+    - revoked_jti:{jti}  带 TTL 的精确记录
+    - revoked_jti:log    有序集合，score 为吊销时间，用于增量同步
+    """
+
+    LOG_KEY = "revoked_jti:log"
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+
+    async def add(self, jti: str, expires_at: float, revoked_at: float):
+        ttl = max(1, int(expires_at - revoked_at))
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(f"revoked_jti:{jti}", int(expires_at), ex=ttl)
+            pipe.zadd(self.LOG_KEY, {f"{jti}|{expires_at}": revoked_at})
+            await pipe.execute()
+
+    async def contains(self, jti: str) -> bool:
+        return bool(await self._redis.exists(f"revoked_jti:{jti}"))
+
+    async def changes_since(self, since: float) -> List[Tuple[str, float, float]]:
+        now = time.time()
+        # 最长 Token 有效期之前的日志可以清理
+        horizon = now - settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        await self._redis.zremrangebyscore(self.LOG_KEY, "-inf", horizon)
+        rows = await self._redis.zrangebyscore(self.LOG_KEY, f"({since}", "+inf", withscores=True)
+        changes = []
+        for member, revoked_at in rows:
+            jti, _, exp = member.rpartition("|")
+            if float(exp) > now:
+                changes.append((jti, float(exp), revoked_at))
+        return changes
+
+
+# ============================================================
+# 本地吊销列表
+# ============================================================
+
+class TokenRevocationList:
+    """本地吊销列表 (布隆过滤器 + 近期精确集合)，定期与共享存储同步"""
+
+    def __init__(self, store: RevocationStore, capacity: int, error_rate: float, recent_seconds: float):
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recent_seconds = recent_seconds
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._recent: Dict[str, float] = {}   # jti -> revoked_at
+        self._last_sync = 0.0
+        self.store_lookups = 0
+        self._hits, self._misses = cache_counters("token_revocation")
+
+    def _remember(self, jti: str, revoked_at: float):
+        if jti not in self._recent:
+            self._bloom.add(jti)
+        self._recent[jti] = revoked_at
+
+    def check_local(self, jti: str) -> Optional[bool]:
+        """仅用本地结构判断: True=已吊销, False=未吊销, None=需查询共享存储"""
+        if jti not in self._bloom:
+            return False
+        if jti in self._recent:
+            return True
+        return None
+
+    async def is_revoked(self, jti: str) -> bool:
+        """jti 是否已吊销"""
+        result = self.check_local(jti)
+        if result is not None:
+            self._hits.inc()
+            return result
+        self.store_lookups += 1
+        self._misses.inc()
+        return await self.store.contains(jti)
+
+    async def revoke(self, jti: str, expires_at: float):
+        """吊销 Token (本 worker 立即生效，其他 worker 下次同步时生效)"""
+        now = time.time()
+        if expires_at <= now:
+            return
+        await self.store.add(jti, expires_at, now)
+        self._remember(jti, now)
+
+    def _recent_cutoff(self) -> float:
+        # 近期集合至少保留到记录移出同步重叠窗口，重叠部分据此去重
+        return min(time.time(), self._last_sync) - self.recent_seconds
+
+    async def sync(self):
+        """
+        从共享存储拉取增量，并清理过期的近期记录
+
+        revoked_at 在写入共享存储之前生成，晚写入的记录可能带着比已同步记录更早的时间，
+        因此每次多拉取 recent_seconds 的重叠窗口 (已在近期集合中的 jti 不重复加入布隆过滤器)
+        """
+        changes = await self.store.changes_since(self._last_sync - self.recent_seconds)
+        for jti, _, revoked_at in changes:
+            self._remember(jti, revoked_at)
+            self._last_sync = max(self._last_sync, revoked_at)
+
+        cutoff = self._recent_cutoff()
+        stale = [jti for jti, revoked_at in self._recent.items() if revoked_at < cutoff]
+        for jti in stale:
+            del self._recent[jti]
+
+        # 布隆过滤器接近容量时，用共享存储中未过期的记录重建
+        if self._bloom.count >= self.capacity:
+            await self.rebuild()
+
+    async def rebuild(self):
+        """重建布隆过滤器 (丢弃已过期的 jti)，并把同步水位设为最新记录"""
+        entries = await self.store.changes_since(0)
+        bloom = BloomFilter(max(self.capacity, len(entries) * 2), self.error_rate)
+        for jti, _, revoked_at in entries:
+            bloom.add(jti)
+            self._last_sync = max(self._last_sync, revoked_at)
+        cutoff = self._recent_cutoff()
+        for jti, _, revoked_at in entries:
+            if revoked_at >= cutoff:
+                self._recent[jti] = revoked_at
+        self._bloom = bloom
+
+    async def run_sync(self, interval: float):
+        """后台定时同步 (在 lifespan 中启动)"""
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Token 吊销列表同步失败: {e}")
+            await asyncio.sleep(interval)
+
+
+def create_revocation_store() -> RevocationStore:
+    """根据配置创建共享存储"""
+    if settings.TOKEN_REVOCATION_BACKEND == "redis":
+        return RedisRevocationStore(settings.REDIS_URL)
+    return InMemoryRevocationStore()
+
+
+# 全局吊销列表
+revocation_list = TokenRevocationList(
+    store=create_revocation_store(),
+    capacity=settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+    error_rate=0.01,
+    recent_seconds=settings.TOKEN_REVOCATION_RECENT_SECONDS
+)
@@ -7,14 +7,23 @@ FastAPI 应用配置和路由注册
 """
 
 import os
-from fastapi import FastAPI, Request
+import asyncio
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
+from sqlalchemy import text
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
+from app.core.database import engine, engines, replica_engines
+from app.core.metrics import MetricsMiddleware, CONTENT_TYPE_LATEST, render_metrics
+from app.core.profiler import ProfilerMiddleware, profiler_enabled
+from app.core.loop_monitor import LoopMonitorMiddleware, loop_monitor
+from app.core.sql_instrumentation import SQLInstrumentationMiddleware, instrument_engines
 from app.api import auth, device, data, analysis, ai, report, test, config, medication, rehabilitation
+from app.api.auth import get_current_admin
+from app.models.user import User
 
 # 静态文件目录（前端构建产物）
 STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
@@ -32,13 +41,91 @@ async def lifespan(app: FastAPI):
     await init_db()
     print("✅ 数据库连接已初始化")
 
+    # 加载设备签名密钥表，并定时增量刷新
+    from app.core.device_auth import device_keys
+    await device_keys.refresh()
+    key_refresher = asyncio.create_task(
+        device_keys.run_refresher(settings.DEVICE_KEY_REFRESH_SECONDS)
+    )
+    print(f"✅ 设备密钥表已加载 ({len(device_keys)} 台设备)")
+
+    # 设备在线状态 (定时批量写回，超时标记离线)
+    from app.core.device_presence import device_presence
+    presence_flusher = asyncio.create_task(
+        device_presence.run(settings.DEVICE_PRESENCE_FLUSH_SECONDS, settings.DEVICE_OFFLINE_SWEEP_SECONDS)
+    )
+
+    # 设备检测参数配置缓存 (按版本号增量刷新)
+    from app.services.device_config import device_config_store
+    await device_config_store.refresh()
+    config_refresher = asyncio.create_task(
+        device_config_store.run_refresher(settings.CONFIG_REFRESH_SECONDS)
+    )
+
+    # Token 吊销列表 (与共享存储定时同步)
+    from app.core.token_revocation import revocation_list
+    await revocation_list.rebuild()
+    revocation_syncer = asyncio.create_task(
+        revocation_list.run_sync(settings.TOKEN_REVOCATION_SYNC_SECONDS)
+    )
+
+    # 事件循环延迟监控
+    loop_watcher = None
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_watcher = asyncio.create_task(loop_monitor.run())
+
+    # 监控指标采集 (连接池状态)
+    metrics_collector = None
+    if settings.METRICS_ENABLED:
+        from app.core.metrics import run_collector
+        metrics_collector = asyncio.create_task(run_collector(settings.METRICS_COLLECT_SECONDS))
+
+    # 原始窗口分块文件保留策略
+    raw_retention = None
+    if settings.RAW_RETENTION_DAYS > 0:
+        from app.core.raw_storage import raw_store, run_retention
+        raw_retention = asyncio.create_task(
+            run_retention(raw_store, settings.RAW_RETENTION_DAYS, settings.RAW_RETENTION_SWEEP_SECONDS)
+        )
+
+    # 继续上次未完成的历史数据重新判定任务
+    if settings.RECLASSIFY_ON_CONFIG_CHANGE:
+        from app.services.reclassification import resume_jobs
+        resumed = await resume_jobs()
+        if resumed:
+            print(f"🔁 继续重新判定任务: {resumed}")
+
+    # 实时推送 broker (多 worker 部署时订阅共享后端)
+    from app.core.live_stream import live_broker
+    await live_broker.start()
+
     # TODO: 初始化 Redis 连接
 
     yield
 
     # 关闭时执行
     print(f"👋 {settings.APP_NAME} 关闭中...")
-    # TODO: 关闭数据库连接
+    key_refresher.cancel()
+    presence_flusher.cancel()
+    config_refresher.cancel()
+    revocation_syncer.cancel()
+    if loop_watcher:
+        loop_watcher.cancel()
+    if raw_retention:
+        raw_retention.cancel()
+    if metrics_collector:
+        metrics_collector.cancel()
+        from app.core.metrics import mark_process_dead
+        mark_process_dead()
+    await live_broker.close()
+    from app.core.password_pool import password_pool
+    password_pool.shutdown()
+    try:
+        await device_presence.flush()
+    except Exception as e:
+        print(f"⚠️ 设备在线状态写回失败: {e}")
+    from app.core.database import close_db
+    await close_db()
     # TODO: 关闭 Redis 连接
 
 
@@ -59,8 +146,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",  # 游标分页 (/api/data/history 等)
+        # 二进制时频图 (/api/analysis/spectrogram?format=binary) 的形状与坐标信息
+        "X-Spectrogram-Shape",
+        "X-Spectrogram-Dtype",
+        "X-Spectrogram-Bin-Hz",
+        "X-Spectrogram-Bucket",
+        "X-Spectrogram-Start",
+    ],
 )
 
+# SQL 查询统计 (按路由记录语句数、数据库耗时，检测 N+1)
+instrument_engines(list(engines.values()) + list(replica_engines.values()))
+app.add_middleware(SQLInstrumentationMiddleware)
+
+# 请求耗时指标
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# 事件循环阻塞归属到路由
+if settings.LOOP_MONITOR_ENABLED:
+    app.add_middleware(LoopMonitorMiddleware)
+
+# 请求采样分析 (未配置时不注册)
+if profiler_enabled():
+    app.add_middleware(ProfilerMiddleware)
+
 
 # ============================================================
 # 路由注册 (Route Registration)
@@ -120,16 +232,81 @@ async def api_info():
     }
 
 
+async def _check_database() -> str:
+    """执行 SELECT 1 检查数据库连接"""
+    try:
+        async with engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=2.0)
+        return "connected"
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
+def _redis_backends() -> list:
+    """配置为 Redis 的后端"""
+    backends = {
+        "token_revocation": settings.TOKEN_REVOCATION_BACKEND,
+        "shared_state": settings.SHARED_STATE_BACKEND,
+        "live_stream": settings.LIVE_STREAM_BACKEND,
+    }
+    return [name for name, backend in backends.items() if backend == "redis"]
+
+
+async def _check_redis() -> str:
+    """检查 Redis 连接 (仅在任一后端配置为 Redis 时)"""
+    if not _redis_backends():
+        return "not_configured"
+    try:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(settings.REDIS_URL)
+        try:
+            await asyncio.wait_for(client.ping(), timeout=2.0)
+        finally:
+            await client.aclose()
+        return "connected"
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口 (数据库/Redis 不可用时返回 503，无需认证，只返回连接状态)"""
+    database, redis = await asyncio.gather(_check_database(), _check_redis())
+    healthy = database == "connected" and redis in ("connected", "not_configured")
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "healthy" if healthy else "degraded",
+            "database": database,
+            "redis": redis
+        }
+    )
+
+
+@app.get("/health/details")
+async def health_details(admin: User = Depends(get_current_admin)):
+    """运行状态详情 (连接池、各路由 SQL 统计、事件循环)，仅管理员可见"""
+    from app.core.database import get_db_stats, get_pool_stats
+    from app.core.sql_instrumentation import get_route_sql_stats
+    database, redis = await asyncio.gather(_check_database(), _check_redis())
     return {
-        "status": "healthy",
-        "database": "connected",  # TODO: 实际检查数据库连接
-        "redis": "connected"      # TODO: 实际检查 Redis 连接
+        "database": database,
+        "redis": redis,
+        "redis_backends": _redis_backends(),
+        "db_sessions": get_db_stats(),
+        "db_pools": get_pool_stats(),
+        "sql_routes": get_route_sql_stats(),
+        "event_loop": loop_monitor.stats()
     }
 
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus 指标 (文本格式)"""
+        return Response(content=render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 # ============================================================
 # 前端静态文件服务 (Frontend Static Files)
 # 单容器部署时，后端同时服务前端静态文件
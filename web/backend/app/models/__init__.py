@@ -4,7 +4,8 @@ Tremor Guard - Database Models
 """
 
 from app.models.user import User
-from app.models.device import Device
-from app.models.tremor_data import TremorData, TremorSession
+from app.models.device import Device, DeviceConfig, DeviceCredential
+from app.models.tremor_data import TremorData, TremorSession, TremorSpectrum, TremorReclassificationJob
 
-__all__ = ["User", "Device", "TremorData", "TremorSession"]
+__all__ = ["User", "Device", "DeviceConfig", "DeviceCredential", "TremorData", "TremorSession", "TremorSpectrum",
+           "TremorReclassificationJob"]
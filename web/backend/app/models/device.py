@@ -4,7 +4,7 @@ Tremor Guard - Device Model
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -38,3 +38,37 @@ class Device(Base):
 
     # 关系
     tremor_sessions = relationship("TremorSession", back_populates="device")
+
+
+class DeviceCredential(Base):
+    """设备签名密钥表 - 用于 HMAC 请求签名校验"""
+    __tablename__ = "device_credentials"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String(100), unique=True, index=True, nullable=False)  # 硬件唯一ID
+    secret = Column(String(128), nullable=False)  # HMAC 密钥 (hex)
+    is_active = Column(Boolean, default=True)
+
+    # 时间戳 (updated_at 用于服务端密钥表增量刷新)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class DeviceConfig(Base):
+    """
+    检测参数配置表 - 全局 / 分组 / 单台设备三级
+
+    version 为全表单调递增的版本号 (每次保存分配新值)，设备按版本号判断是否需要更新，
+    同时用于服务端配置缓存的增量刷新。params 为空表示继承上一级 (删除覆盖时保留该行)
+    """
+    __tablename__ = "device_configs"
+    __table_args__ = (UniqueConstraint("scope", "scope_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(16), nullable=False)  # global / group / device
+    scope_key = Column(String(100), nullable=False, default="")  # 分组名或设备 ID，全局为空
+    group_name = Column(String(100), nullable=True)  # 设备所属分组 (仅 device 级)
+    params = Column(JSON(none_as_null=True), nullable=True)
+    version = Column(Integer, unique=True, index=True, nullable=False)
+    source = Column(String(16), nullable=False, default="web")  # default / device / web
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -4,8 +4,8 @@ Tremor Guard - Tremor Data Models
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, JSON, LargeBinary, Index
+from sqlalchemy.orm import deferred, relationship
 
 from app.core.database import Base
 
@@ -38,6 +38,11 @@ class TremorSession(Base):
     # 状态
     is_active = Column(Boolean, default=True)
 
+    # 历史会话按 (start_time, id) 游标分页
+    __table_args__ = (
+        Index("ix_tremor_sessions_user_start", "user_id", "start_time", "id"),
+    )
+
     # 关系
     tremor_data = relationship("TremorData", back_populates="session")
 
@@ -73,10 +78,61 @@ class TremorData(Base):
     severity = Column(Integer, default=0)  # 0-4
     severity_label = Column(String(50), nullable=True)
 
-    # 原始频谱数据 (可选，用于后续分析)
-    spectrum_data = Column(JSON, nullable=True)
+    # 频谱数据 (可选，用于后续分析) 以二进制存于 tremor_spectra，
+    # 不随列表查询加载，按需用 app.services.spectrum_storage.load_spectra() 读取
+    spectrum = relationship("TremorSpectrum", uselist=False, lazy="noload", cascade="all, delete-orphan",
+                            passive_deletes=True)
+
+    # 旧版 JSON 频谱及无法识别格式的原始上传 (python -m app.services.spectrum_storage --migrate 转换为二进制)
+    spectrum_data = deferred(Column(JSON(none_as_null=True), nullable=True))
 
     # 索引优化
     __table_args__ = (
-        # 复合索引用于时间范围查询
+        # 复合索引用于时间范围查询及会话数据按 (timestamp, id) 游标分页
+        Index("ix_tremor_data_session_timestamp", "session_id", "timestamp", "id"),
     )
+
+
+class TremorSpectrum(Base):
+    """单次检测的幅度谱 - 紧凑二进制存储 (每个 bin 2/4 字节，或 1 字节量化)"""
+    __tablename__ = "tremor_spectra"
+
+    data_id = Column(Integer, ForeignKey("tremor_data.id", ondelete="CASCADE"), primary_key=True)
+
+    # 编码: f16 / f32 (小端浮点) / u8 (按 scale 线性量化，值 = code × scale)
+    encoding = Column(String(8), nullable=False)
+    bins = Column(Integer, nullable=False)
+    bin_hz = Column(Float, nullable=False)  # 频率分辨率 Hz/bin
+    scale = Column(Float, nullable=True)  # 仅 u8 使用
+    data = Column(LargeBinary, nullable=False)
+
+
+class TremorReclassificationJob(Base):
+    """历史数据重新判定任务 - 检测参数变更后按新参数重算 detected/severity"""
+    __tablename__ = "tremor_reclassification_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # 范围: global (全部设备) / group (分组内设备) / device (单台设备)，scope_key 为分组名或设备 ID
+    scope = Column(String(16), nullable=False, default="global")
+    scope_key = Column(String(100), nullable=False, default="")
+
+    # 创建任务时该范围的配置 (展示用；判定时每台设备使用当时的生效配置)
+    config_version = Column(Integer, nullable=False)
+    params = Column(JSON, nullable=False)
+
+    # 状态: pending / running / completed / failed / superseded
+    status = Column(String(20), default="pending", index=True)
+    error = Column(String(500), nullable=True)
+
+    # 进度 (按 tremor_data.id 递增处理，last_id 之前的数据已完成，可断点续跑)
+    last_id = Column(Integer, default=0)
+    max_id = Column(Integer, default=0)  # 创建任务时的最大 id，之后上传的数据由设备按新参数判定
+    total_rows = Column(Integer, default=0)
+    processed_rows = Column(Integer, default=0)
+    changed_rows = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # 每块完成时更新，用于判断任务是否中断
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,234 @@
+"""
+Tremor Guard - Device Config Store
+震颤卫士 - 设备检测参数配置
+
+三级配置 (device_configs 表): 单台设备 > 设备所属分组 > 全局 > 默认值
+- 每次保存从全表递增的序列中分配新版本号，设备生效配置的版本号只增不减:
+  生效版本 = 从设备级开始逐级查找直到找到参数为止，途经各级中最大的版本号
+  (删除覆盖、调整分组都会写入新版本，设备因此重新拉取)
+- 每个 worker 在内存中缓存全部配置行，按版本号增量刷新 (CONFIG_REFRESH_SECONDS)，
+  /config/current 不访问数据库；长轮询的请求在本 worker 保存或刷新到新版本时立即返回
+- 历史数据重新判定时每台设备按其生效配置判定 (见 app/services/reclassification.py)
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models.device import DeviceConfig
+
+SCOPE_GLOBAL = "global"
+SCOPE_GROUP = "group"
+SCOPE_DEVICE = "device"
+
+# 未保存过任何配置时的版本号
+BASE_VERSION = 1
+
+# 保存时版本号冲突 (其他 worker 同时保存) 的重试次数
+SAVE_RETRIES = 5
+
+_UNSET = object()
+
+
+class TremorConfig(BaseModel):
+    """震颤检测配置参数"""
+    # RMS 幅度阈值 (g)
+    rms_min: float = Field(default=2.5, ge=0.1, le=10.0, description="RMS 下限阈值 (g)")
+    rms_max: float = Field(default=5.0, ge=0.5, le=20.0, description="RMS 上限阈值 (g)")
+
+    # 功率阈值
+    power_threshold: float = Field(default=0.5, ge=0.01, le=5.0, description="功率阈值")
+
+    # 频率范围 (Hz)
+    freq_min: float = Field(default=4.0, ge=1.0, le=10.0, description="频率下限 (Hz)")
+    freq_max: float = Field(default=6.0, ge=2.0, le=15.0, description="频率上限 (Hz)")
+
+    # 严重度分级阈值 (g) - 4个值对应 1-4 级
+    severity_thresholds: List[float] = Field(
+        default=[2.5, 3.0, 3.5, 4.0],
+        min_length=4,
+        max_length=4,
+        description="严重度分级阈值 [0级, 1级, 2级, 3级]"
+    )
+
+
+class ConfigEntry(NamedTuple):
+    """一行配置 (缓存单元)"""
+    version: int
+    params: Optional[TremorConfig]      # None 表示继承上一级
+    group_name: Optional[str]
+    source: str
+    updated_at: datetime
+
+
+class EffectiveConfig(NamedTuple):
+    """设备的生效配置"""
+    version: int
+    params: TremorConfig
+    updated_at: datetime
+    source: str                         # default / device / web
+    scope: str                          # 参数来自哪一级: device / group / global / default
+    group_name: Optional[str] = None
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+
+class DeviceConfigStore:
+    """配置缓存 (全量加载后按版本号增量刷新)"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], ConfigEntry] = {}
+        self._watermark = 0
+        self._changed = asyncio.Event()
+        self._created_at = datetime.utcnow()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --------------------------------------------------------
+    # 读取
+    # --------------------------------------------------------
+
+    def get(self, scope: str, key: str = "") -> Optional[ConfigEntry]:
+        return self._entries.get((scope, key))
+
+    def entries(self, scope: str) -> Dict[str, ConfigEntry]:
+        """某一级的全部配置行 {scope_key: entry}"""
+        return {key: entry for (s, key), entry in self._entries.items() if s == scope}
+
+    def resolve(self, device_id: Optional[str] = None) -> EffectiveConfig:
+        """计算设备的生效配置 (不传设备 ID 时为全局配置)"""
+        layers: List[Tuple[str, ConfigEntry]] = []
+        group_name = None
+        if device_id:
+            device = self._entries.get((SCOPE_DEVICE, device_id))
+            if device is not None:
+                layers.append((SCOPE_DEVICE, device))
+                group_name = device.group_name
+            if group_name:
+                group = self._entries.get((SCOPE_GROUP, group_name))
+                if group is not None:
+                    layers.append((SCOPE_GROUP, group))
+        cloud = self._entries.get((SCOPE_GLOBAL, ""))
+        if cloud is not None:
+            layers.append((SCOPE_GLOBAL, cloud))
+
+        version = BASE_VERSION
+        for scope, entry in layers:
+            version = max(version, entry.version)
+            if entry.params is not None:
+                return EffectiveConfig(version, entry.params, entry.updated_at, entry.source, scope, group_name)
+        return EffectiveConfig(version, TremorConfig(), self._created_at, "default", "default", group_name)
+
+    # --------------------------------------------------------
+    # 写入
+    # --------------------------------------------------------
+
+    async def save(self, scope: str, key: str = "", params: Optional[TremorConfig] = None,
+                   source: str = "web", group_name=_UNSET) -> ConfigEntry:
+        """
+        保存一级配置并分配新版本号
+
+        Args:
+            params: 新参数，None 表示删除覆盖 (继承上一级)
+            group_name: 设备所属分组 (仅 device 级，不传则保持不变)
+        """
+        from app.core.database import AsyncSessionLocal
+
+        for attempt in range(SAVE_RETRIES):
+            try:
+                async with AsyncSessionLocal() as session:
+                    latest = await session.scalar(select(func.max(DeviceConfig.version)))
+                    version = max(latest or 0, BASE_VERSION) + 1
+                    row = (await session.execute(
+                        select(DeviceConfig).where(DeviceConfig.scope == scope, DeviceConfig.scope_key == key)
+                    )).scalar_one_or_none()
+                    if row is None:
+                        row = DeviceConfig(scope=scope, scope_key=key)
+                        session.add(row)
+                    row.params = params.model_dump() if params is not None else None
+                    if group_name is not _UNSET:
+                        row.group_name = group_name or None
+                    row.version = version
+                    row.source = source
+                    row.updated_at = datetime.utcnow()
+                    await session.commit()
+                    entry = self._apply(row)
+                break
+            except IntegrityError:
+                if attempt == SAVE_RETRIES - 1:
+                    raise
+        self._notify()
+        return entry
+
+    # --------------------------------------------------------
+    # 刷新与通知
+    # --------------------------------------------------------
+
+    def _apply(self, row) -> ConfigEntry:
+        entry = ConfigEntry(
+            version=row.version,
+            params=TremorConfig(**row.params) if row.params is not None else None,
+            group_name=row.group_name,
+            source=row.source,
+            updated_at=row.updated_at,
+        )
+        current = self._entries.get((row.scope, row.scope_key))
+        if current is None or current.version <= entry.version:
+            self._entries[(row.scope, row.scope_key)] = entry
+        self._watermark = max(self._watermark, row.version)
+        return entry
+
+    def _notify(self):
+        # 唤醒所有长轮询请求，之后的等待使用新的 Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def refresh(self) -> int:
+        """从数据库加载版本号大于水位的配置行，返回变更条数"""
+        from app.core.database import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(DeviceConfig).where(DeviceConfig.version > self._watermark).order_by(DeviceConfig.version)
+            )).scalars().all()
+        for row in rows:
+            self._apply(row)
+        if rows:
+            self._notify()
+        return len(rows)
+
+    async def run_refresher(self, interval: float):
+        """后台定时增量刷新 (在 lifespan 中启动)"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 设备配置刷新失败: {e}")
+            await asyncio.sleep(interval)
+
+    async def wait_for_change(self, device_id: Optional[str], version: int, timeout: float) -> EffectiveConfig:
+        """等待设备生效配置的版本号超过 version，超时返回当前配置"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            config = self.resolve(device_id)
+            remaining = deadline - loop.time()
+            if config.version > version or remaining <= 0:
+                return config
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+# 全局配置缓存
+device_config_store = DeviceConfigStore()
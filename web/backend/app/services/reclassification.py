@@ -0,0 +1,510 @@
+"""
+Tremor Guard - Historical Re-classification
+震颤卫士 - 历史数据重新判定
+
+检测参数 (rms_min / rms_max / power_threshold / freq_min / freq_max / severity_thresholds)
+变更后，按新参数重算已存储数据的 detected / valid / out_of_range / severity，
+保证趋势图前后口径一致:
+- 每台设备的数据按该设备当前的生效配置 (设备 > 分组 > 全局) 判定，任务范围决定处理哪些设备:
+  保存全局配置处理全部设备 (有覆盖的设备判定结果不变，不会被改写)，保存分组/设备配置只处理受影响的设备
+- 按 id 区间分块读取特征列 (frequency, band_power, rms_amplitude)，按配置分组后 NumPy 向量化判定
+- 只回写判定结果变化的行 (PostgreSQL 使用 UPDATE ... FROM unnest()，其他数据库 executemany)
+- 每块一个事务，进度写入 tremor_reclassification_jobs；中断后从 last_id 继续
+- 每块在同一事务内重算涉及变化行的会话汇总 (tremor_count / max_severity / avg_severity / avg_frequency)；
+  活跃会话由上传接口增量更新，跳过，结束会话时会按数据重新统计
+- 有行变化的块提交后及任务完成时更新全局数据水位，分析接口的 ETag 随之失效
+- 创建新任务时，同一范围 (全局任务为全部范围) 旧的未完成任务标记为 superseded，运行中的旧任务在下一块之前退出
+
+设备只在检测到震颤时上报频谱特征，缺少 frequency / band_power 的行不会被判定为震颤。
+任务使用 reporting 连接池，不占用设备上传的连接。
+
+Usage:
+    # 继续未完成 (pending / 已中断) 的任务
+    python -m app.services.reclassification --resume
+    # 按当前配置创建并运行任务 (全部设备 / 某个分组 / 单台设备)
+    python -m app.services.reclassification --start
+    python -m app.services.reclassification --start --group ward-3
+    python -m app.services.reclassification --start --device esp32_001
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, bindparam, func, or_, select, text, update
+
+from app.core.config import settings
+from app.core.data_watermark import data_watermark
+from app.core.database import WORKLOAD_REPORTING, engines
+from app.models.device import Device
+from app.models.tremor_data import TremorData, TremorReclassificationJob, TremorSession
+from app.services.device_config import SCOPE_DEVICE, SCOPE_GLOBAL, SCOPE_GROUP, device_config_store
+from app.services.tremor_detection import SEVERITY_LABELS, DetectionParams, classify_features
+
+CLASSIFICATION_FIELDS = DetectionParams._fields
+
+_jobs = TremorReclassificationJob.__table__
+_data = TremorData.__table__
+_sessions = TremorSession.__table__
+_devices = Device.__table__
+
+# 每条会话汇总 UPDATE 涉及的会话数上限
+SESSION_BATCH = 1000
+
+# 本进程中正在运行的任务
+_running: Dict[int, asyncio.Task] = {}
+
+
+def classification_changed(old, new) -> bool:
+    """两份配置的判定参数是否不同 (TremorConfig 或 DetectionParams)"""
+    return DetectionParams.from_config(old) != DetectionParams.from_config(new)
+
+
+def _engine():
+    return engines[WORKLOAD_REPORTING]
+
+
+# ============================================================
+# 任务管理
+# ============================================================
+
+async def create_job(params: DetectionParams, config_version: int,
+                     scope: str = SCOPE_GLOBAL, scope_key: str = "") -> int:
+    """
+    创建任务 (同一范围旧的未完成任务标记为 superseded；全局任务取代所有范围的任务)
+
+    Args:
+        params: 该范围当前的判定参数 (记录在任务中用于展示)
+        scope / scope_key: 任务范围，global / group (分组名) / device (设备 ID)
+    """
+    now = datetime.utcnow()
+    unfinished = _jobs.c.status.in_(("pending", "running", "failed"))
+    if scope != SCOPE_GLOBAL:
+        unfinished = and_(unfinished, _jobs.c.scope == scope, _jobs.c.scope_key == scope_key)
+    async with _engine().begin() as conn:
+        await conn.execute(
+            update(_jobs).where(unfinished).values(status="superseded", updated_at=now, finished_at=now)
+        )
+        max_id = await conn.scalar(select(func.coalesce(func.max(_data.c.id), 0)))
+        result = await conn.execute(
+            _jobs.insert().values(
+                scope=scope,
+                scope_key=scope_key,
+                config_version=config_version,
+                params={**params._asdict(), "severity_thresholds": list(params.severity_thresholds)},
+                status="pending",
+                last_id=0,
+                max_id=max_id,
+                total_rows=0,
+                processed_rows=0,
+                changed_rows=0,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        return result.inserted_primary_key[0]
+
+
+async def _claim(conn, job_id: int) -> bool:
+    """认领任务: pending / failed，或 running 但超过 RECLASSIFY_STALE_SECONDS 未更新 (进程中断)"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.RECLASSIFY_STALE_SECONDS)
+    result = await conn.execute(
+        update(_jobs)
+        .where(
+            _jobs.c.id == job_id,
+            or_(
+                _jobs.c.status.in_(("pending", "failed")),
+                and_(_jobs.c.status == "running", _jobs.c.updated_at < stale),
+            ),
+        )
+        .values(
+            status="running", error=None, updated_at=now,
+            started_at=func.coalesce(_jobs.c.started_at, now),
+        )
+    )
+    return result.rowcount == 1
+
+
+def job_progress(job) -> dict:
+    """任务进度 (job 为数据库行)"""
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or job.updated_at) - job.started_at).total_seconds()
+    rate = job.processed_rows / elapsed if elapsed else None
+    remaining = max(0, (job.total_rows or 0) - job.processed_rows)
+    return {
+        "id": job.id,
+        "scope": job.scope,
+        "scope_key": job.scope_key,
+        "config_version": job.config_version,
+        "status": job.status,
+        "error": job.error,
+        "params": job.params,
+        "total_rows": job.total_rows,
+        "processed_rows": job.processed_rows,
+        "changed_rows": job.changed_rows,
+        "percent": round(100.0 * job.processed_rows / job.total_rows, 1) if job.total_rows else None,
+        "rows_per_second": round(rate, 1) if rate else None,
+        "eta_seconds": round(remaining / rate, 1) if rate and job.status == "running" else None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+async def list_jobs(limit: int = 10) -> List[dict]:
+    async with _engine().connect() as conn:
+        result = await conn.execute(select(_jobs).order_by(_jobs.c.id.desc()).limit(limit))
+        return [job_progress(job) for job in result]
+
+
+# ============================================================
+# 分块判定
+# ============================================================
+
+async def _write_changes(conn, ids: np.ndarray, detected: np.ndarray, out_of_range: np.ndarray,
+                         severity: np.ndarray):
+    labels = [SEVERITY_LABELS[s] for s in severity.tolist()]
+    if conn.dialect.name == "postgresql":
+        await conn.execute(
+            text(
+                "UPDATE tremor_data AS t SET detected = v.detected, valid = NOT v.out_of_range, "
+                "out_of_range = v.out_of_range, severity = v.severity, severity_label = v.severity_label "
+                "FROM unnest(CAST(:ids AS integer[]), CAST(:detected AS boolean[]), "
+                "CAST(:out_of_range AS boolean[]), CAST(:severity AS integer[]), CAST(:labels AS varchar[])) "
+                "AS v(id, detected, out_of_range, severity, severity_label) WHERE t.id = v.id"
+            ),
+            {
+                "ids": ids.tolist(), "detected": detected.tolist(), "out_of_range": out_of_range.tolist(),
+                "severity": severity.tolist(), "labels": labels,
+            },
+        )
+        return
+    await conn.execute(
+        update(_data)
+        .where(_data.c.id == bindparam("b_id"))
+        .values(
+            detected=bindparam("b_detected"), valid=bindparam("b_valid"),
+            out_of_range=bindparam("b_out_of_range"), severity=bindparam("b_severity"),
+            severity_label=bindparam("b_label"),
+        ),
+        [
+            {"b_id": i, "b_detected": d, "b_valid": not o, "b_out_of_range": o, "b_severity": s, "b_label": l}
+            for i, d, o, s, l in zip(
+                ids.tolist(), detected.tolist(), out_of_range.tolist(), severity.tolist(), labels
+            )
+        ],
+    )
+
+
+def _scope_filter(scope: str, scope_key: str):
+    """任务范围对应的设备过滤条件 (全局任务为 None)"""
+    if scope == SCOPE_DEVICE:
+        return _devices.c.device_id == scope_key
+    if scope == SCOPE_GROUP:
+        # 分组成员关系记录在设备级配置行中 (删除分组配置时保留)
+        members = sorted(
+            device_id for device_id, entry in device_config_store.entries(SCOPE_DEVICE).items()
+            if entry.group_name == scope_key
+        )
+        return _devices.c.device_id.in_(members)
+    return None
+
+
+def _scoped(query, scope: str, scope_key: str):
+    """按 tremor_data -> tremor_sessions -> devices 关联并应用范围过滤"""
+    query = query.select_from(
+        _data.join(_sessions, _sessions.c.id == _data.c.session_id).join(_devices, _devices.c.id == _sessions.c.device_id)
+    )
+    condition = _scope_filter(scope, scope_key)
+    return query if condition is None else query.where(condition)
+
+
+def _classify_by_device(columns: np.ndarray, device_ids: List[str]):
+    """每台设备按其当前生效配置判定 (相同参数的设备合并为一次向量化调用)"""
+    detected = np.zeros(len(columns), dtype=bool)
+    out_of_range = np.zeros(len(columns), dtype=bool)
+    severity = np.zeros(len(columns), dtype=np.int64)
+
+    groups: Dict[DetectionParams, List[int]] = {}
+    unique, inverse = np.unique(np.array(device_ids, dtype=object), return_inverse=True)
+    for index, device_id in enumerate(unique.tolist()):
+        params = DetectionParams.from_config(device_config_store.resolve(device_id).params)
+        groups.setdefault(params, []).append(index)
+    for params, indexes in groups.items():
+        mask = np.isin(inverse, indexes)
+        d, o, s = classify_features(columns[mask, 4], columns[mask, 5], columns[mask, 6], params)
+        detected[mask], out_of_range[mask], severity[mask] = d, o, s
+    return detected, out_of_range, severity
+
+
+async def _process_chunk(conn, scope: str, scope_key: str, last_id: int, max_id: int, chunk_rows: int):
+    """处理 (last_id, last_id + chunk_rows] 区间内的数据，返回 (行数, 变化行数, 区间末尾 id)；处理完毕时返回 None"""
+    if last_id >= max_id:
+        return None
+    upper = min(last_id + chunk_rows, max_id)
+    rows = (await conn.execute(
+        _scoped(
+            select(
+                _data.c.id, _data.c.detected, _data.c.out_of_range, _data.c.severity,
+                _data.c.frequency, _data.c.band_power, _data.c.rms_amplitude, _data.c.session_id,
+                _devices.c.device_id,
+            ),
+            scope, scope_key,
+        )
+        .where(_data.c.id > last_id, _data.c.id <= upper)
+    )).all()
+    if not rows:
+        return 0, 0, upper
+
+    # None -> NaN，布尔 -> 0/1 (先转为 tuple: 直接转换 Row 对象慢约 30 倍)
+    records = list(map(tuple, rows))
+    columns = np.array([record[:-1] for record in records], dtype=np.float64)
+    ids = columns[:, 0].astype(np.int64)
+    detected, out_of_range, severity = _classify_by_device(columns, [record[-1] for record in records])
+
+    changed = (
+        (detected != (columns[:, 1] == 1))
+        | (out_of_range != (columns[:, 2] == 1))
+        | (severity != columns[:, 3])
+    )
+    count = int(changed.sum())
+    if count:
+        await _write_changes(conn, ids[changed], detected[changed], out_of_range[changed], severity[changed])
+        session_ids = np.unique(columns[changed, 7][~np.isnan(columns[changed, 7])]).astype(np.int64)
+        await _refresh_session_stats(conn, session_ids.tolist())
+    return len(rows), count, upper
+
+
+async def _refresh_session_stats(conn, session_ids: List[int]):
+    """
+    按新的判定结果重算指定会话的汇总统计 (与判定结果在同一事务内，按批 UPDATE ... FROM 聚合)
+
+    活跃会话跳过: 上传接口在提交时增量更新其计数，这里覆盖会丢失并发写入；
+    结束会话时 (/session/{id}/end) 会按数据重新统计。
+    """
+    sessions = TremorSession.__table__
+    for start in range(0, len(session_ids), SESSION_BATCH):
+        batch = session_ids[start:start + SESSION_BATCH]
+        stats = (
+            select(
+                _data.c.session_id.label("session_id"),
+                func.count().filter(_data.c.detected == True).label("tremor_count"),
+                func.max(_data.c.severity).label("max_severity"),
+                func.avg(_data.c.severity).filter(_data.c.detected == True).label("avg_severity"),
+                func.avg(_data.c.frequency).filter(_data.c.detected == True).label("avg_frequency"),
+            )
+            .where(_data.c.session_id.in_(batch))
+            .group_by(_data.c.session_id)
+            .subquery()
+        )
+        await conn.execute(
+            update(sessions)
+            .where(sessions.c.id == stats.c.session_id, sessions.c.is_active == False)
+            .values(
+                tremor_count=stats.c.tremor_count,
+                max_severity=func.coalesce(stats.c.max_severity, 0),
+                avg_severity=stats.c.avg_severity,
+                avg_frequency=stats.c.avg_frequency,
+            )
+        )
+
+
+async def run_job(job_id: int, chunk_rows: Optional[int] = None,
+                  progress: Optional[Callable[[dict], None]] = None) -> Optional[dict]:
+    """
+    运行 (或继续) 任务
+
+    Returns:
+        任务结束时的进度；任务已被其他进程认领或已结束时返回 None
+    """
+    chunk_rows = chunk_rows or settings.RECLASSIFY_CHUNK_ROWS
+    engine = _engine()
+    # 判定使用各设备的生效配置，先同步其他进程保存的配置
+    await device_config_store.refresh()
+
+    async with engine.begin() as conn:
+        if not await _claim(conn, job_id):
+            return None
+        job = (await conn.execute(select(_jobs).where(_jobs.c.id == job_id))).one()
+        scope, scope_key = job.scope, job.scope_key
+        last_id, max_id = job.last_id, job.max_id
+        if not job.total_rows:
+            remaining = await conn.scalar(
+                _scoped(select(func.count()), scope, scope_key)
+                .where(_data.c.id > last_id, _data.c.id <= max_id)
+            )
+            await conn.execute(
+                update(_jobs).where(_jobs.c.id == job_id).values(total_rows=job.processed_rows + remaining)
+            )
+
+    try:
+        while True:
+            async with engine.begin() as conn:
+                status = await conn.scalar(select(_jobs.c.status).where(_jobs.c.id == job_id))
+                if status != "running":
+                    # 被新任务取代
+                    return None
+                result = await _process_chunk(conn, scope, scope_key, last_id, max_id, chunk_rows)
+                if result is None:
+                    break
+                rows, changed, last_id = result
+                await conn.execute(
+                    update(_jobs).where(_jobs.c.id == job_id).values(
+                        last_id=last_id,
+                        processed_rows=_jobs.c.processed_rows + rows,
+                        changed_rows=_jobs.c.changed_rows + changed,
+                        updated_at=datetime.utcnow(),
+                    )
+                )
+            # 检测结果已变化 (每块提交后)，所有用户的分析 ETag 失效
+            if changed:
+                await data_watermark.bump_all()
+            if progress:
+                async with engine.connect() as conn:
+                    progress(job_progress((await conn.execute(select(_jobs).where(_jobs.c.id == job_id))).one()))
+            # 让出事件循环，避免在 API 进程中长时间占用
+            await asyncio.sleep(0)
+
+        async with engine.begin() as conn:
+            now = datetime.utcnow()
+            await conn.execute(
+                update(_jobs).where(_jobs.c.id == job_id, _jobs.c.status == "running")
+                .values(status="completed", updated_at=now, finished_at=now)
+            )
+            job = (await conn.execute(select(_jobs).where(_jobs.c.id == job_id))).one()
+        await data_watermark.bump_all()
+        return job_progress(job)
+    except Exception as e:
+        async with engine.begin() as conn:
+            await conn.execute(
+                update(_jobs).where(_jobs.c.id == job_id)
+                .values(status="failed", error=str(e)[:500], updated_at=datetime.utcnow())
+            )
+        raise
+
+
+# ============================================================
+# 进程内后台运行
+# ============================================================
+
+def _log_progress(step: int = 10) -> Callable[[dict], None]:
+    """每完成 step% 打印一次进度"""
+    reported = {"percent": -step}
+
+    def report(p: dict):
+        if p["percent"] is not None and p["percent"] >= reported["percent"] + step:
+            reported["percent"] = p["percent"]
+            print(
+                f"🔁 重新判定任务 #{p['id']}: {p['percent']}% ({p['processed_rows']}/{p['total_rows']} 行，"
+                f"变化 {p['changed_rows']} 行，{p['rows_per_second'] or 0:.0f} 行/秒)"
+            )
+    return report
+
+
+async def _run_logged(job_id: int):
+    try:
+        result = await run_job(job_id, progress=_log_progress())
+        if result:
+            print(f"✅ 重新判定任务 #{job_id} 完成: {result['processed_rows']} 行，变化 {result['changed_rows']} 行")
+    except Exception as e:
+        print(f"⚠️ 重新判定任务 #{job_id} 失败: {e}")
+    finally:
+        _running.pop(job_id, None)
+
+
+def start_background(job_id: int):
+    """在当前进程的事件循环中运行任务"""
+    if job_id not in _running:
+        _running[job_id] = asyncio.create_task(_run_logged(job_id))
+
+
+async def schedule_reclassification(old_config, new_config, config_version: int,
+                                    scope: str = SCOPE_GLOBAL, scope_key: str = "") -> Optional[int]:
+    """
+    配置变更时创建并启动任务 (判定参数未变化或未启用时返回 None)
+
+    old_config / new_config 为该范围内设备变更前后的生效配置
+    """
+    if not settings.RECLASSIFY_ON_CONFIG_CHANGE or not classification_changed(old_config, new_config):
+        return None
+    job_id = await create_job(DetectionParams.from_config(new_config), config_version, scope, scope_key)
+    start_background(job_id)
+    return job_id
+
+
+async def resume_jobs() -> List[int]:
+    """继续未完成的任务 (pending，或 running 但已中断)"""
+    stale = datetime.utcnow() - timedelta(seconds=settings.RECLASSIFY_STALE_SECONDS)
+    async with _engine().connect() as conn:
+        result = await conn.execute(
+            select(_jobs.c.id).where(or_(
+                _jobs.c.status == "pending",
+                and_(_jobs.c.status == "running", _jobs.c.updated_at < stale),
+            )).order_by(_jobs.c.id)
+        )
+        job_ids = [row.id for row in result]
+    for job_id in job_ids:
+        start_background(job_id)
+    return job_ids
+
+
+# ============================================================
+# 命令行
+# ============================================================
+
+async def main(args):
+    from app.core.database import init_db
+    await init_db()
+
+    if args.start:
+        await device_config_store.refresh()
+        if args.device:
+            scope, scope_key, config = SCOPE_DEVICE, args.device, device_config_store.resolve(args.device)
+        elif args.group:
+            scope, scope_key = SCOPE_GROUP, args.group
+            entry = device_config_store.get(SCOPE_GROUP, args.group)
+            config = entry if entry and entry.params else device_config_store.resolve()
+        else:
+            scope, scope_key, config = SCOPE_GLOBAL, "", device_config_store.resolve()
+        job_ids = [await create_job(DetectionParams.from_config(config.params), config.version, scope, scope_key)]
+    elif args.job:
+        job_ids = [args.job]
+    else:
+        async with _engine().connect() as conn:
+            result = await conn.execute(
+                select(_jobs.c.id).where(_jobs.c.status.in_(("pending", "running", "failed"))).order_by(_jobs.c.id)
+            )
+            job_ids = [row.id for row in result]
+        if not job_ids:
+            print("没有未完成的任务")
+
+    for job_id in job_ids:
+        start = time.perf_counter()
+        result = await run_job(job_id, args.chunk_rows, progress=_log_progress(args.report_step))
+        if result is None:
+            print(f"任务 #{job_id} 正在其他进程运行或已结束")
+            continue
+        elapsed = time.perf_counter() - start
+        print(
+            f"任务 #{job_id} {result['status']}: {result['processed_rows']} 行，变化 {result['changed_rows']} 行，"
+            f"{elapsed:.1f}s ({result['processed_rows'] / elapsed * 60 if elapsed else 0:,.0f} 行/分钟)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按新的检测参数重新判定历史数据")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--resume", action="store_true", help="继续未完成的任务 (默认)")
+    mode.add_argument("--job", type=int, help="运行指定任务")
+    mode.add_argument("--start", action="store_true", help="按当前配置创建新任务并运行")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--group", help="只处理该分组内的设备 (配合 --start)")
+    scope.add_argument("--device", help="只处理该设备 (配合 --start)")
+    parser.add_argument("--chunk-rows", type=int, default=None, help="每块行数 (默认 RECLASSIFY_CHUNK_ROWS)")
+    parser.add_argument("--report-step", type=int, default=10, help="进度输出间隔 (百分比)")
+    asyncio.run(main(parser.parse_args()))
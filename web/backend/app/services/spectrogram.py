@@ -0,0 +1,341 @@
+"""
+Tremor Guard - Spectrogram Aggregation
+震颤卫士 - 频谱时频图聚合
+
+把 tremor_spectra 中的单窗口幅度谱按时间桶 (小时/天) 或按会话求平均，得到
+(桶数, bin 数) 的矩阵，用于观察震颤主频在一天内、数周间的漂移。
+
+- 流式读取 (yield_per)，每批用 np.add.reduceat 按桶求和，不逐行循环
+- 缓存每个已结束桶的 (窗口数, 各 bin 之和, 各 bin 计数)：桶结束超过
+  SPECTROGRAM_CLOSE_GRACE_SECONDS 后视为已结束；未结束的桶每次重新计算。会话桶在会话结束后缓存
+- 更晚补传的数据 (设备离线数小时后批量上传) 或写入已结束会话的数据由上传接口调用
+  note_ingest 记录，递增该用户的补传版本号 (共享状态，所有 worker 可见)；
+  缓存键包含版本号，旧的桶不再命中，随 LRU 淘汰
+- 缓存为进程内 LRU (每个 worker 各自一份)，只存求和结果，不存原始频谱
+- 频率分辨率 (bin_hz) 不同的频谱不能逐 bin 平均: 每个桶以最先读到的 bin_hz 为准，
+  同一桶内其他 bin_hz 的窗口丢弃；结果矩阵取窗口数最多的 bin_hz，其余桶留空，
+  丢弃的窗口数见 rejected_windows
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Hashable, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.metrics import cache_counters
+from app.core.shared_state import shared_state
+from app.models.tremor_data import TremorData, TremorSession, TremorSpectrum
+from app.services.spectrum_storage import spectra_to_matrix
+from app.services.tremor_detection import FREQ_RESOLUTION
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+
+# 每批读取的频谱行数
+STREAM_BATCH = 20000
+
+_EPOCH = datetime(1970, 1, 1)
+
+LATE_KEY = "spectrogram:late:{}"
+
+
+# ============================================================
+# 桶累加
+# ============================================================
+
+class BucketSums(NamedTuple):
+    """一个桶的累加结果 (缓存单元)"""
+    windows: int
+    power_sum: np.ndarray       # (bins,) float64
+    bin_count: np.ndarray       # (bins,) int32，长度不同的频谱以 NaN 补齐，按 bin 计数
+    bin_hz: float
+    rejected: int               # bin_hz 与本桶不一致而丢弃的窗口数
+
+
+class _Accumulator:
+    """按行索引累加频谱 (行索引需有序)"""
+
+    def __init__(self, rows: int):
+        self.windows = np.zeros(rows, dtype=np.int64)
+        self.sums = np.zeros((rows, 0))
+        self.counts = np.zeros((rows, 0), dtype=np.int32)
+        self.bin_hz = np.full(rows, np.nan)
+        self.rejected = np.zeros(rows, dtype=np.int64)
+
+    def _widen(self, width: int):
+        if width > self.sums.shape[1]:
+            pad = width - self.sums.shape[1]
+            self.sums = np.pad(self.sums, ((0, 0), (0, pad)))
+            self.counts = np.pad(self.counts, ((0, 0), (0, pad)))
+
+    def add(self, index: np.ndarray, power: np.ndarray, bin_hz: np.ndarray):
+        if not len(index):
+            return
+        # 每行第一次出现的 bin_hz 作为该行的分辨率，不一致的窗口丢弃
+        unset = np.isnan(self.bin_hz[index])
+        if unset.any():
+            rows, first = np.unique(index[unset], return_index=True)
+            self.bin_hz[rows] = bin_hz[unset][first]
+        match = np.isclose(bin_hz, self.bin_hz[index])
+        if not match.all():
+            np.add.at(self.rejected, index[~match], 1)
+            index, power = index[match], power[match]
+            if not len(index):
+                return
+        width = power.shape[1]
+        self._widen(width)
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        rows = index[starts]
+        valid = ~np.isnan(power)
+        self.sums[rows, :width] += np.add.reduceat(np.where(valid, power, 0.0), starts, axis=0)
+        self.counts[rows, :width] += np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+        self.windows[rows] += np.diff(np.r_[starts, len(index)])
+
+    def bucket(self, row: int) -> BucketSums:
+        bin_hz = self.bin_hz[row]
+        return BucketSums(
+            int(self.windows[row]), self.sums[row].copy(), self.counts[row].copy(),
+            FREQ_RESOLUTION if np.isnan(bin_hz) else float(bin_hz), int(self.rejected[row]),
+        )
+
+
+# ============================================================
+# 缓存
+# ============================================================
+
+class SpectrogramCache:
+    """已结束桶的 LRU 缓存"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, BucketSums]" = OrderedDict()
+        self._hits, self._misses = cache_counters("spectrogram")
+
+    def get(self, key: Hashable) -> Optional[BucketSums]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return entry
+
+    def put(self, key: Hashable, value: BucketSums):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+spectrogram_cache = SpectrogramCache(settings.SPECTROGRAM_CACHE_BUCKETS)
+
+
+async def _late_version(user_id: int) -> int:
+    return int(await shared_state.get(LATE_KEY.format(user_id)) or 0)
+
+
+async def note_ingest(user_id: Optional[int], oldest: Optional[datetime], session_active: bool = True):
+    """
+    上传提交后调用: 数据落入可能已缓存的桶时，使该用户已缓存的桶失效
+
+    Args:
+        oldest: 本次写入的带频谱数据中最早的时间 (None 表示没有频谱)
+        session_active: 写入的会话是否仍在进行 (写入已结束的会话时会话桶也需要失效)
+    """
+    if user_id is None or oldest is None:
+        return
+    if oldest.tzinfo is not None:
+        oldest = oldest.astimezone(timezone.utc).replace(tzinfo=None)
+    closed_before = datetime.utcnow() - timedelta(seconds=settings.SPECTROGRAM_CLOSE_GRACE_SECONDS)
+    if session_active and oldest >= closed_before:
+        return
+    await shared_state.incr(LATE_KEY.format(user_id))
+
+
+# ============================================================
+# 结果
+# ============================================================
+
+class Spectrogram(NamedTuple):
+    """时频矩阵 (每行一个桶)"""
+    keys: list                  # 时间桶起点 (datetime) 或会话 id
+    windows: np.ndarray         # (N,) 每桶频谱窗口数
+    power: np.ndarray           # (N, bins) float32 平均幅度谱，无数据的桶为 NaN
+    bin_hz: float
+    cached: int                 # 命中缓存的桶数
+    rejected_windows: int       # bin_hz 与结果不一致而未计入的窗口数
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        return np.arange(self.power.shape[1]) * self.bin_hz
+
+    def mean_spectrum(self) -> np.ndarray:
+        """按窗口数加权的总体平均谱"""
+        weights = self.windows[:, None] * ~np.isnan(self.power)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (np.nansum(self.power * weights, axis=0) / total).astype(np.float32)
+
+    def peak_frequency(self, min_hz: float = 1.0) -> List[Optional[float]]:
+        """每行的主频 (忽略 min_hz 以下的低频运动分量)"""
+        first = int(np.ceil(min_hz / self.bin_hz))
+        band = self.power[:, first:]
+        if band.shape[1] == 0:
+            return [None] * len(self.keys)
+        empty = np.isnan(band).all(axis=1)
+        peak = np.nanargmax(np.where(empty[:, None], 0, band), axis=1) + first
+        return [None if e else round(float(p * self.bin_hz), 3) for p, e in zip(peak, empty)]
+
+
+def _assemble(keys: list, buckets: List[Optional[BucketSums]], cached: int) -> Spectrogram:
+    # 窗口数最多的 bin_hz 作为结果的频率分辨率，其他分辨率的桶不计入
+    totals: dict = {}
+    for b in buckets:
+        if b is not None and b.windows:
+            totals[b.bin_hz] = totals.get(b.bin_hz, 0) + b.windows
+    bin_hz = max(totals, key=totals.get) if totals else FREQ_RESOLUTION
+    rejected = sum(b.rejected for b in buckets if b is not None)
+    rejected += sum(windows for hz, windows in totals.items() if hz != bin_hz)
+
+    used = [b if b is not None and b.windows and b.bin_hz == bin_hz else None for b in buckets]
+    width = max((len(b.power_sum) for b in used if b is not None), default=0)
+    power = np.full((len(keys), width), np.nan, dtype=np.float32)
+    windows = np.zeros(len(keys), dtype=np.int64)
+    for i, b in enumerate(used):
+        if b is None:
+            continue
+        windows[i] = b.windows
+        n = len(b.power_sum)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            power[i, :n] = np.where(b.bin_count > 0, b.power_sum / b.bin_count, np.nan)
+    return Spectrogram(keys, windows, power, bin_hz, cached, rejected)
+
+
+def _spectrum_query():
+    return (
+        select(
+            TremorData.id, TremorSpectrum.encoding, TremorSpectrum.bins, TremorSpectrum.bin_hz,
+            TremorSpectrum.scale, TremorSpectrum.data, TremorData.timestamp, TremorData.session_id,
+        )
+        .select_from(TremorSpectrum)
+        .join(TremorData, TremorData.id == TremorSpectrum.data_id)
+    )
+
+
+async def _stream_batches(db, query):
+    """分批读取 (rows, SpectrumMatrix)，矩阵行顺序与 rows 一致"""
+    result = await db.stream(query.execution_options(yield_per=STREAM_BATCH))
+    async for rows in result.partitions(STREAM_BATCH):
+        yield rows, spectra_to_matrix(rows)
+
+
+# ============================================================
+# 聚合
+# ============================================================
+
+async def time_spectrogram(db, user_id: int, start: datetime, end: datetime, bucket_seconds: int,
+                           offset_seconds: int = 0, now: Optional[datetime] = None) -> Spectrogram:
+    """
+    按时间桶聚合 [start, end) 内的频谱
+
+    Args:
+        bucket_seconds: 桶宽度 (3600 / 86400)
+        offset_seconds: 桶边界偏移 (按天聚合时传入时区偏移，使桶从当地 0 点开始)
+    """
+    now = now or datetime.utcnow()
+    closed_before = (now - _EPOCH).total_seconds() - settings.SPECTROGRAM_CLOSE_GRACE_SECONDS
+
+    start_s = (start - _EPOCH).total_seconds()
+    end_s = (end - _EPOCH).total_seconds()
+    origin = np.floor((start_s - offset_seconds) / bucket_seconds) * bucket_seconds + offset_seconds
+    count = max(0, int(np.ceil((end_s - origin) / bucket_seconds)))
+    edges = origin + np.arange(count) * bucket_seconds
+
+    version = await _late_version(user_id)
+    keys = [(user_id, bucket_seconds, int(e), version) for e in edges]
+    buckets: List[Optional[BucketSums]] = [spectrogram_cache.get(k) for k in keys]
+    cached = sum(b is not None for b in buckets)
+    missing = [i for i, b in enumerate(buckets) if b is None]
+
+    if missing:
+        first, last = missing[0], missing[-1]
+        acc = _Accumulator(last - first + 1)
+        range_start = _EPOCH + timedelta(seconds=float(edges[first]))
+        range_end = _EPOCH + timedelta(seconds=float(edges[last] + bucket_seconds))
+        query = (
+            _spectrum_query()
+            .join(TremorSession, TremorSession.id == TremorData.session_id)
+            .where(
+                TremorSession.user_id == user_id,
+                TremorData.timestamp >= range_start,
+                TremorData.timestamp < range_end,
+            )
+            .order_by(TremorData.timestamp)
+        )
+        async for rows, matrix in _stream_batches(db, query):
+            # 按时间排序读取，桶索引单调不减
+            timestamps = np.array([r[6] for r in rows], dtype="datetime64[us]").astype(np.int64) / 1e6
+            index = ((timestamps - edges[first]) // bucket_seconds).astype(np.int64)
+            acc.add(index, matrix.power, matrix.bin_hz)
+
+        for i in missing:
+            bucket = acc.bucket(i - first)
+            buckets[i] = bucket
+            if edges[i] + bucket_seconds <= closed_before:
+                spectrogram_cache.put(keys[i], bucket)
+
+    return _assemble([_EPOCH + timedelta(seconds=float(e)) for e in edges], buckets, cached)
+
+
+async def session_spectrogram(db, user_id: int, start: datetime, end: datetime,
+                              now: Optional[datetime] = None) -> Spectrogram:
+    """按会话聚合: [start, end) 内开始的每个会话的平均谱 (按开始时间排序)"""
+    now = now or datetime.utcnow()
+    closed_before = now - timedelta(seconds=settings.SPECTROGRAM_CLOSE_GRACE_SECONDS)
+
+    sessions = (await db.execute(
+        select(TremorSession.id, TremorSession.is_active, TremorSession.end_time)
+        .where(
+            TremorSession.user_id == user_id,
+            TremorSession.start_time >= start,
+            TremorSession.start_time < end,
+        )
+        .order_by(TremorSession.start_time, TremorSession.id)
+    )).all()
+
+    version = await _late_version(user_id)
+    keys = [("session", s.id, version) for s in sessions]
+    buckets: List[Optional[BucketSums]] = [spectrogram_cache.get(k) for k in keys]
+    cached = sum(b is not None for b in buckets)
+    missing = [i for i, b in enumerate(buckets) if b is None]
+
+    if missing:
+        missing_ids = np.array(sorted(sessions[i].id for i in missing), dtype=np.int64)
+        acc = _Accumulator(len(missing_ids))
+        query = (
+            _spectrum_query()
+            .where(TremorData.session_id.in_(missing_ids.tolist()))
+            .order_by(TremorData.session_id)
+        )
+        async for rows, matrix in _stream_batches(db, query):
+            session_ids = np.fromiter((r[7] for r in rows), dtype=np.int64, count=len(rows))
+            acc.add(np.searchsorted(missing_ids, session_ids), matrix.power, matrix.bin_hz)
+
+        for i in missing:
+            session = sessions[i]
+            bucket = acc.bucket(int(np.searchsorted(missing_ids, session.id)))
+            buckets[i] = bucket
+            if not session.is_active and session.end_time and session.end_time <= closed_before:
+                spectrogram_cache.put(keys[i], bucket)
+
+    return _assemble([s.id for s in sessions], buckets, cached)
@@ -0,0 +1,260 @@
+"""
+Tremor Guard - Spectrum Storage
+震颤卫士 - 频谱二进制存储
+
+幅度谱不再以 JSON 文本存于 tremor_data.spectrum_data，而是打包为定长二进制写入 tremor_spectra:
+- f16: float16，每 bin 2 字节 (默认，相对误差 < 0.05%)
+- f32: float32，每 bin 4 字节 (无损保存设备上传的 float)
+- u8:  按每条频谱最大值线性量化，每 bin 1 字节 (绝对误差 ≤ 最大值 / 510)
+
+上传格式不变: spectrum_data = {"bin_hz": 0.488, "power": [...]}，bin_hz 缺省为固件 FFT 分辨率；
+无法识别的格式仍按原样写入 JSON 列。
+
+读取: load_spectra() 按 data_id 批量读取，直接拼成 (N, bins) 的 float32 二维数组，
+相同编码和长度的频谱一次 np.frombuffer 解码，不经过 Python 浮点列表。
+
+Usage:
+    # 将旧版 JSON 频谱转换为二进制 (可重复执行，已转换的行不会再处理)
+    python -m app.services.spectrum_storage --migrate --encoding f16
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.models.tremor_data import TremorData, TremorSpectrum
+from app.services.tremor_detection import FREQ_RESOLUTION
+
+SPECTRUM_ENCODINGS = {
+    "f16": np.dtype("<f2"),
+    "f32": np.dtype("<f4"),
+    "u8": np.dtype("u1"),
+}
+
+# 每次 IN 查询的 data_id 数 (SQLite 绑定参数上限 32766)
+LOAD_CHUNK = 5000
+
+_spectra = TremorSpectrum.__table__
+_data = TremorData.__table__
+
+
+# ============================================================
+# 编码 / 解码
+# ============================================================
+
+def encode_spectrum(power: Sequence[float], bin_hz: float = FREQ_RESOLUTION,
+                    encoding: Optional[str] = None) -> Dict:
+    """幅度谱 → tremor_spectra 列值 (不含 data_id)"""
+    encoding = encoding or settings.SPECTRUM_ENCODING
+    dtype = SPECTRUM_ENCODINGS.get(encoding)
+    if dtype is None:
+        raise ValueError(f"不支持的频谱编码: {encoding}")
+    values = np.asarray(power, dtype=np.float64).ravel()
+    if not np.isfinite(values).all():
+        raise ValueError("频谱包含 NaN 或无穷大")
+
+    scale = None
+    if encoding == "u8":
+        values = np.clip(values, 0, None)
+        peak = float(values.max()) if len(values) else 0.0
+        scale = peak / 255 if peak > 0 else 1.0
+        packed = np.rint(values / scale).astype(dtype)
+    else:
+        limit = np.finfo(dtype).max
+        packed = np.clip(values, -limit, limit).astype(dtype)
+
+    return {
+        "encoding": encoding,
+        "bins": len(values),
+        "bin_hz": float(bin_hz),
+        "scale": scale,
+        "data": packed.tobytes(),
+    }
+
+
+def encode_spectrum_data(spectrum_data, encoding: Optional[str] = None) -> Optional[Dict]:
+    """设备上传的 {"bin_hz": ..., "power": [...]} → 列值；格式无法识别时返回 None"""
+    if not isinstance(spectrum_data, dict):
+        return None
+    power = spectrum_data.get("power")
+    if not isinstance(power, list) or not power:
+        return None
+    try:
+        return encode_spectrum(power, spectrum_data.get("bin_hz") or FREQ_RESOLUTION, encoding)
+    except (TypeError, ValueError):
+        return None
+
+
+def spectrum_model(spectrum_data, encoding: Optional[str] = None) -> Optional[TremorSpectrum]:
+    """上传数据 → TremorSpectrum (赋给 TremorData.spectrum，随数据行一起 flush)"""
+    values = encode_spectrum_data(spectrum_data, encoding)
+    return TremorSpectrum(**values) if values else None
+
+
+def decode_spectrum(encoding: str, bins: int, scale: Optional[float], data: bytes) -> np.ndarray:
+    """二进制 → (bins,) float32"""
+    values = np.frombuffer(data, dtype=SPECTRUM_ENCODINGS[encoding], count=bins).astype(np.float32)
+    if encoding == "u8":
+        values *= np.float32(scale)
+    return values
+
+
+# ============================================================
+# 批量读取
+# ============================================================
+
+class SpectrumMatrix(NamedTuple):
+    """多条频谱组成的二维数组 (行顺序与 data_ids 一致)"""
+    data_ids: np.ndarray        # (N,) int64
+    bin_hz: np.ndarray          # (N,) float64
+    power: np.ndarray           # (N, max_bins) float32，较短的频谱以 NaN 补齐
+
+    def __len__(self) -> int:
+        return len(self.data_ids)
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        """各列对应的频率 (以第一行的 bin_hz 为准)"""
+        bin_hz = self.bin_hz[0] if len(self.bin_hz) else FREQ_RESOLUTION
+        return np.arange(self.power.shape[1]) * bin_hz
+
+
+def spectra_to_matrix(rows: Iterable) -> SpectrumMatrix:
+    """(data_id, encoding, bins, bin_hz, scale, data) 行 → SpectrumMatrix"""
+    rows = list(rows)
+    if not rows:
+        return SpectrumMatrix(np.empty(0, np.int64), np.empty(0), np.empty((0, 0), np.float32))
+
+    data_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    bin_hz = np.fromiter((r[3] for r in rows), dtype=np.float64, count=len(rows))
+    max_bins = max(r[2] for r in rows)
+    power = np.full((len(rows), max_bins), np.nan, dtype=np.float32)
+
+    # 按 (编码, 长度) 分组，每组拼接后一次解码
+    groups: Dict[tuple, List[int]] = {}
+    for i, r in enumerate(rows):
+        groups.setdefault((r[1], r[2]), []).append(i)
+    for (encoding, bins), index in groups.items():
+        blob = b"".join(rows[i][5] for i in index)
+        values = np.frombuffer(blob, dtype=SPECTRUM_ENCODINGS[encoding]).reshape(len(index), bins)
+        values = values.astype(np.float32)
+        if encoding == "u8":
+            values *= np.array([rows[i][4] for i in index], dtype=np.float32)[:, None]
+        power[index, :bins] = values
+
+    return SpectrumMatrix(data_ids, bin_hz, power)
+
+
+async def load_spectra(db, data_ids: Sequence[int]) -> SpectrumMatrix:
+    """
+    按 data_id 批量读取频谱
+
+    Args:
+        db: AsyncSession 或 AsyncConnection
+        data_ids: 数据 id，没有频谱的 id 不出现在结果中
+
+    Returns:
+        按 data_id 升序排列的 SpectrumMatrix
+    """
+    ids = sorted(set(int(i) for i in data_ids))
+    rows = []
+    for start in range(0, len(ids), LOAD_CHUNK):
+        result = await db.execute(
+            select(
+                _spectra.c.data_id, _spectra.c.encoding, _spectra.c.bins,
+                _spectra.c.bin_hz, _spectra.c.scale, _spectra.c.data,
+            )
+            .where(_spectra.c.data_id.in_(ids[start:start + LOAD_CHUNK]))
+            .order_by(_spectra.c.data_id)
+        )
+        rows.extend(result.all())
+    return spectra_to_matrix(rows)
+
+
+# ============================================================
+# 旧版 JSON 频谱迁移
+# ============================================================
+
+async def migrate_json_spectra(engine, encoding: Optional[str] = None, chunk_rows: int = 5000) -> dict:
+    """
+    将 tremor_data.spectrum_data (JSON) 转换为 tremor_spectra 二进制并清空原列
+
+    每块一个事务，中断后重新执行即可继续；格式无法识别的 JSON 保留原样
+    """
+    encoding = encoding or settings.SPECTRUM_ENCODING
+    stats = {"rows": 0, "converted": 0, "skipped": 0, "json_bytes": 0, "binary_bytes": 0}
+    last_id = 0
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(
+                select(_data.c.id, _data.c.spectrum_data)
+                .where(_data.c.id > last_id, _data.c.spectrum_data.isnot(None))
+                .order_by(_data.c.id)
+                .limit(chunk_rows)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            spectra, converted_ids = [], []
+            for row in rows:
+                if row.spectrum_data is None:
+                    # 旧版写入的 JSON null，直接清空
+                    converted_ids.append(row.id)
+                    continue
+                values = encode_spectrum_data(row.spectrum_data, encoding)
+                if values is None:
+                    stats["skipped"] += 1
+                    continue
+                spectra.append({"data_id": row.id, **values})
+                converted_ids.append(row.id)
+                stats["json_bytes"] += len(json.dumps(row.spectrum_data, separators=(",", ":")))
+                stats["binary_bytes"] += len(values["data"])
+
+            if spectra:
+                # 已有二进制频谱的行以新转换结果为准
+                await conn.execute(
+                    _spectra.delete().where(_spectra.c.data_id.in_([s["data_id"] for s in spectra]))
+                )
+                await conn.execute(_spectra.insert(), spectra)
+            if converted_ids:
+                await conn.execute(
+                    update(_data).where(_data.c.id.in_(converted_ids)).values(spectrum_data=None)
+                )
+            stats["rows"] += len(rows)
+            stats["converted"] += len(spectra)
+        print(f"  已处理 {stats['rows']} 行 (转换 {stats['converted']}，跳过 {stats['skipped']})")
+    return stats
+
+
+async def main(args):
+    from app.core.database import engine, init_db
+    await init_db()
+
+    if not args.migrate:
+        print("未指定操作 (--migrate)")
+        return
+    start = time.perf_counter()
+    stats = await migrate_json_spectra(engine, args.encoding, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    ratio = stats["json_bytes"] / stats["binary_bytes"] if stats["binary_bytes"] else 0
+    print(
+        f"✅ 转换完成: {stats['converted']} 条频谱，跳过 {stats['skipped']} 条，用时 {elapsed:.1f}s；"
+        f"JSON {stats['json_bytes'] / 1e6:.1f} MB → 二进制 {stats['binary_bytes'] / 1e6:.1f} MB ({ratio:.1f}x)"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="频谱二进制存储工具")
+    parser.add_argument("--migrate", action="store_true", help="将 tremor_data.spectrum_data (JSON) 转换为二进制")
+    parser.add_argument("--encoding", choices=sorted(SPECTRUM_ENCODINGS), default=None,
+                        help="编码 (默认 SPECTRUM_ENCODING)")
+    parser.add_argument("--chunk-rows", type=int, default=5000, help="每个事务处理的行数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,199 @@
+"""
+Tremor Guard - Time Series Downsampling
+震颤卫士 - 图表时间序列降采样
+
+/api/data/series 按时间范围读取单个指标列，降采样到目标点数后返回，
+无论时间范围多长，图表拿到的点数都不超过 SERIES_MAX_POINTS。
+
+- 只读取 (timestamp, 指标) 两列，流式分批 (yield_per) 转为 NumPy 数组
+- lttb:   Largest-Triangle-Three-Buckets，保留视觉形状，需要全部点在内存中；
+          行数超过 SERIES_LTTB_MAX_ROWS 时把已读取的部分并入 min/max 桶，
+          剩余部分改为流式 min/max (method 返回 minmax)
+- minmax: 把时间范围等分为 points/2 个桶，每桶保留最小值和最大值两个点 (按时间先后)，
+          逐批累加，内存只与桶数有关，适合很长的时间范围
+原始点数不超过目标点数时原样返回。
+"""
+
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.tremor_data import TremorData, TremorSession
+
+# 可查询的指标
+METRICS = {
+    "severity": TremorData.severity,
+    "rms_amplitude": TremorData.rms_amplitude,
+    "frequency": TremorData.frequency,
+    "band_power": TremorData.band_power,
+    "amplitude": TremorData.amplitude,
+}
+
+# 每批读取的行数
+STREAM_BATCH = 20000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Series(NamedTuple):
+    """降采样结果"""
+    t: np.ndarray               # (N,) Unix 时间戳 (秒，float64)
+    v: np.ndarray               # (N,) float64
+    raw_points: int             # 范围内的原始点数
+    method: str                 # none / lttb / minmax
+
+
+def _seconds(dt: datetime) -> float:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH).total_seconds()
+
+
+# ============================================================
+# 降采样算法
+# ============================================================
+
+def lttb(t: np.ndarray, v: np.ndarray, points: int):
+    """
+    Largest-Triangle-Three-Buckets
+
+    保留首尾两点，中间 n-2 个点等分为 points-2 个桶，每桶选出与
+    (上一个已选点, 下一桶均值点) 构成三角形面积最大的点
+    """
+    n = len(t)
+    if points >= n or points < 3:
+        return t, v
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # 各桶均值 (最后一桶之后以末点作为 "下一桶")
+    sums_t = np.add.reduceat(t[1:n - 1], edges[:-1] - 1)
+    sums_v = np.add.reduceat(v[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_t = np.r_[sums_t / sizes, t[-1]]
+    avg_v = np.r_[sums_v / sizes, v[-1]]
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 三角形面积的 2 倍 (不需要绝对大小，只比较)
+        area = np.abs(
+            (t[a] - avg_t[i + 1]) * (v[lo:hi] - v[a])
+            - (t[a] - t[lo:hi]) * (avg_v[i + 1] - v[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return t[selected], v[selected]
+
+
+class MinMaxBuckets:
+    """按固定时间桶累加最小值/最大值点 (可逐批调用 add，时间需有序)"""
+
+    def __init__(self, start: float, end: float, buckets: int):
+        self.start = start
+        self.width = max(end - start, 1e-9) / buckets
+        self.buckets = buckets
+        self.min_v = np.full(buckets, np.inf)
+        self.max_v = np.full(buckets, -np.inf)
+        self.min_t = np.zeros(buckets)
+        self.max_t = np.zeros(buckets)
+
+    def add(self, t: np.ndarray, v: np.ndarray):
+        if not len(t):
+            return
+        index = np.clip(((t - self.start) // self.width).astype(np.int64), 0, self.buckets - 1)
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        rows = index[starts]
+        ends = np.r_[starts[1:], len(t)]
+        # 每段内的最小/最大值位置 (段内取第一个出现的)
+        seg_min = np.minimum.reduceat(v, starts)
+        seg_max = np.maximum.reduceat(v, starts)
+        arg_min = starts + np.array([np.argmin(v[s:e]) for s, e in zip(starts, ends)], dtype=np.int64)
+        arg_max = starts + np.array([np.argmax(v[s:e]) for s, e in zip(starts, ends)], dtype=np.int64)
+
+        better_min = seg_min < self.min_v[rows]
+        better_max = seg_max > self.max_v[rows]
+        self.min_v[rows[better_min]] = seg_min[better_min]
+        self.min_t[rows[better_min]] = t[arg_min[better_min]]
+        self.max_v[rows[better_max]] = seg_max[better_max]
+        self.max_t[rows[better_max]] = t[arg_max[better_max]]
+
+    def result(self):
+        """每个非空桶的最小值、最大值两点 (相同时只保留一个)，按时间排序"""
+        filled = np.isfinite(self.min_v)
+        t = np.r_[self.min_t[filled], self.max_t[filled]]
+        v = np.r_[self.min_v[filled], self.max_v[filled]]
+        order = np.argsort(t, kind="stable")
+        t, v = t[order], v[order]
+        keep = np.r_[True, (np.diff(t) != 0) | (np.diff(v) != 0)]
+        return t[keep], v[keep]
+
+
+# ============================================================
+# 查询
+# ============================================================
+
+async def load_series(db, user_id: int, metric: str, start: datetime, end: datetime, points: int,
+                      method: str = "lttb", session_id: Optional[int] = None,
+                      device_pk: Optional[int] = None) -> Series:
+    """
+    读取 [start, end) 内的指标并降采样到不超过 points 个点
+
+    Args:
+        method: lttb / minmax
+        device_pk: devices.id (按设备筛选)
+    """
+    column = METRICS[metric]
+    query = (
+        select(TremorData.timestamp, column)
+        .join(TremorSession, TremorSession.id == TremorData.session_id)
+        .where(
+            TremorSession.user_id == user_id,
+            TremorData.timestamp >= start,
+            TremorData.timestamp < end,
+            column.isnot(None),
+        )
+        .order_by(TremorData.timestamp)
+    )
+    if session_id is not None:
+        query = query.where(TremorData.session_id == session_id)
+    if device_pk is not None:
+        query = query.where(TremorSession.device_id == device_pk)
+
+    # 超过该行数后改为流式 min/max (minmax 也先缓存不超过目标点数的行，少量数据原样返回)
+    max_rows = settings.SERIES_LTTB_MAX_ROWS if method == "lttb" else points
+    buckets: Optional[MinMaxBuckets] = None
+    chunks_t: List[np.ndarray] = []
+    chunks_v: List[np.ndarray] = []
+    raw_points = 0
+
+    result = await db.stream(query.execution_options(yield_per=STREAM_BATCH))
+    async for rows in result.partitions(STREAM_BATCH):
+        t = np.array([r[0] for r in rows], dtype="datetime64[us]").astype(np.int64) / 1e6
+        v = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        raw_points += len(rows)
+        if buckets is None and raw_points <= max_rows:
+            chunks_t.append(t)
+            chunks_v.append(v)
+            continue
+        if buckets is None:
+            # 超出上限，已读取的部分并入 min/max 桶
+            buckets = MinMaxBuckets(_seconds(start), _seconds(end), max(1, points // 2))
+            for ct, cv in zip(chunks_t, chunks_v):
+                buckets.add(ct, cv)
+            chunks_t, chunks_v = [], []
+        buckets.add(t, v)
+
+    if buckets is not None:
+        t, v = buckets.result()
+        return Series(t, v, raw_points, "minmax")
+
+    t = np.concatenate(chunks_t) if chunks_t else np.empty(0)
+    v = np.concatenate(chunks_v) if chunks_v else np.empty(0)
+    if raw_points <= points:
+        return Series(t, v, raw_points, "none")
+    t, v = lttb(t, v, points)
+    return Series(t, v, raw_points, "lttb")
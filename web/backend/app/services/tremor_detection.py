@@ -0,0 +1,204 @@
+"""
+Tremor Guard - Tremor Detection Engine
+震颤卫士 - 服务端震颤检测引擎
+
+与固件 tremor_detection.cpp 完全相同的检测流程，用 NumPy 向量化实现:
+1. 原始加速度 (int16, ±2g) 换算为 g，计算合成幅度 √(x² + y² + z²)
+2. 去除直流分量，应用 Hamming 窗
+3. FFT 幅度谱，在 4-6Hz 频段内求峰值和频段功率
+4. 频段功率阈值、峰值频率范围、RMS 上下限、严重度分级
+
+多个窗口组成 (N, 256) 的二维数组，一次 rfft 完成全部窗口的计算。
+
+与固件保持一致的细节 (修改前请先确认固件行为):
+- 频段 bin 范围由编译期常量 TREMOR_FREQ_MIN/MAX 决定 (8-12)，运行时配置
+  freq_min/freq_max 只用于判断峰值频率；因此峰值落在 bin 8 (3.906Hz) 时不会判定为震颤
+- 固件在 complexToMagnitude() 之后用幅度谱缓冲区计算 "RMS"，
+  即 sqrt(Σ|X_k|² / N)，按 Parseval 定理等于加窗去直流信号的平方和开方
+- 峰值搜索使用严格大于，相同幅度时取较低的 bin
+- 频段功率阈值 (0.5) 远小于强运动的 Hamming 窗频谱泄漏，RMS 在有效范围内的
+  频段外运动同样会判定为震颤
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+# ============================================================
+# 固件参数 (tremor_config.h)
+# ============================================================
+
+FFT_SAMPLES = 256
+SAMPLE_RATE = 125
+FREQ_RESOLUTION = SAMPLE_RATE / FFT_SAMPLES
+ACCEL_SENSITIVITY = 16384.0             # LSB/g (±2g 量程)
+HALF_BINS = FFT_SAMPLES // 2
+
+# 频段 bin 范围 (编译期常量，不随运行时配置变化)
+BAND_START_BIN = max(1, int(4.0 / FREQ_RESOLUTION))
+BAND_END_BIN = min(HALF_BINS - 1, int(6.0 / FREQ_RESOLUTION))
+
+SEVERITY_LABELS = ("无", "轻微", "轻度", "中度", "重度")
+SEVERITY_LABELS_EN = ("None", "Slight", "Mild", "Moderate", "Severe")
+
+# arduinoFFT 的 Hamming 窗 (对称，分母 N-1)
+HAMMING_WINDOW = np.hamming(FFT_SAMPLES)
+
+
+class DetectionParams(NamedTuple):
+    """运行时检测参数 (对应固件 TremorRuntimeConfig)"""
+    rms_min: float = 2.5
+    rms_max: float = 5.0
+    power_threshold: float = 0.5
+    freq_min: float = 4.0
+    freq_max: float = 6.0
+    severity_thresholds: Sequence[float] = (2.5, 3.0, 3.5, 4.0)
+
+    @classmethod
+    def from_config(cls, config) -> "DetectionParams":
+        """从 app.api.config.TremorConfig 等同名属性对象构造"""
+        return cls(
+            rms_min=config.rms_min,
+            rms_max=config.rms_max,
+            power_threshold=config.power_threshold,
+            freq_min=config.freq_min,
+            freq_max=config.freq_max,
+            severity_thresholds=tuple(config.severity_thresholds),
+        )
+
+
+DEFAULT_PARAMS = DetectionParams()
+
+
+class DetectionBatch(NamedTuple):
+    """一批窗口的检测结果 (列式，每个字段长度为 N)"""
+    detected: np.ndarray
+    valid: np.ndarray
+    out_of_range: np.ndarray
+    frequency: np.ndarray
+    peak_bin: np.ndarray
+    peak_power: np.ndarray
+    band_power: np.ndarray
+    total_power: np.ndarray
+    peak_ratio: np.ndarray
+    amplitude: np.ndarray
+    rms_amplitude: np.ndarray
+    severity: np.ndarray
+    spectrum: Optional[np.ndarray] = None   # (N, 129) 幅度谱，keep_spectrum=True 时返回
+
+    def __len__(self) -> int:
+        return len(self.detected)
+
+    def to_records(self) -> List[Dict]:
+        """转换为与设备上传 (TremorDataUpload) 字段一致的字典列表"""
+        columns = {
+            "detected": self.detected.tolist(),
+            "valid": self.valid.tolist(),
+            "out_of_range": self.out_of_range.tolist(),
+            "frequency": self.frequency.tolist(),
+            "peak_power": self.peak_power.tolist(),
+            "band_power": self.band_power.tolist(),
+            "amplitude": self.amplitude.tolist(),
+            "rms_amplitude": self.rms_amplitude.tolist(),
+            "severity": self.severity.tolist(),
+        }
+        records = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        for record in records:
+            record["severity_label"] = SEVERITY_LABELS[record["severity"]]
+        return records
+
+
+# ============================================================
+# 检测流程
+# ============================================================
+
+def magnitude_from_raw(raw: np.ndarray, sensitivity: float = ACCEL_SENSITIVITY) -> np.ndarray:
+    """
+    原始三轴加速度 (..., 256, 3) int16 → 合成幅度 (..., 256) g
+
+    与固件一致: 分量与平方和为 float32，开方为 double
+    """
+    accel = np.asarray(raw).astype(np.float32) / np.float32(sensitivity)
+    return np.sqrt(np.einsum("...k,...k->...", accel, accel).astype(np.float64))
+
+
+def classify_features(frequency: np.ndarray, band_power: np.ndarray, rms: np.ndarray,
+                      params: DetectionParams = DEFAULT_PARAMS):
+    """
+    由频谱特征判定 (tremorAnalyze() 的判定部分)
+
+    缺失的特征传 NaN: 任何比较都不成立，不会判定为震颤或超限
+
+    Returns:
+        (detected, out_of_range, severity)
+    """
+    with np.errstate(invalid="ignore"):
+        spectral_ok = (
+            (band_power > params.power_threshold)
+            & (frequency >= params.freq_min) & (frequency <= params.freq_max)
+        )
+        out_of_range = rms > params.rms_max
+        detected = spectral_ok & (rms >= params.rms_min) & ~out_of_range
+    severity = np.where(
+        detected, np.searchsorted(np.asarray(params.severity_thresholds), rms, side="right"), 0
+    )
+    return detected, out_of_range, severity
+
+
+def analyze_windows(magnitude: np.ndarray, params: DetectionParams = DEFAULT_PARAMS,
+                    keep_spectrum: bool = False) -> DetectionBatch:
+    """
+    批量检测
+
+    Args:
+        magnitude: (N, 256) 合成加速度幅度 (g)，单个窗口可传 (256,)
+        params: 运行时检测参数
+        keep_spectrum: 是否返回幅度谱
+    """
+    x = np.atleast_2d(np.asarray(magnitude, dtype=np.float64))
+    if x.shape[-1] != FFT_SAMPLES:
+        raise ValueError(f"每个窗口必须为 {FFT_SAMPLES} 个样本，实际为 {x.shape[-1]}")
+
+    # 去直流 + Hamming 窗 + 一次 rfft 得到全部窗口的幅度谱 (bin 0..128)
+    x = (x - x.mean(axis=1, keepdims=True)) * HAMMING_WINDOW
+    spectrum = np.abs(np.fft.rfft(x, axis=1))
+
+    # 频段峰值与功率
+    band = spectrum[:, BAND_START_BIN:BAND_END_BIN + 1]
+    peak_bin = BAND_START_BIN + band.argmax(axis=1)
+    peak_power = band.max(axis=1)
+    band_power = band.sum(axis=1)
+    total_power = spectrum[:, 1:HALF_BINS].sum(axis=1)
+    avg_power = total_power / (HALF_BINS - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        peak_ratio = np.where(avg_power > 0, peak_power / avg_power, 0.0)
+    frequency = peak_bin * FREQ_RESOLUTION
+
+    # 固件 "RMS": 全部 256 个 bin 的幅度平方均值开方 (rfft 的 1..127 bin 各对应两个共轭 bin)
+    energy = spectrum[:, 0] ** 2 + spectrum[:, HALF_BINS] ** 2 + 2 * (spectrum[:, 1:HALF_BINS] ** 2).sum(axis=1)
+    rms = np.sqrt(energy / FFT_SAMPLES)
+
+    detected, out_of_range, severity = classify_features(frequency, band_power, rms, params)
+
+    return DetectionBatch(
+        detected=detected,
+        valid=~out_of_range,
+        out_of_range=out_of_range,
+        frequency=frequency,
+        peak_bin=peak_bin,
+        peak_power=peak_power,
+        band_power=band_power,
+        total_power=total_power,
+        peak_ratio=peak_ratio,
+        amplitude=band_power / HALF_BINS,
+        rms_amplitude=rms,
+        severity=severity,
+        spectrum=spectrum if keep_spectrum else None,
+    )
+
+
+def analyze_raw(raw: np.ndarray, params: DetectionParams = DEFAULT_PARAMS,
+                keep_spectrum: bool = False) -> DetectionBatch:
+    """批量检测原始三轴数据 (N, 256, 3)"""
+    return analyze_windows(magnitude_from_raw(raw), params, keep_spectrum)
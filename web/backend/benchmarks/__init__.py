@@ -0,0 +1,7 @@
+"""
+Tremor Guard - Benchmarks
+震颤卫士 - 性能基准测试
+
+在 web/backend 目录下运行:
+    python -m benchmarks.<模块名>
+"""
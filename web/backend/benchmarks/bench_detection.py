@@ -0,0 +1,303 @@
+"""
+Tremor Guard - Detection Engine Verification & Benchmark
+震颤卫士 - 服务端检测引擎校验与基准测试
+
+1. 黄金向量: 按固件规则构造的原始 int16 窗口 (已知主频/幅度)，
+   校验分类结果 (是否检出、峰值 bin、严重度、是否超限)
+2. 逐窗口参考实现: 逐行移植 tremor_detection.cpp (完整 256 点 FFT + 循环)，
+   与向量化引擎在随机窗口上逐字段比对
+3. 设备采集数据: --golden 指定 JSONL 文件 (每行一个窗口的 raw 与固件输出)，逐条比对
+4. 吞吐量: 参考实现、逐窗口调用、不同批大小的 windows/sec
+
+任何校验失败时退出码非 0。
+
+--golden 文件格式 (每行一个 JSON 对象，raw 为 256 组 [ax, ay, az] 原始值):
+    {"raw": [[12, -40, 16390], ...], "frequency": 5.37, "band_power": 6.1,
+     "rms_amplitude": 3.2, "detected": true, "severity": 2}
+
+Usage:
+    python -m benchmarks.bench_detection
+    python -m benchmarks.bench_detection --windows 65536 --batch-sizes 1,64,1024,16384
+    python -m benchmarks.bench_detection --golden captures/device_001.jsonl
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from app.services.tremor_detection import (
+    ACCEL_SENSITIVITY, BAND_END_BIN, BAND_START_BIN, DEFAULT_PARAMS, FFT_SAMPLES, FREQ_RESOLUTION,
+    SAMPLE_RATE, DetectionParams, analyze_raw, analyze_windows, magnitude_from_raw,
+)
+from benchmarks.common import write_results
+
+
+# ============================================================
+# 逐窗口参考实现 (逐行对应 tremor_detection.cpp)
+# ============================================================
+
+def reference_analyze(raw: np.ndarray, params: DetectionParams = DEFAULT_PARAMS) -> dict:
+    """单个窗口 (256, 3) 的参考实现"""
+    n = FFT_SAMPLES
+
+    # collectSamples(): float 分量，double 幅度
+    v_real = []
+    for ax, ay, az in raw:
+        ax = np.float32(ax) / np.float32(ACCEL_SENSITIVITY)
+        ay = np.float32(ay) / np.float32(ACCEL_SENSITIVITY)
+        az = np.float32(az) / np.float32(ACCEL_SENSITIVITY)
+        v_real.append(math.sqrt(float(ax * ax + ay * ay + az * az)))
+
+    # removeDC()
+    mean = sum(v_real) / n
+    v_real = [v - mean for v in v_real]
+
+    # FFT.windowing(Hamming, Forward): 对称加权
+    for i in range(n >> 1):
+        w = 0.54 - 0.46 * math.cos(2 * math.pi * i / (n - 1))
+        v_real[i] *= w
+        v_real[n - (i + 1)] *= w
+
+    # FFT.compute() + complexToMagnitude(): 全部 256 个 bin
+    magnitude = np.abs(np.fft.fft(v_real)).tolist()
+
+    # analyzeSpectrum()
+    start_bin = max(1, int(4.0 / FREQ_RESOLUTION))
+    end_bin = min(n // 2 - 1, int(6.0 / FREQ_RESOLUTION))
+    max_power, max_bin, band_power, total_power = 0.0, start_bin, 0.0, 0.0
+    for i in range(1, n // 2):
+        total_power += magnitude[i]
+    for i in range(start_bin, end_bin + 1):
+        band_power += magnitude[i]
+        if magnitude[i] > max_power:
+            max_power = magnitude[i]
+            max_bin = i
+    frequency = max_bin * FREQ_RESOLUTION
+
+    # detectTremorInSpectrum()
+    spectrum_detected = (
+        band_power > params.power_threshold
+        and params.freq_min <= frequency <= params.freq_max
+    )
+
+    # tremorAnalyze(): 在幅度谱缓冲区上计算 RMS
+    rms = math.sqrt(sum(m * m for m in magnitude) / n)
+    result = {
+        "frequency": frequency, "peak_bin": max_bin, "peak_power": max_power,
+        "band_power": band_power, "total_power": total_power, "amplitude": band_power / (n // 2),
+        "rms_amplitude": rms, "detected": False, "valid": True, "out_of_range": False, "severity": 0,
+    }
+    if rms > params.rms_max:
+        result.update(valid=False, out_of_range=True)
+        return result
+    result["detected"] = spectrum_detected and rms >= params.rms_min
+    if result["detected"]:
+        severity = 4
+        for level, threshold in enumerate(params.severity_thresholds):
+            if rms < threshold:
+                severity = level
+                break
+        result["severity"] = severity
+    return result
+
+
+# ============================================================
+# 窗口生成
+# ============================================================
+
+def synth_raw(frequency: np.ndarray, amplitude: np.ndarray, noise: float = 0.01,
+              seed: int = 0) -> np.ndarray:
+    """
+    生成 (N, 256, 3) int16 原始窗口: 重力沿 z 轴，震颤叠加在 z 轴 (幅度 g) 上，
+    三轴加少量白噪声，按 ±2g 量程截断
+    """
+    rng = np.random.default_rng(seed)
+    frequency = np.atleast_1d(frequency)[:, None]
+    amplitude = np.atleast_1d(amplitude)[:, None]
+    count = frequency.shape[0]
+    t = np.arange(FFT_SAMPLES)[None, :] / SAMPLE_RATE
+    phase = rng.uniform(0, 2 * np.pi, (count, 1))
+
+    accel = rng.normal(0, noise, (count, FFT_SAMPLES, 3))
+    accel[:, :, 2] += 1.0 + amplitude * np.sin(2 * np.pi * frequency * t + phase)
+    counts = np.round(accel * ACCEL_SENSITIVITY)
+    return np.clip(counts, -32768, 32767).astype(np.int16)
+
+
+class GoldenCase(NamedTuple):
+    name: str
+    frequency: float
+    amplitude: float
+    detected: bool
+    peak_bin: Optional[int]
+    severity: int
+    out_of_range: bool = False
+
+
+# 主频取整数 bin 以避免频谱泄漏导致的峰值 bin 歧义；
+# 加窗信号的 "RMS" ≈ 7.1 × 正弦幅度 (g)
+GOLDEN_CASES = [
+    GoldenCase("静止 (仅重力)", 5.0, 0.0, False, None, 0),
+    GoldenCase("5.37Hz 轻微", 11 * FREQ_RESOLUTION, 0.38, True, 11, 1),
+    GoldenCase("5.37Hz 轻度", 11 * FREQ_RESOLUTION, 0.45, True, 11, 2),
+    GoldenCase("4.88Hz 中度", 10 * FREQ_RESOLUTION, 0.52, True, 10, 3),
+    GoldenCase("4.39Hz 重度", 9 * FREQ_RESOLUTION, 0.62, True, 9, 4),
+    GoldenCase("5.86Hz 频段上沿", 12 * FREQ_RESOLUTION, 0.45, True, 12, 2),
+    GoldenCase("3.91Hz 低于频率下限", 8 * FREQ_RESOLUTION, 0.45, False, 8, 0),
+    GoldenCase("5.37Hz RMS 不足", 11 * FREQ_RESOLUTION, 0.2, False, 11, 0),
+    # 频谱泄漏使频段功率超过阈值，固件同样判定为震颤
+    GoldenCase("9Hz 频段外运动", 9.0, 0.45, True, None, 2),
+    GoldenCase("5.37Hz 超出 RMS 上限", 11 * FREQ_RESOLUTION, 0.8, False, 11, 0, True),
+]
+
+
+# ============================================================
+# 校验
+# ============================================================
+
+NUMERIC_FIELDS = ("frequency", "peak_power", "band_power", "total_power", "amplitude", "rms_amplitude")
+EXACT_FIELDS = ("detected", "valid", "out_of_range", "peak_bin", "severity")
+
+
+def check_golden_cases() -> List[str]:
+    raw = synth_raw(
+        np.array([c.frequency for c in GOLDEN_CASES]), np.array([c.amplitude for c in GOLDEN_CASES]), seed=1
+    )
+    batch = analyze_raw(raw)
+    failures = []
+    for i, case in enumerate(GOLDEN_CASES):
+        got = {
+            "detected": bool(batch.detected[i]), "peak_bin": int(batch.peak_bin[i]),
+            "severity": int(batch.severity[i]), "out_of_range": bool(batch.out_of_range[i]),
+        }
+        expected = {"detected": case.detected, "severity": case.severity, "out_of_range": case.out_of_range}
+        if case.peak_bin is not None:
+            expected["peak_bin"] = case.peak_bin
+        ok = all(got[key] == value for key, value in expected.items())
+        print(
+            f"  {'✓' if ok else '✗'} {case.name:20} rms={batch.rms_amplitude[i]:6.3f} "
+            f"band={batch.band_power[i]:8.3f} bin={got['peak_bin']:3d} severity={got['severity']}"
+        )
+        if not ok:
+            failures.append(f"{case.name}: 期望 {expected}，实际 {got}")
+    return failures
+
+
+def check_against_reference(count: int, seed: int) -> List[str]:
+    """随机窗口 (覆盖频段内外、各严重度、超限) 逐字段比对参考实现"""
+    rng = np.random.default_rng(seed)
+    raw = synth_raw(rng.uniform(0.5, 12.0, count), rng.uniform(0.0, 0.85, count), noise=0.05, seed=seed)
+    batch = analyze_raw(raw)
+    failures = []
+    for i in range(count):
+        ref = reference_analyze(raw[i])
+        for field in EXACT_FIELDS:
+            got = getattr(batch, field)[i].item()
+            if got != ref[field]:
+                failures.append(f"窗口 {i} {field}: 参考 {ref[field]}，向量化 {got}")
+        for field in NUMERIC_FIELDS:
+            if not math.isclose(getattr(batch, field)[i], ref[field], rel_tol=1e-9, abs_tol=1e-9):
+                failures.append(f"窗口 {i} {field}: 参考 {ref[field]}，向量化 {getattr(batch, field)[i]}")
+    return failures
+
+
+def check_device_captures(path: str) -> List[str]:
+    """设备采集的窗口与固件输出比对 (固件 frequency 为 float，放宽到 1e-3)"""
+    failures = []
+    with open(path, encoding="utf-8") as f:
+        captures = [json.loads(line) for line in f if line.strip()]
+    if not captures:
+        return [f"{path} 中没有数据"]
+    batch = analyze_raw(np.array([c["raw"] for c in captures], dtype=np.int16))
+    for i, capture in enumerate(captures):
+        for field in ("detected", "severity"):
+            if field in capture and getattr(batch, field)[i].item() != capture[field]:
+                failures.append(f"第 {i + 1} 行 {field}: 固件 {capture[field]}，引擎 {getattr(batch, field)[i]}")
+        for field in ("frequency", "band_power", "rms_amplitude"):
+            if field in capture and not math.isclose(getattr(batch, field)[i], capture[field], rel_tol=1e-3, abs_tol=1e-4):
+                failures.append(f"第 {i + 1} 行 {field}: 固件 {capture[field]}，引擎 {getattr(batch, field)[i]:.6f}")
+    print(f"  {len(captures)} 个设备窗口，{len(failures)} 处不一致")
+    return failures
+
+
+# ============================================================
+# 吞吐量
+# ============================================================
+
+def _rate(count: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def bench_throughput(windows: int, batch_sizes: List[int], reference_windows: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    raw = synth_raw(rng.uniform(0.5, 12.0, windows), rng.uniform(0.0, 0.85, windows), noise=0.05, seed=seed)
+    magnitude = magnitude_from_raw(raw)
+    results = {}
+
+    n = min(reference_windows, windows)
+    results["reference_per_window"] = _rate(n, lambda: [reference_analyze(w) for w in raw[:n]])
+
+    n = min(windows, 5000)
+    results["vectorized_per_window"] = _rate(n, lambda: [analyze_windows(w) for w in magnitude[:n]])
+
+    for size in batch_sizes:
+        size = min(size, windows)
+        total = windows - windows % size
+        results[f"batch_{size}"] = _rate(
+            total, lambda: [analyze_windows(magnitude[i:i + size]) for i in range(0, total, size)]
+        )
+    results["raw_batch_all"] = _rate(windows, lambda: analyze_raw(raw))
+
+    for name, rate in results.items():
+        print(f"  {name:24} {rate:14,.0f} windows/s")
+    return {name: round(rate, 1) for name, rate in results.items()}
+
+
+def main(args) -> int:
+    failures = []
+
+    print("黄金向量:")
+    failures += check_golden_cases()
+
+    print(f"参考实现比对 ({args.reference_windows} 个随机窗口):")
+    mismatches = check_against_reference(args.reference_windows, args.seed)
+    print(f"  {len(mismatches)} 处不一致")
+    failures += mismatches
+
+    if args.golden:
+        print(f"设备采集数据 ({args.golden}):")
+        failures += check_device_captures(args.golden)
+
+    print(f"吞吐量 ({args.windows} 个窗口):")
+    throughput = bench_throughput(
+        args.windows, [int(s) for s in args.batch_sizes.split(",")], args.reference_windows, args.seed
+    )
+
+    path = write_results("detection", {
+        "params": vars(args),
+        "band_bins": [BAND_START_BIN, BAND_END_BIN],
+        "failures": failures[:100],
+        "windows_per_second": throughput,
+    })
+    print(f"结果已写入 {path}")
+
+    for failure in failures[:20]:
+        print(f"✗ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="服务端震颤检测引擎校验与吞吐量测试")
+    parser.add_argument("--windows", type=int, default=16384, help="吞吐量测试窗口数")
+    parser.add_argument("--batch-sizes", default="1,16,256,4096", help="批大小 (逗号分隔)")
+    parser.add_argument("--reference-windows", type=int, default=500, help="与参考实现比对的窗口数")
+    parser.add_argument("--golden", default=None, help="设备采集数据 JSONL 文件")
+    parser.add_argument("--seed", type=int, default=7, help="随机种子")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,259 @@
+"""
+Tremor Guard - Live Stream Benchmark
+震颤卫士 - 实时推送基准测试
+
+N 个 WebSocket 连接 (默认 1000) 订阅同一患者，测量推送吞吐量与延迟:
+1. broker: 直接向 live_broker 发布事件 (只测分发与发送，不含数据库)
+2. upload: 通过 /api/data/upload/batch 上传 (提交后推送)
+另有 --slow 个慢连接 (每条消息发送耗时 --slow-ms)，验证慢连接只丢弃自己的旧消息，
+不影响其他连接 (其余连接应零丢弃)
+
+进程内运行时直接以 ASGI 协议驱动 /api/data/live 端点 (无需 WebSocket 客户端库)；
+--base-url 压测运行中的服务时需要安装 websockets
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_live --subscribers 1000 --events 2000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from urllib.parse import urlencode
+
+from app.api.auth import create_access_token
+from app.core.database import init_db
+from app.core.live_stream import live_broker, user_topic
+from benchmarks.common import app_client, latency_summary, write_results
+from benchmarks.dataset import find_dataset, generate_dataset
+
+TAG = "live"
+EVENT_PREFIX = '{"type":"tremor"'
+
+
+# ============================================================
+# 连接
+# ============================================================
+
+class LiveClient:
+    """一个订阅连接的接收统计"""
+
+    def __init__(self, slow_seconds: float = 0.0, sample: bool = False):
+        self.slow_seconds = slow_seconds
+        self.sample = sample
+        self.received = 0
+        self.dropped = 0
+        self.last_received = 0.0
+        self.latencies_ms: List[float] = []
+        self.subscribed = asyncio.Event()
+        self.closed: Optional[int] = None
+
+    async def on_message(self, message: str):
+        if message.startswith(EVENT_PREFIX):
+            self.received += 1
+            self.last_received = time.perf_counter()
+            if self.sample:
+                sent = datetime.fromisoformat(json.loads(message)["timestamp"])
+                self.latencies_ms.append((datetime.utcnow() - sent).total_seconds() * 1000)
+            if self.slow_seconds:
+                await asyncio.sleep(self.slow_seconds)
+        elif message.startswith('{"type": "dropped"'):
+            self.dropped += json.loads(message)["count"]
+        elif message.startswith('{"type": "subscribed"'):
+            self.subscribed.set()
+
+
+class AsgiWebSocket:
+    """进程内 WebSocket 连接 (按 ASGI 协议直接调用应用)"""
+
+    def __init__(self, app, path: str, client: LiveClient):
+        self.client = client
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._incoming.put_nowait({"type": "websocket.connect"})
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+            "headers": [(b"host", b"bench")], "server": ("bench", 80), "client": ("127.0.0.1", 0),
+            "subprotocols": [],
+        }
+        self._task = asyncio.create_task(app(scope, self._incoming.get, self._send))
+
+    async def _send(self, message: dict):
+        if message["type"] == "websocket.send":
+            await self.client.on_message(message["text"])
+        elif message["type"] == "websocket.close":
+            self.client.closed = message.get("code", 1000)
+            self.client.subscribed.set()
+
+    async def close(self):
+        self._incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+class RemoteWebSocket:
+    """连接运行中的服务 (需要 websockets)"""
+
+    def __init__(self, url: str, client: LiveClient):
+        self.client = client
+        self._task = asyncio.create_task(self._run(url))
+
+    async def _run(self, url: str):
+        try:
+            import websockets
+        except ImportError:
+            raise SystemExit("压测运行中的服务需要安装 websockets: pip install websockets")
+        try:
+            async with websockets.connect(url, max_queue=None) as ws:
+                async for message in ws:
+                    await self.client.on_message(message)
+        except websockets.ConnectionClosed as e:
+            self.client.closed = e.code
+        finally:
+            self.client.subscribed.set()
+
+    async def close(self):
+        self._task.cancel()
+
+
+# ============================================================
+# 压测
+# ============================================================
+
+def make_items(count: int, offset: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [{
+        "timestamp": now.isoformat(), "detected": (offset + i) % 3 == 0, "valid": True,
+        "frequency": 5.0, "peak_power": 0.4, "band_power": 0.3, "amplitude": 0.2,
+        "rms_amplitude": 0.1, "severity": 1, "severity_label": "mild",
+    } for i in range(count)]
+
+
+async def run_round(name: str, publish, clients: List[LiveClient], events: int, batch: int,
+                    settle_seconds: float) -> dict:
+    """发布 events 条事件 (每次 batch 条)，等待快连接全部收到"""
+    fast = [c for c in clients if not c.slow_seconds]
+    base = {id(c): c.received for c in clients}
+    dropped_base = {id(c): c.dropped for c in clients}
+    for c in clients:
+        c.latencies_ms.clear()
+
+    start = time.perf_counter()
+    for offset in range(0, events, batch):
+        await publish(make_items(min(batch, events - offset), offset))
+        await asyncio.sleep(0)
+    publish_seconds = time.perf_counter() - start
+
+    deadline = time.perf_counter() + settle_seconds
+    while time.perf_counter() < deadline:
+        if all(c.received - base[id(c)] >= events for c in fast):
+            break
+        await asyncio.sleep(0.01)
+    # 慢连接的丢弃通知在下一次取队列时发送
+    await asyncio.sleep(0.2)
+
+    delivered = sum(c.received - base[id(c)] for c in clients)
+    end = max((c.last_received for c in clients), default=start)
+    elapsed = max(end - start, 1e-9)
+    incomplete = sum(1 for c in fast if c.received - base[id(c)] < events)
+    result = {
+        "events": events,
+        "publish_seconds": round(publish_seconds, 3),
+        "deliver_seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1),
+        "messages_per_second": round(delivered / elapsed, 1),
+        "delivered": delivered,
+        "expected_fast": events * len(fast),
+        "incomplete_fast": incomplete,
+        "dropped_fast": sum(c.dropped - dropped_base[id(c)] for c in fast),
+        "dropped_slow": sum(c.dropped - dropped_base[id(c)] for c in clients if c.slow_seconds),
+        "latency": latency_summary([ms for c in clients for ms in c.latencies_ms]),
+    }
+    print(
+        f"[{name:6}] {events} 事件 × {len(clients)} 连接: {result['messages_per_second']:,.0f} 条/秒 "
+        f"({result['events_per_second']:,.0f} 事件/秒)，延迟 p50={result['latency']['p50_ms']:.1f}ms "
+        f"p99={result['latency']['p99_ms']:.1f}ms，快连接丢弃 {result['dropped_fast']} "
+        f"未收齐 {incomplete}，慢连接丢弃 {result['dropped_slow']}"
+    )
+    return result
+
+
+async def main(args):
+    await init_db()
+    patients = await find_dataset(TAG)
+    if not patients:
+        await generate_dataset(1, 1, interval=3600, spectrum_ratio=0.0, tag=TAG)
+        patients = await find_dataset(TAG)
+    user_id, device_id = patients[0]["user_id"], patients[0]["device_id"]
+    token = create_access_token({"sub": str(user_id)}, timedelta(hours=1))
+    path = "/api/data/live?" + urlencode({"token": token})
+    results = {"params": vars(args)}
+    failed = False
+
+    async with app_client(args.base_url) as client:
+        if args.base_url:
+            ws_url = args.base_url.replace("http", "ws", 1) + path
+            connect = lambda c: RemoteWebSocket(ws_url, c)
+        else:
+            from app.main import app
+            connect = lambda c: AsgiWebSocket(app, path, c)
+
+        clients = [
+            LiveClient(
+                slow_seconds=args.slow_ms / 1000 if i < args.slow else 0.0,
+                sample=i % args.sample_every == 0,
+            )
+            for i in range(args.subscribers + args.slow)
+        ]
+        start = time.perf_counter()
+        sockets = [connect(c) for c in clients]
+        await asyncio.wait_for(asyncio.gather(*(c.subscribed.wait() for c in clients)), 60)
+        rejected = sum(1 for c in clients if c.closed is not None)
+        results["connect_seconds"] = round(time.perf_counter() - start, 3)
+        print(f"{len(clients)} 个连接已订阅 ({results['connect_seconds']}s)，拒绝 {rejected}")
+        if rejected:
+            raise SystemExit(1)
+
+        async def publish_broker(items):
+            topics = (user_topic(user_id),)
+            await live_broker.publish([
+                (topics, {"type": "tremor", "device_id": device_id, "user_id": user_id, **item})
+                for item in items
+            ])
+
+        async def publish_upload(items):
+            response = await client.post(
+                "/api/data/upload/batch", json={"device_id": device_id, "data": [{"device_id": device_id, **item} for item in items]}
+            )
+            response.raise_for_status()
+
+        rounds = [("upload", publish_upload)] if args.base_url else [("broker", publish_broker), ("upload", publish_upload)]
+        for name, publish in rounds:
+            r = await run_round(name, publish, clients, args.events, args.batch, args.settle)
+            results[name] = r
+            failed |= r["incomplete_fast"] > 0 or r["dropped_fast"] > 0
+
+        await asyncio.gather(*(s.close() for s in sockets))
+
+    path = write_results("live", results)
+    print(f"结果已写入 {path}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="实时推送基准测试 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--subscribers", type=int, default=1000, help="正常连接数")
+    parser.add_argument("--slow", type=int, default=10, help="慢连接数")
+    parser.add_argument("--slow-ms", type=float, default=50.0, help="慢连接每条消息的发送耗时 (毫秒)")
+    parser.add_argument("--events", type=int, default=2000, help="每轮发布的事件数")
+    parser.add_argument("--batch", type=int, default=20, help="每次发布/上传的事件数")
+    parser.add_argument("--sample-every", type=int, default=50, help="每隔多少个连接采样延迟")
+    parser.add_argument("--settle", type=float, default=120.0, help="等待推送完成的最长时间 (秒)")
+    parser.add_argument("--base-url", default=None, help="压测运行中的服务，如 http://localhost:8000")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,203 @@
+"""
+Tremor Guard - Pagination Benchmark
+震颤卫士 - 分页基准测试
+
+对比 /api/data/session/{id}/data 与 /api/data/history 的两种分页方式:
+- offset: ?offset=(页码-1)×limit，数据库需要扫描并丢弃前面所有行，越往后越慢
+- cursor: ?cursor=<X-Next-Cursor>，按 (时间, id) 索引定位，耗时与页码无关
+
+生成一个长会话 (--rows 条数据) 和 --sessions 个历史会话，先用游标从第 1 页顺序翻到最后，
+记录目标页的游标并核对两种方式返回的数据一致，再分别重复请求各目标页测延迟。
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_pagination --rows 120000 --sessions 60000
+    python -m benchmarks.bench_pagination --skip-generate --pages 1,100,1000
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+from passlib.context import CryptContext
+from sqlalchemy import func, select
+
+from app.api.auth import create_access_token
+from app.api.data import NEXT_CURSOR_HEADER
+from app.core.database import engine, init_db
+from app.models.device import Device
+from app.models.tremor_data import TremorData, TremorSession
+from app.models.user import User
+from benchmarks.common import app_client, latency_summary, write_results
+from benchmarks.dataset import PASSWORD, SEVERITY_LABELS, _insert_chunks, _next_id, _sync_sequences, generate_session_rows
+
+
+# ============================================================
+# 数据准备
+# ============================================================
+
+async def generate(tag: str, rows: int, sessions: int, seed: int):
+    """一个患者: 1 个长会话 + sessions 个历史会话 (不含数据行)"""
+    await init_db()
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+
+    async with engine.begin() as conn:
+        user_id = await _next_id(conn, User)
+        device_pk = await _next_id(conn, Device)
+        session_id = await _next_id(conn, TremorSession)
+        data_id = await _next_id(conn, TremorData)
+
+        await conn.execute(User.__table__.insert(), [{
+            "id": user_id, "email": f"{tag}@bench.local", "username": tag, "hashed_password": hashed,
+            "full_name": "Pagination Bench", "role": "user", "is_active": True, "is_verified": True,
+            "created_at": now, "updated_at": now,
+        }])
+        await conn.execute(Device.__table__.insert(), [{
+            "id": device_pk, "device_id": tag.upper(), "name": "Pagination Band", "firmware_version": "1.0.0",
+            "is_online": False, "owner_id": user_id, "created_at": now, "updated_at": now,
+        }])
+
+        # 历史会话: 每 30 分钟一个，部分会话开始时间相同 (检验 id 作为第二排序键)
+        session_rows = []
+        for i in range(sessions + 1):
+            start = now - timedelta(minutes=30 * (sessions - i - (i % 7 == 0)))
+            session_rows.append({
+                "id": session_id + i, "user_id": user_id, "device_id": device_pk, "start_time": start,
+                "end_time": start + timedelta(minutes=20), "duration_seconds": 1200, "total_analyses": 0,
+                "tremor_count": 0, "max_severity": 0, "is_active": False,
+            })
+        long_session = session_id + sessions
+        session_rows[-1]["total_analyses"] = rows
+        await _insert_chunks(conn, TremorSession.__table__, session_rows)
+
+        start = now - timedelta(seconds=rows)
+        data = generate_session_rows(rng, start, rows, 1.0, 0.3, 0.0)
+        data_rows = []
+        for i in range(rows):
+            severity = int(data["severity"][i])
+            data_rows.append({
+                "id": data_id + i, "session_id": long_session,
+                "timestamp": start + timedelta(seconds=float(data["offset_seconds"][i])),
+                "detected": bool(data["detected"][i]), "valid": bool(data["valid"][i]),
+                "out_of_range": bool(data["out_of_range"][i]), "frequency": float(data["frequency"][i]),
+                "peak_power": float(data["peak_power"][i]), "band_power": float(data["band_power"][i]),
+                "amplitude": float(data["amplitude"][i]), "rms_amplitude": float(data["rms_amplitude"][i]),
+                "severity": severity, "severity_label": SEVERITY_LABELS[severity],
+            })
+        await _insert_chunks(conn, TremorData.__table__, data_rows)
+        await _sync_sequences(conn)
+
+
+async def find(tag: str):
+    """(user_id, 长会话 id)"""
+    async with engine.connect() as conn:
+        user_id = await conn.scalar(select(User.id).where(User.email == f"{tag}@bench.local"))
+        if user_id is None:
+            return None, None
+        session_id = await conn.scalar(
+            select(func.max(TremorSession.id)).where(TremorSession.user_id == user_id)
+        )
+    return user_id, session_id
+
+
+# ============================================================
+# 压测
+# ============================================================
+
+async def collect_cursors(client, url: str, headers: dict, limit: int, pages: List[int]) -> Dict[int, str]:
+    """用游标顺序翻页，记录目标页的游标 (第 1 页为空)"""
+    cursors, cursor, page = {}, None, 1
+    while page <= max(pages):
+        if page in pages:
+            cursors[page] = cursor
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+        page += 1
+    return cursors
+
+
+async def bench_endpoint(client, name: str, url: str, headers: dict, limit: int, pages: List[int],
+                         repeat: int) -> dict:
+    cursors = await collect_cursors(client, url, headers, limit, pages)
+    results = {}
+    for page in pages:
+        if page not in cursors:
+            print(f"  {name} 第 {page} 页超出数据范围，跳过")
+            continue
+        modes = {
+            "offset": {"limit": limit, "offset": (page - 1) * limit},
+            "cursor": {"limit": limit, **({"cursor": cursors[page]} if cursors[page] else {})},
+        }
+        # 两种方式返回的数据应一致
+        bodies = {}
+        for mode, params in modes.items():
+            response = await client.get(url, params=params, headers=headers)
+            bodies[mode] = [row["id"] for row in response.json()]
+        consistent = bodies["offset"] == bodies["cursor"]
+
+        row = {"consistent": consistent}
+        for mode, params in modes.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = await client.get(url, params=params, headers=headers)
+                samples.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+            row[mode] = latency_summary(samples)
+        results[str(page)] = row
+        print(
+            f"  {name:12} page {page:5} offset p50={row['offset']['p50_ms']:8.2f}ms "
+            f"cursor p50={row['cursor']['p50_ms']:8.2f}ms {'' if consistent else '(数据不一致!)'}"
+        )
+    return results
+
+
+async def main(args):
+    pages = sorted({int(p) for p in args.pages.split(",")})
+    if not args.skip_generate:
+        print(f"生成数据: 长会话 {args.rows} 条，历史会话 {args.sessions} 个 ...")
+        await generate(args.tag, args.rows, args.sessions, args.seed)
+    else:
+        await init_db()
+
+    user_id, session_id = await find(args.tag)
+    if user_id is None:
+        raise SystemExit(f"未找到标签为 {args.tag} 的数据，请先去掉 --skip-generate 运行")
+    token = create_access_token({"sub": str(user_id)}, timedelta(hours=6))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {"params": vars(args), "database": engine.dialect.name}
+    async with app_client(args.base_url) as client:
+        results["session_data"] = await bench_endpoint(
+            client, "session_data", f"/api/data/session/{session_id}/data", headers,
+            args.data_limit, pages, args.repeat,
+        )
+        results["history"] = await bench_endpoint(
+            client, "history", "/api/data/history", headers, args.history_limit, pages, args.repeat,
+        )
+
+    path = write_results("pagination", results)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offset 与游标分页对比 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--rows", type=int, default=120000, help="长会话的数据条数")
+    parser.add_argument("--sessions", type=int, default=60000, help="历史会话数")
+    parser.add_argument("--pages", default="1,10,100,1000", help="测试的页码 (逗号分隔)")
+    parser.add_argument("--data-limit", type=int, default=100, help="会话数据每页条数")
+    parser.add_argument("--history-limit", type=int, default=50, help="历史会话每页条数")
+    parser.add_argument("--repeat", type=int, default=20, help="每页每种方式的请求数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--tag", default="bench_pagination", help="数据标签")
+    parser.add_argument("--skip-generate", action="store_true", help="复用已生成的数据")
+    parser.add_argument("--base-url", default=None, help="压测运行中的服务，例如 http://localhost:8000")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Tremor Guard - Login Storm Benchmark
+震颤卫士 - 登录风暴基准测试
+
+对比两种模式下的事件循环延迟与设备上传 p99:
+- inline: 在事件循环中直接调用 bcrypt (原实现)
+- pool:   通过 PasswordHashPool 在有界线程池中执行
+
+上传请求用 asyncio.sleep 模拟数据库 I/O，因此测得的延迟增量完全来自事件循环阻塞。
+
+Usage:
+    python -m benchmarks.bench_password_pool --logins 40 --duration 5
+"""
+
+import argparse
+import asyncio
+import time
+
+from passlib.context import CryptContext
+
+from app.core.password_pool import PasswordHashPool, PasswordPoolBusyError
+from benchmarks.common import LoopLagProbe, latency_summary, write_results
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PASSWORD = "Password123!"
+
+
+async def upload_worker(stop: asyncio.Event, latencies: list, interval: float):
+    """模拟设备上传: 固定间隔发起，测量完成耗时"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.002)  # 模拟 DB 往返
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def login_inline(hashed: str) -> str:
+    pwd_context.verify(PASSWORD, hashed)
+    return "ok"
+
+
+async def login_pooled(pool: PasswordHashPool, hashed: str) -> str:
+    try:
+        await pool.run(pwd_context.verify, PASSWORD, hashed)
+        return "ok"
+    except PasswordPoolBusyError:
+        return "429"
+
+
+async def run_mode(mode: str, args, hashed: str) -> dict:
+    pool = PasswordHashPool(max_workers=args.workers, queue_limit=args.queue_limit)
+    probe = LoopLagProbe()
+    stop = asyncio.Event()
+    upload_latencies: list = []
+
+    probe.start()
+    uploaders = [
+        asyncio.create_task(upload_worker(stop, upload_latencies, args.upload_interval))
+        for _ in range(args.devices)
+    ]
+
+    outcomes: list = []
+    storm_start = time.perf_counter()
+    while time.perf_counter() - storm_start < args.duration:
+        if mode == "inline":
+            batch = [login_inline(hashed) for _ in range(args.logins)]
+        else:
+            batch = [login_pooled(pool, hashed) for _ in range(args.logins)]
+        outcomes.extend(await asyncio.gather(*batch))
+        await asyncio.sleep(args.storm_interval)
+
+    stop.set()
+    await asyncio.gather(*uploaders)
+    await probe.stop()
+    pool.shutdown()
+
+    return {
+        "mode": mode,
+        "logins_ok": outcomes.count("ok"),
+        "logins_rejected_429": outcomes.count("429"),
+        "event_loop_lag": latency_summary(probe.samples_ms),
+        "upload_latency": latency_summary(upload_latencies),
+    }
+
+
+async def main(args):
+    hashed = pwd_context.hash(PASSWORD)
+    results = {}
+    for mode in ("inline", "pool"):
+        results[mode] = await run_mode(mode, args, hashed)
+        r = results[mode]
+        print(
+            f"[{mode:6}] logins ok={r['logins_ok']} 429={r['logins_rejected_429']} | "
+            f"loop lag p99={r['event_loop_lag']['p99_ms']}ms max={r['event_loop_lag']['max_ms']}ms | "
+            f"upload p99={r['upload_latency']['p99_ms']}ms"
+        )
+    path = write_results("password_pool", {"params": vars(args), **results})
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="登录风暴下的事件循环延迟基准")
+    parser.add_argument("--logins", type=int, default=40, help="每轮并发登录数")
+    parser.add_argument("--duration", type=float, default=5.0, help="风暴持续时间 (秒)")
+    parser.add_argument("--storm-interval", type=float, default=0.05, help="每轮登录间隔 (秒)")
+    parser.add_argument("--devices", type=int, default=50, help="并发上传设备数")
+    parser.add_argument("--upload-interval", type=float, default=0.01, help="单设备上传间隔 (秒)")
+    parser.add_argument("--workers", type=int, default=2, help="哈希线程数")
+    parser.add_argument("--queue-limit", type=int, default=32, help="排队上限")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,206 @@
+"""
+Tremor Guard - Raw Window Storage Benchmark
+震颤卫士 - 原始窗口存储基准测试
+
+1. 写入: N 台设备 × M 天，每次追加一个上传批次，统计 windows/s
+2. 磁盘占用: 每个三轴样本 / 每个单轴样本的字节数 (对比 JSON 编码)
+3. 随机读取单个窗口的延迟: 每次重新打开 memmap (冷) / 复用已打开的 memmap (热)
+4. 整天窗口从 memmap 直接送入检测引擎的吞吐量
+5. 可选: 通过 /api/data/raw 上传的接口延迟 (--http-requests)
+
+Usage:
+    python -m benchmarks.bench_raw_storage --devices 20 --days 3 --windows-per-day 2000
+    # 接口上传 (进程内，写入 RAW_STORAGE_DIR)
+    RAW_STORAGE_DIR=/tmp/raw DATABASE_URL=sqlite+aiosqlite:///./bench.db \\
+        python -m benchmarks.bench_raw_storage --http-requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+import numpy as np
+
+from app.core.raw_storage import RawWindowStore, encode_upload
+from app.services.tremor_detection import analyze_raw
+from benchmarks.bench_detection import synth_raw
+from benchmarks.common import app_client, latency_summary, write_results
+
+WINDOW_INTERVAL_MS = 2500
+
+
+def _day_windows(rng: np.random.Generator, count: int, seed: int) -> np.ndarray:
+    return synth_raw(rng.uniform(0.5, 12.0, count), rng.uniform(0.0, 0.7, count), noise=0.05, seed=seed)
+
+
+def bench_write(store: RawWindowStore, devices: List[str], days: List[date], windows_per_day: int,
+                upload_windows: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    elapsed = 0.0
+    total = 0
+    for d, device_id in enumerate(devices):
+        for day in days:
+            samples = _day_windows(rng, windows_per_day, seed + d)
+            day_ms = int((datetime(day.year, day.month, day.day) - datetime(1970, 1, 1)).total_seconds() * 1000)
+            timestamps = day_ms + np.arange(windows_per_day, dtype=np.int64) * WINDOW_INTERVAL_MS
+            start = time.perf_counter()
+            for i in range(0, windows_per_day, upload_windows):
+                store.append(device_id, timestamps[i:i + upload_windows], samples[i:i + upload_windows])
+            elapsed += time.perf_counter() - start
+            total += windows_per_day
+    return {"windows": total, "seconds": round(elapsed, 3), "windows_per_second": round(total / elapsed, 1)}
+
+
+def bench_random_reads(store: RawWindowStore, devices: List[str], days: List[date], reads: int,
+                       seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    targets = [(devices[rng.integers(len(devices))], days[rng.integers(len(days))]) for _ in range(reads)]
+
+    cold = []
+    checksum = 0
+    for device_id, day in targets:
+        start = time.perf_counter()
+        data = store.read_day(device_id, day)
+        window = np.array(data.samples[rng.integers(len(data))])
+        cold.append((time.perf_counter() - start) * 1000)
+        checksum += int(window[0, 2])
+
+    opened = {(device_id, day): store.read_day(device_id, day) for device_id in devices for day in days}
+    warm = []
+    for device_id, day in targets:
+        start = time.perf_counter()
+        data = opened[(device_id, day)]
+        window = np.array(data.samples[rng.integers(len(data))])
+        warm.append((time.perf_counter() - start) * 1000)
+        checksum += int(window[0, 2])
+
+    return {"cold_open": latency_summary(cold), "warm": latency_summary(warm), "checksum": checksum}
+
+
+def bench_analysis(store: RawWindowStore, device_id: str, day: date) -> dict:
+    data = store.read_day(device_id, day)
+    start = time.perf_counter()
+    batch = analyze_raw(data.samples)
+    elapsed = time.perf_counter() - start
+    return {
+        "windows": len(data),
+        "windows_per_second": round(len(data) / elapsed, 1),
+        "detected": int(batch.detected.sum()),
+    }
+
+
+async def bench_http(requests: int, upload_windows: int, concurrency: int, base_url, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    samples = _day_windows(rng, upload_windows, seed)
+    latencies: List[float] = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            now_ms = int(time.time() * 1000)
+            timestamps = now_ms - np.arange(upload_windows, 0, -1, dtype=np.int64) * WINDOW_INTERVAL_MS
+            body = encode_upload(timestamps, samples)
+            start = time.perf_counter()
+            response = await client.post(
+                f"/api/data/raw?device_id=BENCH-RAW-{i % 50:03d}", content=body,
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async with app_client(base_url) as client:
+        wall_start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        wall = time.perf_counter() - wall_start
+
+    return {
+        **latency_summary(latencies),
+        "throughput_rps": round(requests / wall, 1),
+        "windows_per_second": round(requests * upload_windows / wall, 1),
+        "request_bytes": len(encode_upload(np.zeros(upload_windows, dtype=np.int64), samples)),
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def main(args):
+    root = args.dir or tempfile.mkdtemp(prefix="tremor_raw_")
+    store = RawWindowStore(root)
+    devices = [f"BENCH-{i:04d}" for i in range(args.devices)]
+    today = datetime.utcnow().date()
+    days = [today - timedelta(days=i) for i in range(args.days)]
+    results = {}
+
+    try:
+        print(f"写入 {args.devices} 台设备 × {args.days} 天 × {args.windows_per_day} 个窗口 -> {root}")
+        results["write"] = bench_write(store, devices, days, args.windows_per_day, args.upload_windows, args.seed)
+        print(f"  {results['write']['windows_per_second']:,.0f} windows/s")
+
+        usage = store.disk_usage()
+        samples = usage["windows"] * 256
+        sample_window = _day_windows(np.random.default_rng(0), 1, 0)[0]
+        json_bytes = len(json.dumps(sample_window.tolist(), separators=(",", ":")))
+        results["disk"] = {
+            **usage,
+            "bytes_per_sample": round(usage["bytes"] / samples, 4),             # 每个三轴样本
+            "bytes_per_axis_sample": round(usage["bytes"] / (samples * 3), 4),
+            "json_bytes_per_sample": round(json_bytes / 256, 2),
+        }
+        print(
+            f"磁盘: {usage['bytes'] / 1e6:.1f} MB，{results['disk']['bytes_per_sample']} 字节/三轴样本 "
+            f"({results['disk']['bytes_per_axis_sample']} 字节/单轴样本，JSON 约 {results['disk']['json_bytes_per_sample']})"
+        )
+
+        results["random_read"] = bench_random_reads(store, devices, days, args.reads, args.seed)
+        for mode in ("cold_open", "warm"):
+            r = results["random_read"][mode]
+            print(f"随机读取 ({mode:9}) p50={r['p50_ms']:.4f}ms p95={r['p95_ms']:.4f}ms p99={r['p99_ms']:.4f}ms")
+
+        results["analysis"] = bench_analysis(store, devices[0], days[0])
+        print(f"整天分析 (memmap → 检测引擎): {results['analysis']['windows_per_second']:,.0f} windows/s")
+
+        results["retention"] = {"removed_days": store.purge(args.days - 1, today)}
+        print(f"保留 {args.days - 1} 天: 清理 {results['retention']['removed_days']} 个分块")
+    finally:
+        if not args.dir and not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.http_requests:
+        results["http"] = await bench_http(
+            args.http_requests, args.upload_windows, args.concurrency, args.base_url, args.seed
+        )
+        r = results["http"]
+        print(
+            f"POST /api/data/raw p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms p99={r['p99_ms']:.1f}ms "
+            f"{r['throughput_rps']} req/s {r['windows_per_second']:,.0f} windows/s status={r['status']}"
+        )
+
+    path = write_results("raw_storage", {"params": vars(args), **results})
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="原始窗口分块存储基准测试")
+    parser.add_argument("--devices", type=int, default=20, help="设备数")
+    parser.add_argument("--days", type=int, default=3, help="天数")
+    parser.add_argument("--windows-per-day", type=int, default=2000, help="每台设备每天的窗口数")
+    parser.add_argument("--upload-windows", type=int, default=24, help="每次上传的窗口数")
+    parser.add_argument("--reads", type=int, default=2000, help="随机读取次数")
+    parser.add_argument("--dir", default=None, help="存储目录 (默认临时目录，结束后删除)")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    parser.add_argument("--http-requests", type=int, default=0, help="通过接口上传的请求数 (0 表示跳过)")
+    parser.add_argument("--concurrency", type=int, default=8, help="接口上传并发数")
+    parser.add_argument("--base-url", default=None, help="压测运行中的服务，例如 http://localhost:8000")
+    parser.add_argument("--seed", type=int, default=11, help="随机种子")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,152 @@
+"""
+Tremor Guard - Reclassification Benchmark
+震颤卫士 - 历史数据重新判定基准测试
+
+1. 生成合成数据集 (已有数据时跳过，--interval 越小行数越多)
+2. 保存修改后的全局检测参数并运行重新判定任务，统计 行/秒、行/分钟、变化行数
+3. 可选: 在第 K 块之后模拟进程中断，再从 last_id 继续 (--interrupt-after)
+4. 校验: 全部行的 detected / out_of_range / severity 与 classify_features() 结果一致，
+   已结束会话的 tremor_count 与明细一致
+5. 恢复默认参数再运行一次 (--restore)
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_reclassify --patients 20 --days 14 --interval 10
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.bench_reclassify --chunk-rows 100000 --restore
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.core.database import WORKLOAD_REPORTING, engines, init_db
+from app.models.tremor_data import TremorData, TremorSession
+from app.services.device_config import SCOPE_GLOBAL, TremorConfig, device_config_store
+from app.services.reclassification import create_job, run_job
+from app.services.tremor_detection import DEFAULT_PARAMS, classify_features
+from benchmarks.common import write_results
+from benchmarks.dataset import generate_dataset
+
+
+class SimulatedInterrupt(Exception):
+    pass
+
+
+async def run_timed(params, chunk_rows: int, interrupt_after: int = 0) -> dict:
+    # 判定按各设备的生效配置进行，基准数据集的设备都跟随全局配置
+    entry = await device_config_store.save(SCOPE_GLOBAL, params=TremorConfig(
+        **{**params._asdict(), "severity_thresholds": list(params.severity_thresholds)}
+    ))
+    job_id = await create_job(params, config_version=entry.version)
+    start = time.perf_counter()
+    interrupted = False
+
+    if interrupt_after:
+        chunks = {"n": 0}
+
+        def progress(p):
+            chunks["n"] += 1
+            if chunks["n"] >= interrupt_after:
+                raise SimulatedInterrupt()
+
+        try:
+            await run_job(job_id, chunk_rows, progress=progress)
+        except SimulatedInterrupt:
+            interrupted = True
+
+    result = await run_job(job_id, chunk_rows)
+    elapsed = time.perf_counter() - start
+    return {
+        "job_id": job_id,
+        "status": result["status"],
+        "interrupted": interrupted,
+        "rows": result["processed_rows"],
+        "changed_rows": result["changed_rows"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(result["processed_rows"] / elapsed, 1),
+        "rows_per_minute": round(result["processed_rows"] / elapsed * 60),
+    }
+
+
+async def verify(params) -> dict:
+    data = TremorData.__table__
+    async with engines[WORKLOAD_REPORTING].connect() as conn:
+        rows = (await conn.execute(
+            select(
+                data.c.detected, data.c.out_of_range, data.c.severity,
+                data.c.frequency, data.c.band_power, data.c.rms_amplitude,
+            )
+        )).all()
+        columns = np.array(list(map(tuple, rows)), dtype=np.float64).reshape(-1, 6)
+        detected, out_of_range, severity = classify_features(columns[:, 3], columns[:, 4], columns[:, 5], params)
+        mismatched = int((
+            (detected != (columns[:, 0] == 1)) | (out_of_range != (columns[:, 1] == 1)) | (severity != columns[:, 2])
+        ).sum())
+
+        sessions = TremorSession.__table__
+        counts = (
+            select(data.c.session_id, func.count().filter(data.c.detected == True).label("n"))
+            .group_by(data.c.session_id)
+            .subquery()
+        )
+        stale_sessions = await conn.scalar(
+            select(func.count()).select_from(sessions.join(counts, sessions.c.id == counts.c.session_id))
+            .where(sessions.c.tremor_count != counts.c.n, sessions.c.is_active == False)
+        )
+    return {"rows": len(rows), "mismatched_rows": mismatched, "stale_sessions": stale_sessions}
+
+
+async def main(args):
+    await init_db()
+    async with engines[WORKLOAD_REPORTING].connect() as conn:
+        existing = await conn.scalar(select(func.count()).select_from(TremorData.__table__))
+    if existing == 0:
+        print(f"生成数据集: {args.patients} 患者 × {args.days} 天，间隔 {args.interval}s ...")
+        summary = await generate_dataset(args.patients, args.days, interval=args.interval, spectrum_ratio=0.0)
+        print(f"  {summary['tremor_data']} 行 ({summary['seconds']}s)")
+    else:
+        print(f"使用已有数据: {existing} 行")
+
+    changed = DEFAULT_PARAMS._replace(
+        rms_min=args.rms_min, power_threshold=args.power_threshold,
+        severity_thresholds=(args.rms_min, args.rms_min + 0.5, args.rms_min + 1.0, args.rms_min + 1.5),
+    )
+    results = {"params": vars(args), "runs": []}
+    plans = [("changed", changed)] + ([("restore", DEFAULT_PARAMS)] if args.restore else [])
+
+    failed = False
+    for name, params in plans:
+        run = await run_timed(params, args.chunk_rows, args.interrupt_after if name == "changed" else 0)
+        run["verify"] = await verify(params)
+        run["name"] = name
+        results["runs"].append(run)
+        print(
+            f"[{name}] {run['rows']} 行，变化 {run['changed_rows']} 行，{run['seconds']}s "
+            f"({run['rows_per_second']:,.0f} 行/秒，{run['rows_per_minute']:,} 行/分钟)"
+            f"{'，中断后继续' if run['interrupted'] else ''}"
+        )
+        v = run["verify"]
+        print(f"  校验: 不一致 {v['mismatched_rows']} 行，会话统计未更新 {v['stale_sessions']} 个")
+        failed |= run["status"] != "completed" or v["mismatched_rows"] > 0 or v["stale_sessions"] > 0
+
+    path = write_results("reclassify", results)
+    print(f"结果已写入 {path}")
+    for engine in engines.values():
+        await engine.dispose()
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="历史数据重新判定基准测试 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--patients", type=int, default=20, help="患者数 (无数据时生成)")
+    parser.add_argument("--days", type=int, default=14, help="天数 (无数据时生成)")
+    parser.add_argument("--interval", type=float, default=10.0, help="检测间隔 (秒，无数据时生成)")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="每块行数")
+    parser.add_argument("--rms-min", type=float, default=2.8, help="修改后的 RMS 下限")
+    parser.add_argument("--power-threshold", type=float, default=1.0, help="修改后的频段功率阈值")
+    parser.add_argument("--interrupt-after", type=int, default=2, help="第 K 块后模拟中断 (0 表示不中断)")
+    parser.add_argument("--restore", action="store_true", help="再按默认参数运行一次")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,159 @@
+"""
+Tremor Guard - List Serialization Benchmark
+震颤卫士 - 列表接口序列化基准测试
+
+对比 FAST_LIST_RESPONSES 关闭 (ORM 对象 + model_validate + response_model 校验 + json)
+与开启 (列元组 + orjson) 时的吞吐量:
+
+- serialize: 不访问数据库，只测序列化本身 (rows/s)
+- routes:    进程内请求 /data/session/{id}/data、/data/history、/data/recent，
+             记录两种模式的延迟与 rows/s，并核对响应内容一致
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_serialization --patients 2 --days 7
+    python -m benchmarks.bench_serialization --skip-generate --requests 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.api.auth import create_access_token
+from app.api.data import _DATA_FIELDS, TremorDataResponse
+from app.core import fast_json
+from app.core.config import settings
+from app.core.database import init_db
+from app.models.tremor_data import TremorData
+from benchmarks.common import app_client, latency_summary, write_results
+from benchmarks.dataset import find_dataset, generate_dataset
+
+MODES = {"default": False, "fast": True}
+
+
+# ============================================================
+# 纯序列化
+# ============================================================
+
+def bench_serialize(rows: int, repeat: int) -> dict:
+    """1 页 rows 行: ORM 对象 → 模型 → 再校验 → json  vs  元组 → orjson"""
+    now = datetime.utcnow()
+    values = [
+        (i, 1, now + timedelta(seconds=i), i % 3 == 0, True, False, 5.12345, 1.2345, 1.8765,
+         0.0146, 3.2101, i % 5, "轻度")
+        for i in range(rows)
+    ]
+    objects = [TremorData(**dict(zip(_DATA_FIELDS, row))) for row in values]
+    adapter = TypeAdapter(List[TremorDataResponse])
+
+    def default_path():
+        content = [TremorDataResponse.model_validate(o) for o in objects]
+        # FastAPI: 按 response_model 再校验一次，然后 jsonable_encoder + json.dumps
+        validated = adapter.validate_python([c.model_dump() for c in content])
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode("utf-8")
+
+    def fast_path():
+        return fast_json.dumps([dict(zip(_DATA_FIELDS, row)) for row in values])
+
+    assert json.loads(default_path()) == json.loads(fast_path())
+    results = {"rows": rows, "encoder": "orjson" if fast_json.orjson is not None else "json"}
+    for mode, fn in (("default", default_path), ("fast", fast_path)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed = time.perf_counter() - start
+        results[mode] = {
+            "ms_per_page": round(elapsed / repeat * 1000, 3),
+            "rows_per_second": round(rows * repeat / elapsed),
+        }
+    return results
+
+
+# ============================================================
+# 接口
+# ============================================================
+
+async def bench_route(client, url: str, headers: dict, requests: int) -> dict:
+    results, bodies = {}, {}
+    for mode, enabled in MODES.items():
+        settings.FAST_LIST_RESPONSES = enabled
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        bodies[mode] = response.json()
+        samples, rows = [], 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            rows += len(response.json())
+        results[mode] = {
+            **latency_summary(samples),
+            "rows_per_request": rows // requests,
+            "rows_per_second": round(rows / (sum(samples) / 1000)) if samples else 0,
+        }
+    results["identical"] = bodies["default"] == bodies["fast"]
+    return results
+
+
+async def main(args):
+    results = {"params": vars(args)}
+    if not args.skip_generate:
+        print(f"生成数据集: {args.patients} 患者 × {args.days} 天 ...")
+        await generate_dataset(patients=args.patients, days=args.days, interval=args.interval,
+                               spectrum_ratio=0.0, tag=args.tag)
+    else:
+        await init_db()  # 同时注册全部模型
+
+    r = results["serialize"] = bench_serialize(args.rows, args.repeat)
+    print(
+        f"[serialize] {r['rows']} 行/页 ({r['encoder']}) default={r['default']['rows_per_second']} rows/s "
+        f"fast={r['fast']['rows_per_second']} rows/s"
+    )
+
+    patients = await find_dataset(args.tag)
+    if not patients:
+        raise SystemExit(f"未找到标签为 {args.tag} 的数据集，请先去掉 --skip-generate 运行")
+    patient = max(patients, key=lambda p: len(p["session_ids"]))
+    token = create_access_token({"sub": str(patient["user_id"])}, timedelta(hours=6))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    routes = {
+        "session_data": f"/api/data/session/{patient['session_ids'][-2]}/data?limit=1000",
+        "history": "/api/data/history?limit=200",
+        "recent": "/api/data/recent?limit=200",
+    }
+    original = settings.FAST_LIST_RESPONSES
+    results["routes"] = {}
+    async with app_client() as client:
+        try:
+            for name, url in routes.items():
+                r = results["routes"][name] = await bench_route(client, url, headers, args.requests)
+                print(
+                    f"[{name:12}] {r['fast']['rows_per_request']:5} 行 | "
+                    f"default p50={r['default']['p50_ms']:7.2f}ms {r['default']['rows_per_second']:8} rows/s | "
+                    f"fast p50={r['fast']['p50_ms']:7.2f}ms {r['fast']['rows_per_second']:8} rows/s"
+                    f"{'' if r['identical'] else ' (响应不一致!)'}"
+                )
+        finally:
+            settings.FAST_LIST_RESPONSES = original
+
+    path = write_results("serialization", results)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="列表接口序列化基准测试 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--rows", type=int, default=1000, help="纯序列化测试每页行数")
+    parser.add_argument("--repeat", type=int, default=50, help="纯序列化测试重复次数")
+    parser.add_argument("--patients", type=int, default=2, help="生成的患者数")
+    parser.add_argument("--days", type=int, default=7, help="生成的天数")
+    parser.add_argument("--interval", type=float, default=5.0, help="检测间隔 (秒)，越小单个会话行数越多")
+    parser.add_argument("--tag", default="bench_serialization", help="数据集标签")
+    parser.add_argument("--skip-generate", action="store_true", help="复用已生成的数据集")
+    parser.add_argument("--requests", type=int, default=30, help="每个接口每种模式的请求数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""
+Tremor Guard - Spectrogram Benchmark
+震颤卫士 - 频谱时频图基准测试
+
+1. 生成带频谱的合成数据集 (已有同标签数据时复用)
+2. GET /api/analysis/spectrogram: 冷缓存 / 热缓存延迟，base64 与 binary 响应大小
+3. 校验: 接口返回的矩阵与逐行 NumPy 直接计算的结果一致
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_spectrogram --days 30 --interval 30
+"""
+
+import argparse
+import asyncio
+import base64
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from app.api.auth import create_access_token
+from app.core.database import engine, init_db
+from app.models.tremor_data import TremorData, TremorSession
+from app.services.spectrogram import spectrogram_cache
+from app.services.spectrum_storage import load_spectra
+from benchmarks.common import app_client, latency_summary, write_results
+from benchmarks.dataset import find_dataset, generate_dataset
+
+
+async def reference(user_id: int, days: int, bucket_seconds: int) -> dict:
+    """逐桶直接计算 (不经缓存与流式累加)"""
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    # 首个桶从对齐的边界开始
+    origin = (start - datetime(1970, 1, 1)).total_seconds() // bucket_seconds * bucket_seconds
+    start = datetime(1970, 1, 1) + timedelta(seconds=origin)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(TremorData.id, TremorData.timestamp)
+            .join(TremorSession, TremorSession.id == TremorData.session_id)
+            .where(TremorSession.user_id == user_id, TremorData.timestamp >= start, TremorData.timestamp < end)
+        )).all()
+        matrix = await load_spectra(conn, [r.id for r in rows])
+    timestamps = {r.id: r.timestamp for r in rows}
+    buckets = {}
+    for data_id, power in zip(matrix.data_ids.tolist(), matrix.power):
+        ts = (timestamps[data_id] - datetime(1970, 1, 1)).total_seconds()
+        buckets.setdefault(int((ts - origin) // bucket_seconds), []).append(power)
+    return {k: np.mean(v, axis=0) for k, v in buckets.items()}
+
+
+async def main(args):
+    await init_db()
+    patients = await find_dataset(args.tag)
+    if not patients:
+        print(f"生成数据集: {args.patients} 患者 × {args.days} 天，间隔 {args.interval}s ...")
+        summary = await generate_dataset(
+            args.patients, args.days, interval=args.interval, spectrum_ratio=1.0, tag=args.tag
+        )
+        print(f"  {summary['tremor_data']} 行 ({summary['seconds']}s)")
+        patients = await find_dataset(args.tag)
+    user_id = patients[0]["user_id"]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)}, timedelta(hours=1))}"}
+    results = {"params": vars(args)}
+    failed = False
+
+    async with app_client(args.base_url) as client:
+        for bucket in ("hour", "day", "session"):
+            params = {"days": args.days, "bucket": bucket}
+            spectrogram_cache.clear()
+
+            start = time.perf_counter()
+            response = await client.get("/api/analysis/spectrogram", params=params, headers=headers)
+            cold_ms = (time.perf_counter() - start) * 1000
+            response.raise_for_status()
+            body = response.json()
+
+            warm = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                r = await client.get("/api/analysis/spectrogram", params=params, headers=headers)
+                warm.append((time.perf_counter() - start) * 1000)
+                r.raise_for_status()
+
+            binary = await client.get(
+                "/api/analysis/spectrogram", params={**params, "format": "binary", "dtype": "f16"}, headers=headers
+            )
+            results[bucket] = {
+                "rows": body["rows"],
+                "bins": body["bins"],
+                "windows": int(sum(body["windows"])),
+                "cold_ms": round(cold_ms, 1),
+                "warm": latency_summary(warm),
+                "json_bytes": len(response.content),
+                "binary_f16_bytes": len(binary.content),
+            }
+            r = results[bucket]
+            print(
+                f"[{bucket:7}] {r['rows']}×{r['bins']} ({r['windows']} 窗口) 冷 {r['cold_ms']}ms "
+                f"热 p50={r['warm']['p50_ms']:.1f}ms，JSON {r['json_bytes'] / 1024:.1f} KB，"
+                f"binary f16 {r['binary_f16_bytes'] / 1024:.1f} KB"
+            )
+
+            if bucket != "session":
+                power = np.frombuffer(base64.b64decode(body["power"]), dtype="<f4").reshape(body["rows"], body["bins"])
+                expected = await reference(user_id, args.days, body["bucket_seconds"])
+                errors = [
+                    float(np.max(np.abs(power[k] - v))) for k, v in expected.items() if 0 <= k < body["rows"]
+                ]
+                missing = sum(1 for k in expected if not 0 <= k < body["rows"])
+                r["max_error"] = max(errors, default=0.0)
+                print(f"  校验: {len(errors)} 个桶，最大误差 {r['max_error']:.2e}，范围外 {missing}")
+                failed |= r["max_error"] > 1e-3 or missing > 0
+
+    path = write_results("spectrogram", results)
+    print(f"结果已写入 {path}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="频谱时频图接口基准测试 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--patients", type=int, default=1, help="患者数 (无数据时生成)")
+    parser.add_argument("--days", type=int, default=30, help="天数")
+    parser.add_argument("--interval", type=float, default=30.0, help="检测间隔 (秒，无数据时生成)")
+    parser.add_argument("--requests", type=int, default=20, help="热缓存请求次数")
+    parser.add_argument("--tag", default="spectrogram", help="数据集标签")
+    parser.add_argument("--base-url", default=None, help="压测运行中的服务 (缓存在服务进程中，无法在此清空)")
+    asyncio.run(main(parser.parse_args()))
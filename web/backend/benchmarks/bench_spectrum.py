@@ -0,0 +1,177 @@
+"""
+Tremor Guard - Spectrum Storage Benchmark
+震颤卫士 - 频谱存储基准测试
+
+1. 编码: 检测引擎输出的真实幅度谱 (129 bin)，JSON / f32 / f16 / u8 每行字节数与误差
+2. 写入 N 行旧版 JSON 频谱，对比:
+   - 列表查询 select(TremorData): 加载 JSON 列 (旧) / 默认延迟加载 (新)
+   - 读成 (N, bins) 二维数组: JSON 解码 (旧) / load_spectra() (新)
+3. 迁移: migrate_json_spectra() 吞吐量与转换前后字节数，校验转换后的数值
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python -m benchmarks.bench_spectrum --rows 20000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.orm import undefer
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine, init_db
+from app.models.tremor_data import TremorData, TremorSpectrum
+from app.services.spectrum_storage import (
+    SPECTRUM_ENCODINGS, decode_spectrum, encode_spectrum, load_spectra, migrate_json_spectra,
+)
+from app.services.tremor_detection import FREQ_RESOLUTION, analyze_raw
+from benchmarks.bench_detection import synth_raw
+from benchmarks.common import write_results
+from benchmarks.dataset import find_dataset, generate_dataset
+
+TAG = "spectrum"
+
+
+def real_spectra(count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    raw = synth_raw(rng.uniform(0.5, 12.0, count), rng.uniform(0.0, 0.7, count), noise=0.05, seed=seed)
+    return np.round(analyze_raw(raw, keep_spectrum=True).spectrum, 6)
+
+
+def bench_encoding(spectra: np.ndarray) -> dict:
+    json_bytes = np.mean([
+        len(json.dumps({"bin_hz": FREQ_RESOLUTION, "power": s.tolist()}, separators=(",", ":"))) for s in spectra
+    ])
+    results = {"json": {"bytes_per_row": round(float(json_bytes), 1)}}
+    for encoding in SPECTRUM_ENCODINGS:
+        start = time.perf_counter()
+        encoded = [encode_spectrum(s, encoding=encoding) for s in spectra]
+        encode_s = time.perf_counter() - start
+        decoded = np.array([decode_spectrum(e["encoding"], e["bins"], e["scale"], e["data"]) for e in encoded])
+        peak = spectra.max(axis=1, keepdims=True)
+        results[encoding] = {
+            "bytes_per_row": len(encoded[0]["data"]),
+            "size_vs_json": round(json_bytes / len(encoded[0]["data"]), 1),
+            "encode_per_second": round(len(spectra) / encode_s, 1),
+            "max_error_of_peak": float(np.max(np.abs(decoded - spectra) / peak)),
+        }
+    return results
+
+
+async def bench_database(spectra: np.ndarray, encoding: str) -> dict:
+    datasets = await find_dataset(TAG)
+    if not datasets:
+        await generate_dataset(1, 1, interval=600, spectrum_ratio=0.0, tag=TAG)
+        datasets = await find_dataset(TAG)
+    session_id = datasets[0]["session_ids"][0]
+
+    # 旧版 JSON 频谱行
+    start_time = datetime.utcnow() - timedelta(hours=1)
+    async with engine.begin() as conn:
+        await conn.execute(delete(TremorData.__table__).where(TremorData.session_id == session_id))
+        rows = [{
+            "session_id": session_id,
+            "timestamp": start_time + timedelta(seconds=2.5 * i),
+            "detected": False, "valid": True, "out_of_range": False,
+            "frequency": 5.0, "band_power": 0.3, "rms_amplitude": 1.0, "severity": 0,
+            "spectrum_data": {"bin_hz": FREQ_RESOLUTION, "power": s.tolist()},
+        } for i, s in enumerate(spectra)]
+        for i in range(0, len(rows), 5000):
+            await conn.execute(TremorData.__table__.insert(), rows[i:i + 5000])
+        ids = (await conn.execute(
+            select(TremorData.id).where(TremorData.session_id == session_id).order_by(TremorData.id)
+        )).scalars().all()
+
+    results = {}
+
+    async def time_list_query(options):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            items = (await db.execute(
+                select(TremorData).where(TremorData.session_id == session_id).options(*options)
+            )).scalars().all()
+            return round((time.perf_counter() - start) * 1000, 1), len(items)
+
+    results["list_query_json_ms"], _ = await time_list_query([undefer(TremorData.spectrum_data)])
+
+    async with engine.connect() as conn:
+        start = time.perf_counter()
+        legacy = (await conn.execute(
+            select(TremorData.spectrum_data).where(TremorData.id.in_(ids)).order_by(TremorData.id)
+        )).scalars().all()
+        matrix_json = np.array([d["power"] for d in legacy], dtype=np.float32)
+        results["load_2d_json_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    results["migration"] = await migrate_json_spectra(engine, encoding, chunk_rows=5000)
+    elapsed = time.perf_counter() - start
+    results["migration"]["seconds"] = round(elapsed, 3)
+    results["migration"]["rows_per_second"] = round(len(ids) / elapsed, 1)
+
+    results["list_query_deferred_ms"], _ = await time_list_query([])
+
+    async with engine.connect() as conn:
+        start = time.perf_counter()
+        matrix = await load_spectra(conn, ids)
+        results["load_2d_binary_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    peak = matrix_json.max(axis=1, keepdims=True)
+    results["verify"] = {
+        "rows": len(matrix),
+        "expected_rows": len(ids),
+        "max_error_of_peak": float(np.max(np.abs(matrix.power - matrix_json) / peak)),
+    }
+
+    async with engine.begin() as conn:
+        await conn.execute(delete(TremorSpectrum.__table__).where(TremorSpectrum.data_id.in_(ids)))
+        await conn.execute(delete(TremorData.__table__).where(TremorData.session_id == session_id))
+    return results
+
+
+async def main(args):
+    await init_db()
+    spectra = real_spectra(args.rows, args.seed)
+    results = {"params": vars(args)}
+
+    results["encoding"] = bench_encoding(spectra[:args.encode_rows])
+    print(f"每行字节数 (JSON {results['encoding']['json']['bytes_per_row']:.0f}):")
+    for encoding in SPECTRUM_ENCODINGS:
+        r = results["encoding"][encoding]
+        print(
+            f"  {encoding:4} {r['bytes_per_row']:5} 字节 ({r['size_vs_json']}x)，"
+            f"最大误差 {r['max_error_of_peak']:.2e} × 峰值，编码 {r['encode_per_second']:,.0f} 行/秒"
+        )
+
+    encoding = args.encoding or settings.SPECTRUM_ENCODING
+    db = await bench_database(spectra, encoding)
+    results["database"] = db
+    m = db["migration"]
+    print(
+        f"迁移 ({encoding}): {m['converted']} 行，{m['rows_per_second']:,.0f} 行/秒，"
+        f"{m['json_bytes'] / 1e6:.1f} MB → {m['binary_bytes'] / 1e6:.1f} MB"
+    )
+    print(f"列表查询: JSON {db['list_query_json_ms']}ms → 延迟加载 {db['list_query_deferred_ms']}ms")
+    print(f"读成二维数组: JSON {db['load_2d_json_ms']}ms → load_spectra {db['load_2d_binary_ms']}ms")
+    v = db["verify"]
+    print(f"校验: {v['rows']}/{v['expected_rows']} 行，最大误差 {v['max_error_of_peak']:.2e} × 峰值")
+
+    path = write_results("spectrum", results)
+    print(f"结果已写入 {path}")
+    await engine.dispose()
+
+    tolerance = {"f32": 1e-6, "f16": 1e-3, "u8": 1 / 255}[encoding]
+    if v["rows"] != v["expected_rows"] or v["max_error_of_peak"] > tolerance:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="频谱二进制存储基准测试 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--rows", type=int, default=20000, help="写入的频谱行数")
+    parser.add_argument("--encode-rows", type=int, default=2000, help="编码对比使用的行数")
+    parser.add_argument("--encoding", choices=sorted(SPECTRUM_ENCODINGS), default=None, help="迁移编码")
+    parser.add_argument("--seed", type=int, default=5, help="随机种子")
+    asyncio.run(main(parser.parse_args()))
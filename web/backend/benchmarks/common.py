@@ -0,0 +1,103 @@
+"""
+Tremor Guard - Benchmark Helpers
+震颤卫士 - 基准测试公共工具
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数 (最近秩法)，空列表返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    """延迟统计摘要 (毫秒)"""
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+class LoopLagProbe:
+    """
+    事件循环延迟探针
+
+    以固定间隔 sleep，记录实际唤醒时间与预期时间的差值
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            self.samples_ms.append(max(0.0, lag) * 1000)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+@asynccontextmanager
+async def app_client(base_url: Optional[str] = None, timeout: float = 120.0,
+                     limits: Optional[httpx.Limits] = None) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    压测客户端
+
+    base_url 为空时在进程内通过 ASGI 调用应用 (包含 lifespan)，
+    否则请求运行中的服务
+    """
+    limits = limits or httpx.Limits()
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+            yield client
+        return
+
+    from app.main import app
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            yield client
+
+
+def write_results(name: str, results: dict, output_dir: Optional[str] = None) -> str:
+    """将结果写入 JSON 文件，便于多次运行之间对比"""
+    output_dir = output_dir or os.path.join(os.path.dirname(__file__), "results")
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(output_dir, f"{name}_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"benchmark": name, "generated_at": datetime.utcnow().isoformat(), "results": results},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    return path
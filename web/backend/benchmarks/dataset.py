@@ -0,0 +1,306 @@
+"""
+Tremor Guard - Synthetic Dataset Generator
+震颤卫士 - 合成数据集生成
+
+为 N 个患者 × M 天批量生成 users / devices / tremor_sessions / tremor_data。
+数据分布参照固件 tremor_detection.cpp 的判定规则:
+- 检测条件: 4-6Hz 频段功率 > 0.5 且 2.5g <= RMS <= 5.0g
+- RMS > 5.0g 判为超出范围 (valid=False)
+- 严重度按 RMS 阈值 2.5 / 3.0 / 3.5 / 4.0 划分为 0-4
+- amplitude = band_power / (FFT_SAMPLES / 2)
+每个患者有各自的震颤倾向，服药 (8/13/19 点) 后逐渐加重，模拟剂末现象。
+
+使用 SQLAlchemy Core executemany 分块插入，显式分配主键 (PostgreSQL 结束后同步序列)。
+
+Usage:
+    python -m benchmarks.dataset --patients 20 --days 14
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from passlib.context import CryptContext
+from sqlalchemy import func, select, text
+
+from app.core.database import engine, init_db
+from app.models.device import Device
+from app.models.tremor_data import TremorData, TremorSession, TremorSpectrum
+from app.models.user import User
+from app.services.spectrum_storage import encode_spectrum
+
+PASSWORD = "Password123!"
+
+# 与固件 tremor_config.h 保持一致
+FFT_SAMPLES = 256
+SAMPLE_RATE = 125
+BIN_HZ = SAMPLE_RATE / FFT_SAMPLES
+SPECTRUM_BINS = 32                      # 0 - 15.6Hz
+POWER_THRESHOLD = 0.5
+RMS_MIN, RMS_MAX = 2.5, 5.0
+SEVERITY_THRESHOLDS = (2.5, 3.0, 3.5, 4.0)
+SEVERITY_LABELS = ("无", "轻微", "轻度", "中度", "重度")
+
+DOSE_HOURS = (8, 13, 19)
+SESSION_WINDOWS = ((7, 11), (12, 16), (18, 22))   # 每天最多 3 个检测时段
+INSERT_CHUNK = 5000
+
+
+# ============================================================
+# 数据生成 (NumPy 向量化)
+# ============================================================
+
+def _hours_since_dose(hours: np.ndarray) -> np.ndarray:
+    """距上次服药的小时数"""
+    since = np.full(hours.shape, 24.0)
+    for dose in DOSE_HOURS:
+        delta = (hours - dose) % 24
+        since = np.minimum(since, delta)
+    return since
+
+
+def generate_session_rows(rng: np.random.Generator, start: datetime, count: int, interval: float,
+                          tremor_level: float, spectrum_ratio: float) -> Dict[str, np.ndarray]:
+    """生成一个会话的检测数据 (列式)"""
+    offsets = np.arange(count) * interval + rng.uniform(0, interval * 0.2, count)
+    hours = start.hour + start.minute / 60 + offsets / 3600
+    # 剂末现象: 距服药越久震颤概率越高
+    p_tremor = np.clip(tremor_level * (0.5 + _hours_since_dose(hours) / 4), 0, 0.95)
+    tremor_motion = rng.random(count) < p_tremor
+
+    frequency = np.where(tremor_motion, rng.normal(5.0, 0.35, count), rng.uniform(0.5, 12.0, count))
+    band_power = np.where(
+        tremor_motion,
+        rng.lognormal(np.log(1.2 + 2 * tremor_level), 0.5, count),
+        rng.lognormal(np.log(0.15), 0.8, count)
+    )
+    peak_power = band_power * rng.uniform(0.4, 0.9, count)
+    rms = np.where(
+        tremor_motion,
+        RMS_MIN - 0.2 + rng.gamma(2.0, 0.25 + 0.5 * tremor_level, count),
+        rng.uniform(0.2, 2.6, count)
+    )
+    # 约 1% 的剧烈运动导致 RMS 超出上限
+    rms = np.where(rng.random(count) < 0.01, rng.uniform(RMS_MAX, 8.0, count), rms)
+
+    out_of_range = rms > RMS_MAX
+    detected = (
+        (band_power > POWER_THRESHOLD)
+        & (frequency >= 4.0) & (frequency <= 6.0)
+        & (rms >= RMS_MIN) & ~out_of_range
+    )
+    severity = np.where(detected, np.searchsorted(SEVERITY_THRESHOLDS, rms, side="right"), 0)
+
+    rows = {
+        "offset_seconds": offsets,
+        "detected": detected,
+        "valid": ~out_of_range,
+        "out_of_range": out_of_range,
+        "frequency": np.round(frequency, 3),
+        "peak_power": np.round(peak_power, 4),
+        "band_power": np.round(band_power, 4),
+        "amplitude": np.round(band_power / (FFT_SAMPLES / 2), 5),
+        "rms_amplitude": np.round(rms, 4),
+        "severity": severity,
+    }
+
+    # 频谱: 噪声底 + 主频处高斯峰
+    with_spectrum = rng.random(count) < spectrum_ratio
+    if with_spectrum.any():
+        bins = np.arange(SPECTRUM_BINS) * BIN_HZ
+        floor = rng.exponential(0.05, (count, SPECTRUM_BINS))
+        peak = peak_power[:, None] * np.exp(-((bins[None, :] - frequency[:, None]) ** 2) / (2 * 0.3 ** 2))
+        rows["spectrum"] = np.round(floor + peak, 4)
+    rows["with_spectrum"] = with_spectrum
+    return rows
+
+
+async def _next_id(conn, model) -> int:
+    return (await conn.scalar(select(func.coalesce(func.max(model.id), 0)))) + 1
+
+
+async def _insert_chunks(conn, table, rows: List[dict]):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        await conn.execute(table.insert(), rows[i:i + INSERT_CHUNK])
+
+
+async def _sync_sequences(conn):
+    """显式主键插入后同步 PostgreSQL 序列"""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("users", "devices", "tremor_sessions", "tremor_data"):
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+
+
+async def find_dataset(tag: str) -> List[dict]:
+    """查找已生成的数据集患者 [{user_id, device_id, session_ids}]"""
+    async with engine.connect() as conn:
+        users = (await conn.execute(
+            select(User.id).where(User.email.like(f"{tag}_%@bench.local")).order_by(User.id)
+        )).scalars().all()
+        patients = []
+        for user_id in users:
+            device_id = await conn.scalar(select(Device.device_id).where(Device.owner_id == user_id))
+            session_ids = (await conn.execute(
+                select(TremorSession.id).where(TremorSession.user_id == user_id).order_by(TremorSession.id)
+            )).scalars().all()
+            patients.append({"user_id": user_id, "device_id": device_id, "session_ids": list(session_ids)})
+    return patients
+
+
+async def generate_dataset(patients: int, days: int, interval: float = 60.0, spectrum_ratio: float = 1.0,
+                           seed: int = 42, tag: str = "bench", end: Optional[datetime] = None) -> dict:
+    """
+    生成数据集
+
+    Args:
+        patients: 患者数
+        days: 天数 (截止到 end，默认当前时间)
+        interval: 检测间隔 (秒)
+        spectrum_ratio: 带频谱 (tremor_spectra) 的行比例
+        tag: 邮箱/设备 ID 前缀，用于重复运行时查找数据集
+    """
+    await init_db()
+    rng = np.random.default_rng(seed)
+    end = (end or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    first_day = (end - timedelta(days=days)).replace(hour=0)
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+    started = time.perf_counter()
+    counts = {"users": 0, "devices": 0, "sessions": 0, "tremor_data": 0}
+
+    async with engine.begin() as conn:
+        user_id = await _next_id(conn, User)
+        device_pk = await _next_id(conn, Device)
+        session_id = await _next_id(conn, TremorSession)
+        data_id = await _next_id(conn, TremorData)
+
+        for p in range(patients):
+            tremor_level = float(rng.uniform(0.1, 0.6))
+            await conn.execute(User.__table__.insert(), [{
+                "id": user_id,
+                "email": f"{tag}_{p:05d}@bench.local",
+                "username": f"{tag}_{p:05d}",
+                "hashed_password": hashed,
+                "full_name": f"Bench Patient {p}",
+                "role": "user",
+                "is_active": True,
+                "is_verified": True,
+                "created_at": first_day,
+                "updated_at": first_day,
+            }])
+            await conn.execute(Device.__table__.insert(), [{
+                "id": device_pk,
+                "device_id": f"{tag.upper()}-{p:05d}",
+                "name": f"Bench Band {p}",
+                "firmware_version": "1.0.0",
+                "is_online": False,
+                "owner_id": user_id,
+                "created_at": first_day,
+                "updated_at": first_day,
+            }])
+
+            session_rows, data_rows, spectrum_rows = [], [], []
+            for day in range(days + 1):
+                day_start = first_day + timedelta(days=day)
+                for window_start, window_end in SESSION_WINDOWS:
+                    if rng.random() < 0.3:
+                        continue
+                    start = day_start + timedelta(hours=float(rng.uniform(window_start, window_end - 2)))
+                    if start >= end:
+                        continue
+                    count = max(1, int(rng.uniform(30, 120) * 60 / interval))
+                    rows = generate_session_rows(rng, start, count, interval, tremor_level, spectrum_ratio)
+                    detected = rows["detected"]
+                    duration = int(rows["offset_seconds"][-1]) + 1
+
+                    session_rows.append({
+                        "id": session_id,
+                        "user_id": user_id,
+                        "device_id": device_pk,
+                        "start_time": start,
+                        "end_time": start + timedelta(seconds=duration),
+                        "duration_seconds": duration,
+                        "total_analyses": count,
+                        "tremor_count": int(detected.sum()),
+                        "avg_frequency": round(float(rows["frequency"][detected].mean()), 2) if detected.any() else None,
+                        "avg_amplitude": round(float(rows["amplitude"][detected].mean()), 4) if detected.any() else None,
+                        "max_severity": int(rows["severity"].max()),
+                        "avg_severity": round(float(rows["severity"][detected].mean()), 2) if detected.any() else None,
+                        "is_active": False,
+                    })
+
+                    spectrum = rows.get("spectrum")
+                    for i in range(count):
+                        severity = int(rows["severity"][i])
+                        data_rows.append({
+                            "id": data_id,
+                            "session_id": session_id,
+                            "timestamp": start + timedelta(seconds=float(rows["offset_seconds"][i])),
+                            "detected": bool(detected[i]),
+                            "valid": bool(rows["valid"][i]),
+                            "out_of_range": bool(rows["out_of_range"][i]),
+                            "frequency": float(rows["frequency"][i]),
+                            "peak_power": float(rows["peak_power"][i]),
+                            "band_power": float(rows["band_power"][i]),
+                            "amplitude": float(rows["amplitude"][i]),
+                            "rms_amplitude": float(rows["rms_amplitude"][i]),
+                            "severity": severity,
+                            "severity_label": SEVERITY_LABELS[severity],
+                        })
+                        if spectrum is not None and rows["with_spectrum"][i]:
+                            spectrum_rows.append({"data_id": data_id, **encode_spectrum(spectrum[i], BIN_HZ)})
+                        data_id += 1
+                    session_id += 1
+
+            await _insert_chunks(conn, TremorSession.__table__, session_rows)
+            await _insert_chunks(conn, TremorData.__table__, data_rows)
+            await _insert_chunks(conn, TremorSpectrum.__table__, spectrum_rows)
+            counts["users"] += 1
+            counts["devices"] += 1
+            counts["sessions"] += len(session_rows)
+            counts["tremor_data"] += len(data_rows)
+            user_id += 1
+            device_pk += 1
+
+        await _sync_sequences(conn)
+
+    elapsed = time.perf_counter() - started
+    return {
+        **counts,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(counts["tremor_data"] / elapsed, 1) if elapsed else None,
+        "dialect": engine.dialect.name,
+    }
+
+
+async def main(args):
+    summary = await generate_dataset(
+        patients=args.patients,
+        days=args.days,
+        interval=args.interval,
+        spectrum_ratio=args.spectrum_ratio,
+        seed=args.seed,
+        tag=args.tag,
+    )
+    print(
+        f"生成完成 ({summary['dialect']}): {summary['users']} 患者, {summary['sessions']} 会话, "
+        f"{summary['tremor_data']} 条数据, 用时 {summary['seconds']}s ({summary['rows_per_second']} 行/秒)"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成震颤数据集 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--patients", type=int, default=20, help="患者数")
+    parser.add_argument("--days", type=int, default=14, help="天数")
+    parser.add_argument("--interval", type=float, default=60.0, help="检测间隔 (秒)，固件连续模式为 2.5")
+    parser.add_argument("--spectrum-ratio", type=float, default=1.0, help="带频谱数据的行比例")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--tag", default="bench", help="数据集标签 (邮箱/设备 ID 前缀)")
+    asyncio.run(main(parser.parse_args()))
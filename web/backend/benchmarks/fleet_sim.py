@@ -0,0 +1,492 @@
+"""
+Tremor Guard - ESP32 Fleet Simulator
+震颤卫士 - 设备群模拟器
+
+用 asyncio 模拟 N 台虚拟设备，按固件 (data_uploader.cpp / network_config.h)
+的节奏向服务端发请求，用于复现无法用真机制造的场景，例如早晨 5000 台设备同时重连:
+
+- 每 2.5s 一次分析结果，写入本地离线队列 (容量 50，满时覆盖最旧一条)
+- 队列 >= BATCH_SIZE 条，或距上次上传超过 BATCH_TIMEOUT 时批量上传整个队列，
+  失败则保留队列在下一个周期重试
+- 重新联网后立即补传离线队列 (突发回放)
+- 每 5 分钟一次心跳，开机/重连时同步配置 (可选定期同步)
+- 随机断网，以及 --storm-at 指定的全体断网 + 带抖动的集中重连
+
+结果: 各接口的接受率 (2xx/304 占比)、延迟分布、状态码，数据行的生成/接受/覆盖丢弃数，
+以及每秒采样的设备侧积压 (离线队列总行数) 和进行中的请求数。
+
+默认在进程内通过 ASGI 调用应用 (包含 lifespan)，也可用 --base-url 压测运行中的服务。
+
+Usage:
+    # 50 台设备，10 倍速运行 60 秒 (模拟 10 分钟)
+    DATABASE_URL=sqlite+aiosqlite:///./fleet.db python -m benchmarks.fleet_sim --devices 50 --duration 60 --speed 10
+    # 早晨重连风暴: 5000 台设备在模拟第 120 秒起断网 30 分钟，60 秒内陆续恢复
+    python -m benchmarks.fleet_sim --devices 5000 --duration 300 --speed 10 \\
+        --storm-at 120 --storm-offline 1800 --storm-jitter 60 --base-url http://localhost:8000
+    # 设备签名 (主密钥派生)
+    DEVICE_API_KEY=secret python -m benchmarks.fleet_sim --sign
+"""
+
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from app.api.auth import create_access_token
+from app.core.config import settings
+from app.core.device_auth import compute_signature, derive_device_key
+from benchmarks.common import app_client, latency_summary, write_results
+from benchmarks.dataset import BIN_HZ, PASSWORD, SEVERITY_LABELS, generate_session_rows
+
+
+# ============================================================
+# 固件参数 (network_config.h / tremor_config.h)
+# ============================================================
+
+ANALYSIS_INTERVAL = 2.5          # TREMOR_ANALYSIS_INTERVAL_MS
+BATCH_SIZE = 10                  # BATCH_SIZE
+BATCH_TIMEOUT = 30.0             # BATCH_TIMEOUT_MS
+OFFLINE_BUFFER_SIZE = 50         # OFFLINE_BUFFER_SIZE
+HEARTBEAT_INTERVAL = 300.0       # HEARTBEAT_INTERVAL_MS
+HTTP_TIMEOUT = 10.0              # HTTP_TIMEOUT_MS
+FIRMWARE_VERSION = "1.0.0"
+READING_BLOCK = 64               # 每次预生成的分析结果条数
+
+
+# ============================================================
+# 统计
+# ============================================================
+
+class EndpointStats:
+    """单个接口的请求统计"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.accepted = 0
+
+    def record(self, status, elapsed_ms: float):
+        self.statuses[status] += 1
+        self.latencies.append(elapsed_ms)
+        if isinstance(status, int) and (200 <= status < 300 or status == 304):
+            self.accepted += 1
+
+    def summary(self, wall: float) -> dict:
+        total = sum(self.statuses.values())
+        return {
+            "requests": total,
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.accepted / total, 4) if total else None,
+            "throughput_rps": round(total / wall, 1) if wall else None,
+            **latency_summary(self.latencies),
+            "status": {str(code): count for code, count in sorted(self.statuses.items(), key=str)},
+        }
+
+
+class SimClock:
+    """模拟时钟: 模拟时间 = 墙钟时间 × speed，数据时间戳以 epoch 为起点"""
+
+    def __init__(self, speed: float, epoch: datetime):
+        self.speed = speed
+        self.epoch = epoch
+        self._start = time.perf_counter()
+
+    def now(self) -> float:
+        """模拟开始后的秒数"""
+        return (time.perf_counter() - self._start) * self.speed
+
+    async def sleep_until(self, sim_time: float):
+        delay = (sim_time - self.now()) / self.speed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def timestamp(self, sim_time: float) -> datetime:
+        return self.epoch + timedelta(seconds=sim_time)
+
+
+# ============================================================
+# 虚拟设备
+# ============================================================
+
+class VirtualDevice:
+    """按固件节奏运行的单台设备"""
+
+    def __init__(self, device_id: str, fleet: "Fleet", rng: np.random.Generator, single_upload: bool):
+        self.device_id = device_id
+        self.fleet = fleet
+        self.rng = rng
+        self.single_upload = single_upload
+        self.tremor_level = float(rng.beta(2, 3))
+        self.battery = float(rng.uniform(40, 100))
+        self.queue: Deque[dict] = deque(maxlen=OFFLINE_BUFFER_SIZE)
+        self.online = True
+        self.offline_until = 0.0
+        self.reconnected = False
+        self.last_upload = 0.0
+        self.last_heartbeat = 0.0
+        self.last_config_sync = 0.0
+        self.config_etag: Optional[str] = None
+        self._readings: Dict[str, np.ndarray] = {}
+        self._reading_index = READING_BLOCK
+
+        storm = fleet.args.storm_at
+        if storm is not None:
+            self.storm_window = (storm, storm + fleet.args.storm_offline + rng.uniform(0, fleet.args.storm_jitter))
+        else:
+            self.storm_window = None
+
+    # ------------------------------------------------------------
+    # 数据
+    # ------------------------------------------------------------
+
+    def _next_reading(self, sim_time: float) -> dict:
+        """固件格式的一条分析结果 (未检出震颤时只带 RMS)"""
+        if self._reading_index >= READING_BLOCK:
+            self._readings = generate_session_rows(
+                self.rng, self.fleet.clock.timestamp(sim_time), READING_BLOCK, ANALYSIS_INTERVAL,
+                self.tremor_level, self.fleet.args.spectrum_ratio
+            )
+            self._reading_index = 0
+        rows, i = self._readings, self._reading_index
+        self._reading_index += 1
+
+        reading = {
+            "device_id": self.device_id,
+            "timestamp": self.fleet.clock.timestamp(sim_time).isoformat(),
+            "detected": bool(rows["detected"][i]),
+            "valid": bool(rows["valid"][i]),
+            "out_of_range": bool(rows["out_of_range"][i]),
+            "rms_amplitude": float(rows["rms_amplitude"][i]),
+        }
+        if reading["detected"]:
+            severity = int(rows["severity"][i])
+            reading.update(
+                frequency=float(rows["frequency"][i]),
+                peak_power=float(rows["peak_power"][i]),
+                band_power=float(rows["band_power"][i]),
+                amplitude=float(rows["amplitude"][i]),
+                severity=severity,
+                severity_label=SEVERITY_LABELS[severity],
+            )
+        if "spectrum" in rows and rows["with_spectrum"][i]:
+            reading["spectrum_data"] = {"bin_hz": BIN_HZ, "power": rows["spectrum"][i].tolist()}
+        return reading
+
+    def _enqueue(self, reading: dict):
+        """写入离线队列，满时覆盖最旧一条 (与固件环形缓冲区一致)"""
+        if len(self.queue) == OFFLINE_BUFFER_SIZE:
+            self.fleet.rows["dropped"] += 1
+        self.queue.append(reading)
+
+    # ------------------------------------------------------------
+    # 网络状态
+    # ------------------------------------------------------------
+
+    def _update_connectivity(self, sim_time: float):
+        args = self.fleet.args
+        if self.online and args.outage_rate > 0 and self.rng.random() < args.outage_rate * ANALYSIS_INTERVAL / 3600:
+            self.offline_until = sim_time + self.rng.exponential(args.outage_seconds)
+
+        in_storm = self.storm_window is not None and self.storm_window[0] <= sim_time < self.storm_window[1]
+        online = sim_time >= self.offline_until and not in_storm
+        if online and not self.online:
+            self.reconnected = True
+        self.online = online
+
+    # ------------------------------------------------------------
+    # 主循环
+    # ------------------------------------------------------------
+
+    async def run(self):
+        clock = self.fleet.clock
+        # 设备开机时间随机错开一个分析周期
+        next_tick = clock.now() + self.rng.uniform(0, ANALYSIS_INTERVAL)
+        await clock.sleep_until(next_tick)
+        await self._sync_config(next_tick)
+        self.last_upload = self.last_heartbeat = next_tick
+
+        while True:
+            now = clock.now()
+            self._update_connectivity(now)
+            self.fleet.rows["generated"] += 1
+            reading = self._next_reading(now)
+
+            if self.online and self.single_upload and not self.queue:
+                if not await self._upload_single(reading):
+                    self._enqueue(reading)
+            else:
+                self._enqueue(reading)
+
+            if self.online:
+                await self._process(clock.now())
+
+            # 按绝对时间调度，请求耗时超过一个周期时不补跑
+            next_tick = max(next_tick + ANALYSIS_INTERVAL, clock.now())
+            await clock.sleep_until(next_tick)
+
+    async def _process(self, now: float):
+        """uploaderProcess(): 重连补传、批量上传、心跳、配置同步"""
+        if self.reconnected:
+            self.reconnected = False
+            await self._sync_config(now)
+            await self._upload_batch(now)
+        elif len(self.queue) >= BATCH_SIZE or (self.queue and now - self.last_upload >= BATCH_TIMEOUT):
+            await self._upload_batch(now)
+
+        if now - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+            if await self._heartbeat(now):
+                self.last_heartbeat = now
+
+        interval = self.fleet.args.config_interval
+        if interval > 0 and now - self.last_config_sync >= interval:
+            await self._sync_config(now)
+
+    async def _upload_single(self, reading: dict) -> bool:
+        self.fleet.rows["sent"] += 1
+        ok = await self.fleet.request("data.upload", "POST", "/api/data/upload", self.device_id, reading) is not None
+        if ok:
+            self.fleet.rows["accepted"] += 1
+            self.last_upload = self.fleet.clock.now()
+        return ok
+
+    async def _upload_batch(self, now: float) -> bool:
+        if not self.queue:
+            return True
+        items = list(self.queue)
+        self.fleet.rows["sent"] += len(items)
+        response = await self.fleet.request("data.upload_batch", "POST", "/api/data/upload/batch", self.device_id, {
+            "device_id": self.device_id,
+            "batch_id": secrets.token_hex(4),
+            "data": items,
+        })
+        ok = response is not None
+        if ok:
+            self.fleet.rows["accepted"] += len(items)
+            # 上传期间本设备不会写入队列，直接清空已上传部分
+            for _ in items:
+                self.queue.popleft()
+            self.last_upload = now
+        return ok
+
+    async def _heartbeat(self, now: float) -> bool:
+        self.battery = max(5.0, self.battery - 0.05)
+        response = await self.fleet.request("device.heartbeat", "POST", "/api/device/heartbeat", self.device_id, {
+            "device_id": self.device_id,
+            "firmware_version": FIRMWARE_VERSION,
+            "battery_level": round(self.battery, 1),
+            "wifi_rssi": int(self.rng.integers(-85, -40)),
+            "queue_count": len(self.queue),
+            "uptime_ms": int(now * 1000),
+        })
+        return response is not None
+
+    async def _sync_config(self, now: float) -> bool:
+        headers = {"If-None-Match": self.config_etag} if self.config_etag else None
+        response = await self.fleet.request(
+            "config.current", "GET", "/api/config/current", self.device_id, None, extra_headers=headers
+        )
+        if response is None:
+            return False
+        self.last_config_sync = now
+        if self.fleet.args.config_etag:
+            self.config_etag = response.headers.get("ETag", self.config_etag)
+        return True
+
+
+# ============================================================
+# 设备群
+# ============================================================
+
+class Fleet:
+    """虚拟设备群: 共享 HTTP 客户端、签名和统计"""
+
+    def __init__(self, args, client: httpx.AsyncClient, clock: SimClock):
+        self.args = args
+        self.client = client
+        self.clock = clock
+        self.master_key = (args.master_key or settings.DEVICE_API_KEY) if args.sign else None
+        self._keys: Dict[str, bytes] = {}
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.rows: Counter = Counter()
+        self.in_flight = 0
+
+        rng = np.random.default_rng(args.seed)
+        single = rng.random(args.devices) < args.single_upload_ratio
+        self.devices = [
+            VirtualDevice(f"{args.prefix}-{i:05d}", self, np.random.default_rng(args.seed + i + 1), bool(single[i]))
+            for i in range(args.devices)
+        ]
+
+    def _sign(self, method: str, path: str, device_id: str, body: bytes) -> dict:
+        key = self._keys.get(device_id)
+        if key is None:
+            key = self._keys[device_id] = derive_device_key(self.master_key, device_id)
+        timestamp = str(int(time.time()))
+        nonce = secrets.token_hex(8)
+        return {
+            "X-Device-Id": device_id,
+            "X-Timestamp": timestamp,
+            "X-Nonce": nonce,
+            "X-Signature": compute_signature(key, method, path, device_id, timestamp, nonce, body),
+        }
+
+    async def request(self, name: str, method: str, path: str, device_id: str, payload: Optional[dict],
+                      extra_headers: Optional[dict] = None) -> Optional[httpx.Response]:
+        """发送请求并记录结果，返回被接受 (2xx/304) 的响应，否则返回 None"""
+        body = json.dumps(payload, ensure_ascii=False).encode() if payload is not None else b""
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        headers.update(extra_headers or {})
+        if self.master_key:
+            headers.update(self._sign(method, path, device_id, body))
+
+        stats = self.endpoints.setdefault(name, EndpointStats())
+        self.in_flight += 1
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, path, content=body or None, headers=headers)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finally:
+            self.in_flight -= 1
+        stats.record(status, (time.perf_counter() - start) * 1000)
+        accepted = isinstance(status, int) and (200 <= status < 300 or status == 304)
+        return response if accepted else None
+
+    def backlog(self) -> dict:
+        return {
+            "sim_seconds": round(self.clock.now(), 1),
+            "queued_rows": sum(len(d.queue) for d in self.devices),
+            "offline_devices": sum(1 for d in self.devices if not d.online),
+            "in_flight": self.in_flight,
+        }
+
+
+async def bind_devices(client: httpx.AsyncClient, device_ids: List[str], users: int, prefix: str):
+    """
+    注册 users 个用户并把设备平均绑定到这些用户
+
+    未绑定用户的设备上传会被接收但不入库
+    """
+    for u in range(users):
+        email = f"{prefix.lower()}_{u:04d}@fleet-sim.example.com"
+        response = await client.post("/api/auth/register", json={
+            "email": email, "username": f"{prefix.lower()}_{u:04d}", "password": PASSWORD,
+        })
+        if response.status_code == 400:
+            response = await client.post("/api/auth/login", data={"username": email, "password": PASSWORD})
+        response.raise_for_status()
+        user_id = response.json()["user"]["id"]
+        token = create_access_token({"sub": str(user_id)}, timedelta(hours=6))
+        headers = {"Authorization": f"Bearer {token}"}
+        for device_id in device_ids[u::users]:
+            response = await client.post("/api/device/register", json={
+                "device_id": device_id, "name": device_id, "firmware_version": FIRMWARE_VERSION,
+            }, headers=headers)
+            response.raise_for_status()
+
+
+async def main(args):
+    # 数据时间戳以"现在"为终点，避免写入未来时间的数据
+    epoch = datetime.utcnow() - timedelta(seconds=args.duration * args.speed)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+
+    async with app_client(args.base_url, timeout=HTTP_TIMEOUT, limits=limits) as client:
+        device_ids = [f"{args.prefix}-{i:05d}" for i in range(args.devices)]
+        if args.bind_users > 0:
+            print(f"绑定 {args.devices} 台设备到 {args.bind_users} 个用户 ...")
+            await bind_devices(client, device_ids, args.bind_users, args.prefix)
+
+        fleet = Fleet(args, client, SimClock(args.speed, epoch))
+        timeline: List[dict] = []
+        print(f"启动 {args.devices} 台虚拟设备，{args.speed}x 速度运行 {args.duration}s ...")
+
+        tasks = [asyncio.create_task(device.run()) for device in fleet.devices]
+        wall_start = time.perf_counter()
+        next_report = args.report_every
+        try:
+            while (elapsed := time.perf_counter() - wall_start) < args.duration:
+                await asyncio.sleep(min(1.0, args.duration - elapsed))
+                timeline.append(fleet.backlog())
+                if time.perf_counter() - wall_start >= next_report:
+                    next_report += args.report_every
+                    sample = timeline[-1]
+                    requests = sum(sum(s.statuses.values()) for s in fleet.endpoints.values())
+                    accepted = sum(s.accepted for s in fleet.endpoints.values())
+                    print(
+                        f"  t={sample['sim_seconds']:8.0f}s 离线={sample['offline_devices']:5d} "
+                        f"积压={sample['queued_rows']:7d} 行 进行中={sample['in_flight']:5d} "
+                        f"请求={requests} 接受率={accepted / requests if requests else 0:.2%}"
+                    )
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        wall = time.perf_counter() - wall_start
+
+    endpoints = {name: stats.summary(wall) for name, stats in sorted(fleet.endpoints.items())}
+    for name, r in endpoints.items():
+        print(
+            f"{name:18} {r['requests']:7d} req {r['throughput_rps'] or 0:7.1f} req/s "
+            f"接受率={r['acceptance_rate'] or 0:.2%} p50={r['p50_ms']:8.1f}ms "
+            f"p95={r['p95_ms']:8.1f}ms p99={r['p99_ms']:8.1f}ms status={r['status']}"
+        )
+    rows = {**fleet.rows, "unsent": sum(len(d.queue) for d in fleet.devices)}
+    print(f"数据行: {rows}")
+
+    database = None
+    if not args.base_url:
+        from app.core.database import engine
+        database = engine.dialect.name
+    path = write_results("fleet", {
+        "params": {**vars(args), "master_key": None},
+        "database": database,
+        "wall_seconds": round(wall, 1),
+        "sim_seconds": round(fleet.clock.now(), 1),
+        "endpoints": endpoints,
+        "rows": rows,
+        "max_queued_rows": max((s["queued_rows"] for s in timeline), default=0),
+        "max_in_flight": max((s["in_flight"] for s in timeline), default=0),
+        "timeline": timeline,
+    })
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ESP32 设备群上传模拟 (使用 DATABASE_URL 指定的数据库)")
+    parser.add_argument("--devices", type=int, default=100, help="虚拟设备数")
+    parser.add_argument("--duration", type=float, default=60.0, help="运行时长 (墙钟秒)")
+    parser.add_argument("--speed", type=float, default=1.0, help="时间倍速 (模拟秒 / 墙钟秒)")
+    parser.add_argument("--prefix", default="SIM", help="设备 ID 前缀")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--single-upload-ratio", type=float, default=0.0,
+                        help="逐条调用 /data/upload 的设备比例 (其余设备批量上传)")
+    parser.add_argument("--spectrum-ratio", type=float, default=0.0, help="携带频谱数据的分析结果比例")
+    parser.add_argument("--config-interval", type=float, default=0.0,
+                        help="定期同步配置的间隔 (模拟秒，0 表示仅开机/重连时同步)")
+    parser.add_argument("--config-etag", action="store_true",
+                        help="同步配置时携带 If-None-Match (配置未变化时服务端返回 304，不传输配置)")
+    parser.add_argument("--outage-rate", type=float, default=0.0, help="每台设备每小时随机断网次数")
+    parser.add_argument("--outage-seconds", type=float, default=120.0, help="随机断网平均时长 (模拟秒)")
+    parser.add_argument("--storm-at", type=float, default=None, help="全体断网开始时间 (模拟秒)")
+    parser.add_argument("--storm-offline", type=float, default=1800.0, help="全体断网时长 (模拟秒)")
+    parser.add_argument("--storm-jitter", type=float, default=30.0, help="重连时间抖动 (模拟秒)")
+    parser.add_argument("--bind-users", type=int, default=10,
+                        help="注册的用户数，设备平均绑定 (0 表示不绑定，上传不入库)")
+    parser.add_argument("--sign", action="store_true", help="使用主密钥派生的设备密钥签名请求")
+    parser.add_argument("--master-key", default=None, help="签名主密钥 (默认 DEVICE_API_KEY)")
+    parser.add_argument("--connections", type=int, default=1000, help="HTTP 连接池上限")
+    parser.add_argument("--report-every", type=float, default=5.0, help="进度输出间隔 (墙钟秒)")
+    parser.add_argument("--base-url", default=None, help="压测运行中的服务，例如 http://localhost:8000")
+    args = parser.parse_args()
+    if args.sign and not (args.master_key or settings.DEVICE_API_KEY):
+        parser.error("--sign 需要 --master-key 或 DEVICE_API_KEY")
+    asyncio.run(main(args))
@@ -0,0 +1,257 @@
+"""
+Tremor Guard - Packet Replay
+震颤卫士 - 抓包回放
+
+把 /api/test 抓到的数据包重新发送到任意接口，用真实设备流量做压测或复现问题。
+
+数据来源 (二选一):
+- --log:      抓包滚动日志 (TEST_CAPTURE_SPILL_DIR 下的 packets-*.jsonl 及 .1/.2 ... 历史文件)
+- --from-url: 运行中服务的 /api/test/packets (内存环形缓冲区)
+
+发送目标默认为数据包原来的路径，--path 可改为其他接口 (例如把测试抓包回放到 /api/data/upload/batch)。
+--base-url 为空时在进程内调用应用。
+
+另外 --ring 对比环形缓冲区与原先 "列表 + 切片 + 全量过滤" 的写入/查询耗时。
+
+Usage:
+    python -m benchmarks.replay_packets --log /tmp/tremor_capture --path /api/data/upload/batch --rate 50
+    python -m benchmarks.replay_packets --from-url http://localhost:8000 --type batch --base-url http://staging:8000
+    python -m benchmarks.replay_packets --ring --ring-packets 100000
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+from app.core.packet_capture import PacketRing
+from benchmarks.common import app_client, latency_summary, write_results
+
+# 回放时不转发的请求头 (由客户端重新生成)
+SKIP_HEADERS = {"host", "content-length", "connection", "accept-encoding", "transfer-encoding"}
+
+
+# ============================================================
+# 读取抓包
+# ============================================================
+
+def log_files(paths: List[str]) -> List[str]:
+    """展开日志目录，按写入顺序排列 (每组内 .N 越大越旧)"""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for current in sorted(glob.glob(os.path.join(path, "packets-*.jsonl"))):
+            rotated = glob.glob(current + ".*")
+            rotated.sort(key=lambda name: int(name.rsplit(".", 1)[1]), reverse=True)
+            files.extend(rotated + [current])
+    return files
+
+
+def load_log(paths: List[str]) -> List[dict]:
+    packets = []
+    for path in log_files(paths):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    packets.append(json.loads(line))
+    # 多个 worker 的日志按全局编号合并
+    packets.sort(key=lambda p: p["id"])
+    return packets
+
+
+async def load_remote(base_url: str, limit: int) -> List[dict]:
+    """从运行中的服务读取内存中的数据包 (分页)"""
+    packets = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        while len(packets) < limit:
+            response = await client.get("/api/test/packets", params={
+                "limit": min(500, limit - len(packets)), "offset": len(packets)
+            })
+            response.raise_for_status()
+            page = response.json()["packets"]
+            if not page:
+                break
+            packets.extend(page)
+    packets.reverse()  # 接口返回最新的在前
+    return packets
+
+
+def select_packets(packets: List[dict], packet_type: Optional[str], device_id: Optional[str]) -> List[dict]:
+    return [
+        p for p in packets
+        if (packet_type is None or p.get("type", "unknown") == packet_type)
+        and (device_id is None or p.get("device_id") == device_id)
+    ]
+
+
+# ============================================================
+# 回放
+# ============================================================
+
+def replay_request(packet: dict, path_override: Optional[str]):
+    """数据包 → (路径, 请求体, 请求头)"""
+    path = path_override or packet.get("path") or "/api/test/receive"
+    headers = {
+        name: value for name, value in (packet.get("headers") or {}).items()
+        if name.lower() not in SKIP_HEADERS
+    }
+    data = packet.get("data")
+    if isinstance(data, dict) and set(data) == {"raw"}:
+        # 原始请求不是 JSON，按原文发送
+        return path, data["raw"].encode("utf-8"), headers
+    headers["content-type"] = "application/json"
+    return path, json.dumps(data, ensure_ascii=False).encode("utf-8"), headers
+
+
+async def replay(client: httpx.AsyncClient, packets: List[dict], args) -> dict:
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(args.repeat):
+        for packet in packets:
+            queue.put_nowait(packet)
+    total = queue.qsize()
+
+    statuses: Counter = Counter()
+    latencies: List[float] = []
+    interval = args.concurrency / args.rate if args.rate > 0 else 0.0
+
+    async def worker():
+        while True:
+            try:
+                packet = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            path, content, headers = replay_request(packet, args.path)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, content=content, headers=headers)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed * 1000)
+            if interval > elapsed:
+                await asyncio.sleep(interval - elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - start
+    return {
+        "requests": total,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(total / duration, 1) if duration else 0.0,
+        "status_counts": dict(statuses),
+        "latency": latency_summary(latencies),
+    }
+
+
+# ============================================================
+# 环形缓冲区对比
+# ============================================================
+
+def bench_ring(count: int, capacity: int, devices: int, queries: int) -> dict:
+    """环形缓冲区 vs 原先的列表实现 (追加 + 超限切片，查询时倒序 + 全量过滤)"""
+    types = ["batch", "heartbeat", "unknown"]
+    packets = [
+        {"id": i + 1, "type": random.choice(types), "device_id": f"DEV{random.randrange(devices):04d}"}
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    baseline: List[dict] = []
+    for packet in packets:
+        baseline.append(packet)
+        if len(baseline) > capacity:
+            baseline = baseline[-capacity:]
+    list_insert = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ring = PacketRing(capacity)
+    for packet in packets:
+        ring.append(packet)
+    ring_insert = time.perf_counter() - start
+
+    lookups = [(random.choice(types + [None]), f"DEV{random.randrange(devices):04d}") for _ in range(queries)]
+
+    start = time.perf_counter()
+    for packet_type, device_id in lookups:
+        items = list(reversed(baseline))
+        if packet_type:
+            items = [p for p in items if p.get("type") == packet_type]
+        items = [p for p in items if p.get("device_id") == device_id]
+        items[:50]
+    list_query = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for packet_type, device_id in lookups:
+        ring.query(50, 0, packet_type, device_id)
+    ring_query = time.perf_counter() - start
+
+    return {
+        "packets": count,
+        "capacity": capacity,
+        "list_insert_us": round(list_insert / count * 1e6, 3),
+        "ring_insert_us": round(ring_insert / count * 1e6, 3),
+        "list_query_us": round(list_query / queries * 1e6, 3),
+        "ring_query_us": round(ring_query / queries * 1e6, 3),
+    }
+
+
+async def main(args):
+    results = {"params": vars(args)}
+
+    if args.ring:
+        r = results["ring"] = bench_ring(args.ring_packets, args.ring_capacity, args.ring_devices, args.ring_queries)
+        print(
+            f"[ring] insert list={r['list_insert_us']}us ring={r['ring_insert_us']}us | "
+            f"query list={r['list_query_us']}us ring={r['ring_query_us']}us"
+        )
+
+    if args.log or args.from_url:
+        if args.log:
+            packets = load_log(args.log)
+        else:
+            packets = await load_remote(args.from_url, args.limit)
+        packets = select_packets(packets, args.type, args.device)
+        print(f"读取 {len(packets)} 个数据包")
+        if packets:
+            async with app_client(args.base_url) as client:
+                r = results["replay"] = await replay(client, packets, args)
+            print(
+                f"[replay] {r['requests']} 请求 {r['throughput_rps']} req/s | status={r['status_counts']} | "
+                f"p50={r['latency']['p50_ms']}ms p99={r['latency']['p99_ms']}ms"
+            )
+    elif not args.ring:
+        print("未指定数据来源 (--log / --from-url) 或 --ring")
+        return
+
+    path = write_results("replay", results)
+    print(f"结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="抓包回放")
+    parser.add_argument("--log", nargs="+", help="抓包日志目录或文件")
+    parser.add_argument("--from-url", help="从运行中的服务读取抓包")
+    parser.add_argument("--limit", type=int, default=500, help="--from-url 最多读取条数")
+    parser.add_argument("--type", help="只回放该类型的数据包 (batch / heartbeat / unknown)")
+    parser.add_argument("--device", help="只回放该设备的数据包")
+    parser.add_argument("--base-url", help="回放目标服务地址，空则进程内调用")
+    parser.add_argument("--path", help="发送到该接口，空则使用抓包时的路径")
+    parser.add_argument("--rate", type=float, default=0, help="总发送速率 (请求/秒)，0 表示不限制")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发数")
+    parser.add_argument("--repeat", type=int, default=1, help="重复回放次数")
+    parser.add_argument("--ring", action="store_true", help="对比环形缓冲区与列表实现")
+    parser.add_argument("--ring-packets", type=int, default=100000)
+    parser.add_argument("--ring-capacity", type=int, default=500)
+    parser.add_argument("--ring-devices", type=int, default=50)
+    parser.add_argument("--ring-queries", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))